@@ -1,10 +1,38 @@
 from django.contrib import admin
+from django.db import transaction
 
 from .models import Articles, Gallery, Reactions, Shares
+from .stats import release_rows
 
 # Register your models here.
 
+
+class ReleasedOnDeleteAdmin(admin.ModelAdmin):
+    """
+    subtracts deleted reactions and shares from the article stats, which
+    no delete receiver does.
+    """
+
+    released_as = None
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            release_rows(**{self.released_as: queryset})
+            queryset.delete()
+
+
+class ReactionsAdmin(ReleasedOnDeleteAdmin):
+    released_as = "reactions"
+
+
+class SharesAdmin(ReleasedOnDeleteAdmin):
+    released_as = "shares"
+
+
 admin.site.register(Articles)
-admin.site.register(Reactions)
+admin.site.register(Reactions, ReactionsAdmin)
 admin.site.register(Gallery)
-admin.site.register(Shares)
+admin.site.register(Shares, SharesAdmin)
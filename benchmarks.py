@@ -0,0 +1,638 @@
+"""
+Endpoint benchmarks over a seeded, synthetic data set.
+
+``seed_data`` builds a deterministic set of farmers, agri articles, tags,
+gallery images, reactions, shares and unique visitors; the volumes are
+configurable and the same seed always gives the same data. ``run_benchmarks``
+then drives every route of the user and admin URL confs through their
+resolvers with authenticated requests and records, per scenario, the median
+wall time of untraced calls, then the SQL query count and the peak memory
+allocated in a separate traced call, so tracemalloc's overhead never shows
+in the timings. ``compare`` checks results against a stored baseline: any
+extra query is a regression, time and memory are allowed a tolerance.
+
+``benchmark`` does all of it in a throwaway test database with local
+caches, like the test runner. Run it through the ``benchmark_endpoints``
+command; ``tests.EndpointBenchmarkTests`` is the CI entry point and checks
+the baseline at ``BASELINE_PATH``, ``benchmark_baseline.json`` next to this
+module unless ``settings.ARTICLES_BENCHMARK_BASELINE`` names another file.
+``benchmark_endpoints --save-baseline`` writes it. Without one the test is
+skipped, so the default test run stays green; the CI job running
+``test --tag benchmark`` sets ``ARTICLES_BENCHMARK_REQUIRE_BASELINE`` (the
+setting or the environment variable) and fails on a missing baseline.
+"""
+
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.db import DEFAULT_DB_ALIAS, connection, models
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    teardown_databases,
+)
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from taggit.models import Tag, TaggedItem
+
+from super_krishak.articles.counters import LocalCounterBackend, view_counter
+from super_krishak.articles.images import RENDITIONS, fitted_size, refresh_covers
+from super_krishak.articles.models import (
+    Articles,
+    Gallery,
+    Reactions,
+    Shares,
+    make_excerpt,
+)
+from super_krishak.articles.search import index_articles
+from super_krishak.articles.share_analytics import backfill_rollups
+from super_krishak.articles.stats import rebuild_stats
+from super_krishak.articles.tag_stats import record_tag_changes, refresh_trends
+from super_krishak.articles.visitors import visitor_tracker
+
+USERS_URLCONF = "super_krishak.articles.api.v1.urls.users"
+ADMIN_URLCONF = "super_krishak.articles.api.v1.urls.admin"
+
+BASELINE_PATH = getattr(
+    settings,
+    "ARTICLES_BENCHMARK_BASELINE",
+    os.path.join(os.path.dirname(__file__), "benchmark_baseline.json"),
+)
+REQUIRE_BASELINE = getattr(
+    settings,
+    "ARTICLES_BENCHMARK_REQUIRE_BASELINE",
+    bool(os.environ.get("ARTICLES_BENCHMARK_REQUIRE_BASELINE")),
+)
+
+VOLUMES = {
+    "articles": 200,
+    "users": 100,
+    "tags": 30,
+    "images": 2,
+    "reactions": 2000,
+    "shares": 1000,
+    "visitors": 5000,
+}
+
+CROPS = [
+    "paddy",
+    "wheat",
+    "maize",
+    "millet",
+    "potato",
+    "tomato",
+    "cauliflower",
+    "mustard",
+    "lentil",
+    "sugarcane",
+    "tea",
+    "cardamom",
+    "ginger",
+    "orange",
+    "banana",
+]
+TOPICS = [
+    "irrigation",
+    "seedlings",
+    "fertilizer",
+    "compost",
+    "pests",
+    "harvest",
+    "storage",
+    "market-prices",
+    "soil-testing",
+    "mulching",
+    "greenhouse",
+    "organic",
+]
+PHRASES = [
+    "Prepare the nursery bed before the monsoon arrives",
+    "Drip lines save water on terraced fields",
+    "Rotate with legumes to restore nitrogen in the soil",
+    "Apply compost two weeks before transplanting",
+    "Watch the lower leaves for signs of blight",
+    "Harvest early in the morning to keep produce fresh",
+    "Dry the grain well before storing it in sacks",
+    "Cooperative selling fetches better prices at the haat bazaar",
+    "Use certified seed from the district agriculture office",
+    "Mulch keeps the soil moist through the dry season",
+]
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def _field_value(field, index):
+    if field.choices:
+        return field.choices[index % len(field.choices)][0]
+    if isinstance(field, models.EmailField):
+        return "farmer{}@example.com".format(index)
+    if isinstance(field, models.BigIntegerField):
+        # phone numbers
+        return 9800000000 + index
+    if isinstance(field, models.IntegerField):
+        return index + 1
+    if isinstance(field, models.DateTimeField):
+        return timezone.now()
+    if isinstance(field, models.DateField):
+        return timezone.localdate()
+    if isinstance(field, models.BooleanField):
+        return False
+    if isinstance(field, models.CharField):
+        value = "98{:08d}".format(index)
+        return value[-field.max_length :] if field.max_length else value
+    raise BenchmarkError(
+        "Can't seed the user field {} ({}).".format(
+            field.name, field.__class__.__name__
+        )
+    )
+
+
+def _user_fields(User, index):
+    """
+    a value for the ``USERNAME_FIELD`` and each of the ``REQUIRED_FIELDS`` of
+    the user model, picked from the field's type.
+    """
+    return {
+        User._meta.get_field(name).attname: _field_value(
+            User._meta.get_field(name), index
+        )
+        for name in {User.USERNAME_FIELD, *User.REQUIRED_FIELDS}
+    }
+
+
+def _created_after(model, last_id):
+    # bulk_create only returns ids on some backends
+    return list(model.objects.filter(id__gt=last_id).order_by("id"))
+
+
+def _last_id(model):
+    return model.objects.aggregate(last=models.Max("id"))["last"] or 0
+
+
+def _pairs(rng, users, articles, count):
+    total = len(users) * len(articles)
+    for index in rng.sample(range(total), min(count, total)):
+        yield users[index % len(users)], articles[index // len(users)]
+
+
+def seed_data(seed=0, **volumes):
+    """
+    fills the database with the synthetic data set and returns the rows the
+    scenarios use: ``users``, ``admin``, ``articles`` and ``tags``.
+    """
+    volumes = {**VOLUMES, **volumes}
+    rng = random.Random(seed)
+    today = timezone.localdate()
+
+    User = get_user_model()
+    last_user = _last_id(User)
+    password = make_password(None)
+    User.objects.bulk_create(
+        [
+            User(password=password, **_user_fields(User, last_user + index))
+            for index in range(volumes["users"] + 1)
+        ]
+    )
+    *users, admin = _created_after(User, last_user)
+    admin.is_staff = admin.is_superuser = True
+    admin.save(update_fields=["is_staff", "is_superuser"])
+
+    names = ["{}-{}".format(crop, topic) for crop in CROPS for topic in TOPICS]
+    names = CROPS + rng.sample(names, max(0, volumes["tags"] - len(CROPS)))
+    names = names[: volumes["tags"]]
+    Tag.objects.bulk_create(
+        [Tag(name=name, slug=name) for name in names], ignore_conflicts=True
+    )
+    tags = list(Tag.objects.filter(name__in=names))
+
+    last_article = _last_id(Articles)
+    articles = []
+    for index in range(volumes["articles"]):
+        crop = rng.choice(CROPS)
+        content = "\n\n".join(
+            "{}. {}".format(rng.choice(PHRASES), " ".join(rng.sample(PHRASES, 3)))
+            for _ in range(rng.randint(3, 12))
+        )
+        articles.append(
+            Articles(
+                creator=admin,
+                title="{} {} guide {}".format(
+                    crop.title(), rng.choice(TOPICS).replace("-", " "), index
+                ),
+                content=content,
+                excerpt=make_excerpt(content),
+                post_views=rng.randint(0, 5000),
+                launch_date=today - timedelta(days=rng.randrange(120)),
+            )
+        )
+    Articles.objects.bulk_create(articles, batch_size=500)
+    articles = _created_after(Articles, last_article)
+
+    content_type = ContentType.objects.get_for_model(Articles)
+    tagged, added = [], []
+    for article in articles:
+        for tag in rng.sample(tags, min(len(tags), rng.randint(1, 4))):
+            tagged.append(
+                TaggedItem(content_type=content_type, object_id=article.id, tag=tag)
+            )
+            added.append(tag.id)
+    TaggedItem.objects.bulk_create(tagged, batch_size=1000)
+    record_tag_changes(added=added)
+
+    last_gallery = _last_id(Gallery)
+    galleries = []
+    for _ in range(len(articles) * volumes["images"]):
+        digest = "%064x" % rng.getrandbits(256)
+        width, height = rng.choice([(1600, 1200), (1200, 1600), (1920, 1080)])
+        path = "Gallery/{}/{}/{}".format(digest[:2], digest[2:4], digest)
+        renditions = {}
+        for name, spec in RENDITIONS:
+            attr, size = spec.split("__")
+            box = tuple(int(value) for value in size.split("x"))
+            if attr == "thumbnail":
+                box = fitted_size(width, height, box)
+            renditions[name] = {
+                "path": "{}-{}-{}.jpg".format(path, attr, size),
+                "width": box[0],
+                "height": box[1],
+            }
+        galleries.append(
+            Gallery(
+                picture=path + ".jpg",
+                width=width,
+                height=height,
+                renditions=renditions,
+                content_hash=digest,
+            )
+        )
+    Gallery.objects.bulk_create(galleries, batch_size=500)
+    galleries = _created_after(Gallery, last_gallery)
+    through = Articles.image_files.through
+    through.objects.bulk_create(
+        [
+            through(articles_id=article.id, gallery_id=gallery.id)
+            for index, article in enumerate(articles)
+            for gallery in galleries[
+                index * volumes["images"] : (index + 1) * volumes["images"]
+            ]
+        ],
+        batch_size=1000,
+    )
+    refresh_covers([article.id for article in articles])
+
+    Reactions.objects.bulk_create(
+        [
+            Reactions(user=user, article=article, reacts=str(rng.randint(1, 3)))
+            for user, article in _pairs(rng, users, articles, volumes["reactions"])
+        ],
+        batch_size=1000,
+    )
+    shares = []
+    for user, article in _pairs(rng, users, articles, volumes["shares"]):
+        counts = [rng.randint(0, 3) for _ in range(3)]
+        shares.append(
+            Shares(
+                user=user,
+                article=article,
+                fb_counts=counts[0],
+                twitter_counts=counts[1],
+                reddit_counts=counts[2],
+                last_shared_on=str(rng.randint(1, 3)),
+            )
+        )
+    Shares.objects.bulk_create(shares, batch_size=1000)
+
+    for _ in range(volumes["visitors"]):
+        visitor_tracker.record(rng.choice(articles).id, rng.choice(users).id)
+    visitor_tracker.flush()
+
+    article_ids = [article.id for article in articles]
+    rebuild_stats(article_ids)
+    backfill_rollups()
+    refresh_trends()
+    index_articles(articles)
+    return {"users": users, "admin": admin, "articles": articles, "tags": names}
+
+
+def scenarios(data):
+    """
+    ``(name, urlconf, method, path, body, as admin)`` for every route; a
+    callable path gets the iteration number. Deletes come last and remove
+    articles from the end of the set, which no other scenario reads.
+    """
+    articles = data["articles"]
+    article, tag = articles[0].id, data["tags"][0]
+    ids = ",".join(str(item.id) for item in articles[:20])
+    today = timezone.localdate().isoformat()
+    week_ago = (timezone.localdate() - timedelta(days=7)).isoformat()
+    batch = {
+        "shares": [{"article": item.id, "twitter_counts": 1} for item in articles[:20]]
+    }
+    new_article = {
+        "title": "Terrace farming for {}".format(tag),
+        "content": " ".join(PHRASES),
+        "launch_date": today,
+        "tags": [tag],
+    }
+    return [
+        ("feed", USERS_URLCONF, "get", "/", None, False),
+        ("feed_card", USERS_URLCONF, "get", "/?fields=card", None, False),
+        (
+            "feed_cursor",
+            USERS_URLCONF,
+            "get",
+            "/?pagination=cursor&page_size=50",
+            None,
+            False,
+        ),
+        ("feed_tag", USERS_URLCONF, "get", "/tag/{}/".format(tag), None, False),
+        ("feed_search", USERS_URLCONF, "get", "/?search=" + tag, None, False),
+        ("detail", USERS_URLCONF, "get", "/{}/".format(article), None, False),
+        (
+            "detail_not_modified",
+            USERS_URLCONF,
+            "get",
+            "/{}/".format(article),
+            None,
+            False,
+        ),
+        ("tags", USERS_URLCONF, "get", "/tags/", None, False),
+        ("tags_trending", USERS_URLCONF, "get", "/tags/?sort=trending", None, False),
+        (
+            "reactions_post",
+            USERS_URLCONF,
+            "post",
+            "/reactions/",
+            {"article": article, "reacts": 2},
+            False,
+        ),
+        ("reactions_overall", USERS_URLCONF, "get", "/reactions/", None, False),
+        (
+            "reactions_article",
+            USERS_URLCONF,
+            "get",
+            "/reactions/{}/".format(article),
+            None,
+            False,
+        ),
+        ("reactions_many", USERS_URLCONF, "get", "/reactions/?ids=" + ids, None, False),
+        (
+            "shares_post",
+            USERS_URLCONF,
+            "post",
+            "/shares/",
+            {"article": article, "fb_counts": 1},
+            False,
+        ),
+        ("shares_batch", USERS_URLCONF, "post", "/shares/batch/", batch, False),
+        (
+            "shares_article",
+            USERS_URLCONF,
+            "get",
+            "/shares/{}/?from={}&to={}&interval=day".format(article, week_ago, today),
+            None,
+            False,
+        ),
+        ("coins", USERS_URLCONF, "get", "/coins/", None, False),
+        ("admin_list", ADMIN_URLCONF, "get", "/", None, True),
+        (
+            "admin_list_ordered",
+            ADMIN_URLCONF,
+            "get",
+            "/?ordering=-total_reacts",
+            None,
+            True,
+        ),
+        ("admin_detail", ADMIN_URLCONF, "get", "/{}/".format(article), None, True),
+        (
+            "admin_reactions",
+            ADMIN_URLCONF,
+            "get",
+            "/reactions/{}/".format(article),
+            None,
+            True,
+        ),
+        (
+            "admin_reactions_csv",
+            ADMIN_URLCONF,
+            "get",
+            "/reactions/{}/csv/".format(article),
+            None,
+            True,
+        ),
+        (
+            "admin_shares",
+            ADMIN_URLCONF,
+            "get",
+            "/shares/{}/".format(article),
+            None,
+            True,
+        ),
+        (
+            "admin_shares_csv",
+            ADMIN_URLCONF,
+            "get",
+            "/shares/{}/csv/".format(article),
+            None,
+            True,
+        ),
+        ("admin_metrics", ADMIN_URLCONF, "get", "/metrics/", None, True),
+        ("admin_profiles", ADMIN_URLCONF, "get", "/profiles/", None, True),
+        ("admin_create", ADMIN_URLCONF, "post", "/", new_article, True),
+        (
+            "admin_delete",
+            ADMIN_URLCONF,
+            "delete",
+            lambda iteration: "/{}/".format(articles[-1 - iteration].id),
+            None,
+            True,
+        ),
+    ]
+
+
+def _call(factory, urlconf, method, path, body, user, headers):
+    if body is None:
+        request = getattr(factory, method)(path, **headers)
+    else:
+        request = getattr(factory, method)(path, body, format="json", **headers)
+    force_authenticate(request, user=user)
+    match = resolve(path.split("?")[0], urlconf=urlconf)
+    response = match.func(request, *match.args, **match.kwargs)
+    if getattr(response, "streaming", False):
+        b"".join(response.streaming_content)
+    elif hasattr(response, "render"):
+        response.render()
+    return response
+
+
+def _request(scenario, data, iteration):
+    name, urlconf, method, path, body, as_admin = scenario
+    factory = APIRequestFactory()
+    url = path(iteration) if callable(path) else path
+    users = data["users"]
+    user = data["admin"] if as_admin else users[iteration % len(users)]
+    headers = {}
+    if name.endswith("_not_modified"):
+        # ETags are per user
+        primed = _call(factory, urlconf, method, url, body, user, {})
+        headers["HTTP_IF_NONE_MATCH"] = primed["ETag"]
+    return lambda: _call(factory, urlconf, method, url, body, user, headers)
+
+
+def _check(name, response):
+    if response.status_code >= 400:
+        raise BenchmarkError(
+            "{} answered {} {}".format(
+                name, response.status_code, getattr(response, "data", "")
+            )
+        )
+
+
+def run_scenario(scenario, data, repeat):
+    """
+    times ``repeat`` untraced calls, then makes one more call, iteration
+    ``repeat``, to count its queries and trace its memory.
+    """
+    name = scenario[0]
+    timings = []
+    for iteration in range(repeat):
+        call = _request(scenario, data, iteration)
+        start = time.perf_counter()
+        response = call()
+        timings.append(time.perf_counter() - start)
+        _check(name, response)
+
+    call = _request(scenario, data, repeat)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        with CaptureQueriesContext(connection) as captured:
+            response = call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    _check(name, response)
+
+    return {
+        "ms": round(statistics.median(timings) * 1000, 3),
+        "queries": len(captured),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(data, repeat=10, only=None):
+    """
+    ``{scenario: {"ms": median, "queries": count, "peak_kib": peak}}``.
+    """
+    results = {}
+    for scenario in scenarios(data):
+        if only and scenario[0] not in only:
+            continue
+        results[scenario[0]] = run_scenario(scenario, data, repeat)
+    return results
+
+
+@contextmanager
+def benchmark_settings():
+    """
+    local caches, in-memory notifications and per-process view and visit
+    buffers while the benchmarks run.
+    """
+    notifications = {
+        **getattr(settings, "ARTICLES_NOTIFICATIONS", {}),
+        "QUEUE": "super_krishak.articles.fanout.LocalQueue",
+    }
+    buffers = [view_counter, visitor_tracker]
+    backends = [buffer._backend for buffer in buffers]
+    with override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        },
+        ARTICLES_NOTIFICATIONS=notifications,
+    ):
+        for buffer in buffers:
+            buffer._backend = LocalCounterBackend()
+        try:
+            yield
+        finally:
+            for buffer, backend in zip(buffers, backends):
+                buffer._backend = backend
+
+
+def benchmark(seed=0, repeat=10, only=None, **volumes):
+    """
+    seeds a throwaway test database, runs the benchmarks against it and
+    destroys it again. Returns the results of ``run_benchmarks``.
+    """
+    old_config = setup_databases(
+        verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS}
+    )
+    try:
+        with benchmark_settings():
+            data = seed_data(seed, **volumes)
+            results = run_benchmarks(data, repeat, only)
+            view_counter.flush()
+            visitor_tracker.flush()
+    finally:
+        teardown_databases(old_config, verbosity=0)
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, "w") as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+        baseline.write("\n")
+
+
+def compare(results, baseline, time_tolerance=0.5, memory_tolerance=0.25):
+    """
+    the regressions of ``results`` against ``baseline``, as messages. A
+    ``None`` tolerance skips that check, for runs on other hardware.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                "{}: {} queries, baseline {}".format(
+                    name, result["queries"], expected["queries"]
+                )
+            )
+        checks = [
+            ("ms", time_tolerance, "{}: {:.1f} ms, baseline {:.1f} ms"),
+            ("peak_kib", memory_tolerance, "{}: {:.0f} KiB peak, baseline {:.0f} KiB"),
+        ]
+        for metric, tolerance, message in checks:
+            if tolerance is None:
+                continue
+            if result[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(
+                    message.format(name, result[metric], expected[metric])
+                )
+    return regressions
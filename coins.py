@@ -0,0 +1,118 @@
+"""
+Batched coin rewards for engagement.
+
+Requests append a ``CoinAward`` row, in the same transaction as the
+engagement it rewards, instead of calling ``UserCoin.add_coins`` inline.
+``apply_coin_awards`` runs in the background, sums each user's pending
+awards and credits the total with one ``UPDATE`` per user, creating the
+``UserCoin`` row of users who have none. The ledger is the only writer of
+these credits, ``add_coins`` isn't called for them. ``coin_balance`` adds
+the awards that are still pending, so users see their coins straight away.
+
+The ledger can't learn the users app's award rules or schema, so both must
+be configured and nothing is assumed when they aren't::
+
+    ARTICLES_COIN_AWARDS = {"article": 1}
+    ARTICLES_COIN_BALANCE_FIELD = "coins"
+
+``ARTICLES_COIN_AWARDS`` maps each reason to its coins, recorded on the
+award when it is made; ``ARTICLES_COIN_BALANCE_FIELD`` names the
+``UserCoin`` field holding the applied balance. A missing setting, or a
+reason it doesn't list, raises ``ImproperlyConfigured``.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from super_krishak.articles.models import CoinAward
+from super_krishak.users.models import UserCoin
+
+
+def _required_setting(name):
+    value = getattr(settings, name, None)
+    if not value:
+        raise ImproperlyConfigured("Set {} to use coin awards.".format(name))
+    return value
+
+
+def award_value(coins_for):
+    awards = _required_setting("ARTICLES_COIN_AWARDS")
+    if coins_for not in awards:
+        raise ImproperlyConfigured(
+            "ARTICLES_COIN_AWARDS has no value for {!r}.".format(coins_for)
+        )
+    return awards[coins_for]
+
+
+def balance_field():
+    return _required_setting("ARTICLES_COIN_BALANCE_FIELD")
+
+
+def award_coins(user, coins_for):
+    """
+    records an award; call it inside the transaction that writes what it
+    rewards, so neither can exist without the other.
+    """
+    return CoinAward.objects.create(
+        user=user, coins_for=coins_for, coins=award_value(coins_for)
+    )
+
+
+def coin_balance(user):
+    """
+    applied balance plus the awards waiting for the applier, in one query.
+    """
+    applied = UserCoin.objects.filter(user=OuterRef("pk")).values(balance_field())
+    pending = (
+        CoinAward.objects.filter(user=OuterRef("pk"), applied_at__isnull=True)
+        .order_by()
+        .values("user")
+        .annotate(total=Sum("coins"))
+        .values("total")
+    )
+    row = (
+        get_user_model()
+        .objects.filter(pk=user.pk)
+        .annotate(applied=Subquery(applied[:1]), pending=Subquery(pending))
+        .values_list("applied", "pending")
+        .first()
+    )
+    return sum(value or 0 for value in row or ())
+
+
+def apply_coin_awards(batch_size=1000):
+    """
+    applies up to ``batch_size`` pending awards, oldest first, with one
+    balance update per user. Returns the number of awards applied.
+    """
+    with transaction.atomic():
+        pending = list(
+            CoinAward.objects.select_for_update(skip_locked=True)
+            .filter(applied_at__isnull=True)
+            .order_by("id")
+            .values_list("id", "user_id", "coins")[:batch_size]
+        )
+        if not pending:
+            return 0
+
+        field = balance_field()
+        totals = defaultdict(int)
+        for _, user_id, coins in pending:
+            totals[user_id] += coins
+
+        for user_id in sorted(totals):
+            total = totals[user_id]
+            balances = UserCoin.objects.filter(user_id=user_id)
+            if not balances.update(**{field: F(field) + total}):
+                UserCoin.objects.create(user_id=user_id, **{field: total})
+
+        CoinAward.objects.filter(id__in=[award[0] for award in pending]).update(
+            applied_at=timezone.now()
+        )
+    return len(pending)
@@ -0,0 +1,112 @@
+"""
+Conditional GET for the article feed and detail endpoints.
+
+Validators are computed with one small query before anything is serialized:
+
+* detail: the article's ``updated_at`` and its ``ArticleStats.updated_at``,
+  which moves with every reaction and share;
+* list pages: once the page is fetched, the latest ``updated_at`` of its
+  articles and their stats, read by primary key, plus the page's ids in
+  order, its links and total when the paginator has them, and the query
+  string (page, cursor, fields). Nothing is counted or aggregated over the
+  rest of the feed.
+
+Both include the requesting user, whose own reaction and shares are part of
+the payload; their writes move the stats' ``updated_at`` as well.
+
+ETags are weak: the payloads embed ``post_views``, which moves with every
+view, and a view count that lags behind is an acceptable equivalent. A
+matching ``If-None-Match``, or ``If-Modified-Since`` when no ETag was sent,
+gets a 304 without the article being loaded.
+"""
+
+import hashlib
+from calendar import timegm
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from super_krishak.articles.models import Articles
+
+
+def _etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return 'W/"{}"'.format(digest)
+
+
+def _latest(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def article_validators(queryset, article_id, request):
+    """
+    ``(etag, last_modified)`` of an article's detail, None if the queryset
+    doesn't contain it.
+    """
+    row = (
+        queryset.filter(pk=article_id)
+        .order_by()
+        .values("updated_at", "stats__updated_at")
+        .first()
+    )
+    if row is None:
+        return None
+    etag = _etag(
+        "article",
+        article_id,
+        row["updated_at"],
+        row["stats__updated_at"],
+        request.query_params.get("fields"),
+        request.user.id,
+    )
+    return etag, _latest(row["updated_at"], row["stats__updated_at"])
+
+
+def page_validators(rows, request, paginator):
+    """
+    ``(etag, last_modified)`` of a list page, from the rows ``paginator``
+    returned for it.
+    """
+    ids = [row["id"] if isinstance(row, dict) else row.pk for row in rows]
+    fingerprint = Articles.objects.filter(id__in=ids).aggregate(
+        updated=Max("updated_at"), stats_updated=Max("stats__updated_at")
+    )
+    page = getattr(paginator, "page", None)
+    count = getattr(getattr(page, "paginator", None), "count", None)
+    etag = _etag(
+        "page",
+        ids,
+        count,
+        paginator.get_next_link(),
+        paginator.get_previous_link(),
+        fingerprint["updated"],
+        fingerprint["stats_updated"],
+        sorted(request.query_params.lists()),
+        request.user.id,
+    )
+    return etag, _latest(fingerprint["updated"], fingerprint["stats_updated"])
+
+
+def add_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(timegm(last_modified.utctimetuple()))
+    # cached copies are the user's own and are always revalidated
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """
+    a 304 response when the request's validators still match, else None.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and timegm(last_modified.utctimetuple()),
+    )
+    if response is None:
+        return None
+    return add_validators(response, etag, last_modified)
@@ -0,0 +1,323 @@
+"""
+Write-behind buffering for article view counts.
+
+Detail reads used to run a read-modify-write UPDATE on the article row for
+every hit. Views are now accumulated in a counter backend and applied in
+batches of ``post_views = post_views + n`` UPDATEs, either by the request
+whose increment crosses ``FLUSH_THRESHOLD`` or by the ``flush_view_counts``
+huey task every minute. The task runs in the huey consumer, so it only sees
+the increments of a backend shared between processes, which is why
+``CacheCounterBackend`` is the default; ``LocalCounterBackend`` suits tests
+and single-process setups, where pending views wait for the threshold or
+the process exit.
+
+Configured through ``settings.ARTICLES_VIEW_COUNTER``::
+
+    ARTICLES_VIEW_COUNTER = {
+        "BACKEND": "super_krishak.articles.counters.CacheCounterBackend",
+        "OPTIONS": {"alias": "default"},
+        "FLUSH_THRESHOLD": 100,
+    }
+"""
+
+import atexit
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from super_krishak.articles.models import Articles
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BACKEND": "super_krishak.articles.counters.CacheCounterBackend",
+    "OPTIONS": {},
+    "FLUSH_THRESHOLD": 100,
+}
+
+
+class LocalCounterBackend:
+    """
+    In-process counter store. Pending deltas are private to the worker
+    process, so every process flushes its own share.
+    """
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._total = 0
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+            self._total += amount
+            return self._total
+
+    def get(self, key):
+        with self._lock:
+            return self._counts.get(key, 0)
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts, self._total = self._counts, Counter(), 0
+        return dict(counts)
+
+    def restore(self, counts):
+        with self._lock:
+            for key, amount in counts.items():
+                self._counts[key] += amount
+                self._total += amount
+
+
+class CacheCounterBackend:
+    """
+    Counter store shared by all workers through a Django cache that supports
+    atomic ``incr``/``decr`` (redis, memcached).
+
+    Keys are never deleted on drain, only decremented by the drained amount,
+    so increments racing with a flush are carried over to the next one. The
+    first increment of a key registers it in a slot of its own, numbered by
+    an atomic counter, so registering takes no lock. Drains take a lock
+    owned through a token and read the slots written since the last one;
+    while another worker is draining, ``drain`` returns nothing.
+    """
+
+    lock_timeout = 60
+    # how long a numbered slot may stay unwritten before its writer is
+    # presumed dead
+    slot_timeout = 60
+
+    def __init__(self, alias="default", prefix="articles:views", **options):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def _key(self, key):
+        return "{}:{}".format(self.prefix, key)
+
+    def _slot_key(self, slot):
+        return "{}:slot:{}".format(self.prefix, slot)
+
+    @property
+    def _slots_key(self):
+        return "{}:slots".format(self.prefix)
+
+    @property
+    def _drained_key(self):
+        return "{}:drained".format(self.prefix)
+
+    @property
+    def _total_key(self):
+        return "{}:total".format(self.prefix)
+
+    @property
+    def _lock_key(self):
+        return "{}:lock".format(self.prefix)
+
+    def _register(self, key):
+        slot = self._bump(self._slots_key, 1)
+        self.cache.set(self._slot_key(slot), key, timeout=None)
+
+    def _bump(self, cache_key, amount):
+        if self.cache.add(cache_key, amount, timeout=None):
+            return amount
+        try:
+            return self.cache.incr(cache_key, amount)
+        except ValueError:
+            self.cache.add(cache_key, amount, timeout=None)
+            return amount
+
+    def incr(self, key, amount=1):
+        # the first increment after a drain is the one that registers the key
+        if self._bump(self._key(key), amount) == amount:
+            self._register(key)
+        return self._bump(self._total_key, amount)
+
+    def get(self, key):
+        return self.cache.get(self._key(key)) or 0
+
+    def drain(self):
+        token = uuid.uuid4().hex
+        if not self.cache.add(self._lock_key, token, timeout=self.lock_timeout):
+            return {}
+        try:
+            return self._drain()
+        finally:
+            if self.cache.get(self._lock_key) == token:
+                self.cache.delete(self._lock_key)
+
+    def _registered(self):
+        """
+        the keys registered since the last drain and the drain state to save
+        once they are taken: the last slot read and the slots found unwritten.
+        """
+        cursor, unwritten = self.cache.get(self._drained_key) or (0, {})
+        last = self.cache.get(self._slots_key) or 0
+        if last < cursor:
+            # the slot counter was evicted and numbering started over
+            cursor = 0
+        slots = sorted(unwritten) + list(range(cursor + 1, last + 1))
+        found = self.cache.get_many([self._slot_key(slot) for slot in slots])
+
+        now = time.time()
+        still_unwritten = {}
+        for slot in slots:
+            if self._slot_key(slot) in found:
+                continue
+            since = unwritten.get(slot, now)
+            if now - since < self.slot_timeout:
+                still_unwritten[slot] = since
+            else:
+                logger.warning(
+                    "Counter slot %s of %s never written.", slot, self.prefix
+                )
+        return set(found.values()), list(found), (last, still_unwritten)
+
+    def _drain(self):
+        keys, slot_keys, state = self._registered()
+        counts = {}
+        for key in keys:
+            cache_key = self._key(key)
+            amount = self.cache.get(cache_key) or 0
+            if not amount:
+                continue
+            counts[key] = amount
+            try:
+                remaining = self.cache.decr(cache_key, amount)
+            except ValueError:
+                continue
+            if remaining > 0:
+                self._register(key)
+
+        self.cache.delete_many(slot_keys)
+        self.cache.set(self._drained_key, state, timeout=None)
+        drained = sum(counts.values())
+        if drained:
+            try:
+                self.cache.decr(self._total_key, drained)
+            except ValueError:
+                pass
+        return counts
+
+    def restore(self, counts):
+        for key, amount in counts.items():
+            self.incr(key, amount)
+
+
+class BufferedFlusher(ABC):
+    """
+    Base for write-behind buffers kept in a counter backend: reads its
+    settings dict, flushes when the backend's pending total crosses
+    ``FLUSH_THRESHOLD`` and once more at process exit. Periodic flushes are
+    huey tasks, see ``super_krishak.articles.tasks``.
+    """
+
+    settings_name = None
+    backend_prefix = None
+    defaults = {"BACKEND": DEFAULTS["BACKEND"], "OPTIONS": {}, "FLUSH_THRESHOLD": 100}
+
+    def __init__(self, backend=None, flush_threshold=None):
+        self._backend = backend
+        self._flush_threshold = flush_threshold
+        self._exit_flush = False
+        self._exit_flush_lock = threading.Lock()
+
+    @property
+    def config(self):
+        return {**self.defaults, **getattr(settings, self.settings_name, {})}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = self.config
+            options = {"prefix": self.backend_prefix, **config["OPTIONS"]}
+            self._backend = import_string(config["BACKEND"])(**options)
+        return self._backend
+
+    @property
+    def flush_threshold(self):
+        if self._flush_threshold is None:
+            return self.config["FLUSH_THRESHOLD"]
+        return self._flush_threshold
+
+    @abstractmethod
+    def flush(self):
+        """
+        applies the pending buffer, returns how much of it was written.
+        """
+
+    def _maybe_flush(self, pending):
+        self._register_exit_flush()
+        if self.flush_threshold and pending >= self.flush_threshold:
+            self.flush()
+
+    def _register_exit_flush(self):
+        if self._exit_flush:
+            return
+        with self._exit_flush_lock:
+            if not self._exit_flush:
+                atexit.register(self._flush_quietly)
+                self._exit_flush = True
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush %s.", self.__class__.__name__)
+
+
+class ViewCounter(BufferedFlusher):
+    """
+    Buffers ``Articles.post_views`` increments and applies them in batches.
+    """
+
+    settings_name = "ARTICLES_VIEW_COUNTER"
+    backend_prefix = "articles:views"
+    defaults = DEFAULTS
+
+    def increment(self, article_id, amount=1):
+        self._maybe_flush(self.backend.incr(article_id, amount))
+
+    def pending(self, article_id):
+        return self.backend.get(article_id)
+
+    def live_total(self, article):
+        """
+        persisted views plus the increments that have not been flushed yet.
+        """
+        return article.post_views + self.pending(article.id)
+
+    def flush(self):
+        """
+        applies every pending increment, one UPDATE per distinct delta.
+        Returns the number of views written.
+        """
+        counts = self.backend.drain()
+        if not counts:
+            return 0
+
+        by_amount = defaultdict(list)
+        for article_id, amount in counts.items():
+            by_amount[amount].append(article_id)
+
+        try:
+            with transaction.atomic():
+                for amount in sorted(by_amount):
+                    Articles.objects.filter(id__in=sorted(by_amount[amount])).update(
+                        post_views=F("post_views") + amount
+                    )
+        except Exception:
+            self.backend.restore(counts)
+            raise
+        return sum(counts.values())
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,97 @@
+"""
+Site-wide totals for the admin dashboard header.
+
+The totals are computed with one aggregate over ``ArticleStats``, which
+already holds every article's reaction and share counts, and one over
+``Articles`` for views and launches per period. They are cached and served
+as is while younger than ``MAX_AGE`` seconds. Once they are older, the
+first request to notice recomputes them while the others keep serving the
+previous totals; the ``refresh_dashboard_totals`` task refreshes them every
+minute so requests rarely have to.
+
+Configured through ``settings.ARTICLES_DASHBOARD``::
+
+    ARTICLES_DASHBOARD = {"MAX_AGE": 60, "LAUNCH_PERIODS": [1, 7, 30]}
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from super_krishak.articles.models import ArticleStats, Articles
+from super_krishak.articles.visitors import visitor_tracker
+
+CACHE_KEY = "articles:dashboard-totals"
+
+LOCK_KEY = "articles:dashboard-totals:lock"
+
+DEFAULTS = {"MAX_AGE": 60, "LAUNCH_PERIODS": [1, 7, 30], "LOCK_TIMEOUT": 30}
+
+STATS_SUMS = [
+    "total_reacts",
+    "bad_reacts",
+    "good_reacts",
+    "informative_reacts",
+    "total_shares",
+    "fb_shares",
+    "twitter_shares",
+    "reddit_shares",
+]
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARTICLES_DASHBOARD", {})}
+
+
+def compute_totals(config=None):
+    config = config or get_config()
+    today = timezone.localdate()
+    launches = {
+        "launched_last_{}_days".format(days): Count(
+            "id",
+            filter=Q(
+                launch_date__gt=today - timedelta(days=days), launch_date__lte=today
+            ),
+        )
+        for days in config["LAUNCH_PERIODS"]
+    }
+    totals = Articles.objects.aggregate(
+        articles=Count("id"), post_views=Sum("post_views"), **launches
+    )
+    totals.update(ArticleStats.objects.aggregate(**{f: Sum(f) for f in STATS_SUMS}))
+    totals = {name: value or 0 for name, value in totals.items()}
+    totals["unique_visits"] = visitor_tracker.unique_visits()
+    totals["unique_visitors"] = visitor_tracker.global_unique_visitors()
+    return totals
+
+
+def refresh_totals(config=None):
+    computed_at = time.time()
+    entry = {"totals": compute_totals(config), "computed_at": computed_at}
+    cache.set(CACHE_KEY, entry, None)
+    return entry
+
+
+def dashboard_totals():
+    """
+    the cached totals with a ``computed_at`` timestamp, recomputed when
+    older than ``MAX_AGE``.
+    """
+    config = get_config()
+    entry = cache.get(CACHE_KEY)
+    if entry is None:
+        entry = refresh_totals(config)
+    elif time.time() - entry["computed_at"] > config["MAX_AGE"]:
+        # one request refreshes, the others serve the previous totals
+        if cache.add(LOCK_KEY, 1, config["LOCK_TIMEOUT"]):
+            try:
+                entry = refresh_totals(config)
+            finally:
+                cache.delete(LOCK_KEY)
+
+    computed_at = datetime.fromtimestamp(entry["computed_at"], timezone.utc)
+    return {**entry["totals"], "computed_at": computed_at}
@@ -0,0 +1,226 @@
+"""
+Single-statement engagement writes.
+
+``record_shares_upsert`` adds shares with one
+``INSERT ... ON CONFLICT (user_id, article_id) DO UPDATE`` that increments
+the existing counters in place, so concurrent taps neither lose an
+increment nor create a second row. Databases without ``ON CONFLICT`` fall
+back to an UPDATE followed by an INSERT on a miss.
+
+``insert_reaction`` likewise writes a reaction with
+``INSERT ... ON CONFLICT DO NOTHING`` and reports whether it was created.
+
+``user_engagement`` reads a user's own reactions and shares back for a page
+of articles, one query per table keyed by the page's article ids.
+"""
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from super_krishak.articles.models import SHARED, Reactions, Shares
+from super_krishak.articles.stats import record_reaction, record_shares
+
+SHARE_COUNT_FIELDS = ("fb_counts", "twitter_counts", "reddit_counts")
+
+SHARE_PLATFORM_FIELDS = {"1": "fb_counts", "2": "twitter_counts", "3": "reddit_counts"}
+
+FIELD_PLATFORMS = {field: platform for platform, field in SHARE_PLATFORM_FIELDS.items()}
+
+SHARED_VALUES = {str(value) for value, _ in SHARED}
+
+UPSERT_VENDORS = ("postgresql", "sqlite")
+
+
+def share_field(data):
+    """
+    the counter a share request is for: the first of ``fb_counts``,
+    ``twitter_counts`` or ``reddit_counts`` present, else ``last_shared_on``.
+    """
+    for field in SHARE_COUNT_FIELDS:
+        if data.get(field, None) is not None:
+            return field
+    return SHARE_PLATFORM_FIELDS.get(str(data.get("last_shared_on", "")))
+
+
+def shared_on(data, field):
+    """
+    the ``last_shared_on`` of a share request, the platform of ``field`` when
+    it isn't given. None when it isn't one of ``SHARED``.
+    """
+    value = data.get("last_shared_on", None)
+    if value is None or value == "":
+        return FIELD_PLATFORMS[field]
+    value = str(value)
+    return value if value in SHARED_VALUES else None
+
+
+def _upsert_sql(rows):
+    quote = connection.ops.quote_name
+    table = quote(Shares._meta.db_table)
+    columns = [
+        "user_id",
+        "article_id",
+        *SHARE_COUNT_FIELDS,
+        "last_shared_on",
+        "created_at",
+        "updated_at",
+    ]
+    increments = ", ".join(
+        "{col} = {table}.{col} + excluded.{col}".format(col=quote(field), table=table)
+        for field in SHARE_COUNT_FIELDS
+    )
+    placeholders = "({})".format(", ".join(["%s"] * len(columns)))
+    return (
+        "INSERT INTO {table} ({columns}) VALUES {values} "
+        "ON CONFLICT (user_id, article_id) DO UPDATE SET {increments}, "
+        "last_shared_on = excluded.last_shared_on, updated_at = excluded.updated_at "
+        "RETURNING id".format(
+            table=table,
+            columns=", ".join(quote(column) for column in columns),
+            values=", ".join([placeholders] * rows),
+            increments=increments,
+        )
+    )
+
+
+def _fallback_upsert(user_id, article_id, counts, last_shared_on, now):
+    updates = {field: F(field) + counts[field] for field in SHARE_COUNT_FIELDS}
+    rows = Shares.objects.filter(user_id=user_id, article_id=article_id)
+    if rows.update(last_shared_on=last_shared_on, updated_at=now, **updates):
+        return
+    try:
+        with transaction.atomic():
+            Shares.objects.create(
+                user_id=user_id,
+                article_id=article_id,
+                last_shared_on=last_shared_on,
+                **counts
+            )
+    except IntegrityError:
+        rows.update(last_shared_on=last_shared_on, updated_at=now, **updates)
+
+
+def record_shares_upsert(user_id, entries):
+    """
+    ``entries`` maps article ids to ``(counts, last_shared_on)`` where
+    ``counts`` holds deltas keyed by ``SHARE_COUNT_FIELDS``. Writes them all
+    in one statement, updates the article stats and returns the share rows.
+    """
+    if not entries:
+        return []
+
+    now = timezone.now()
+    normalized = {
+        article_id: (
+            {field: int(counts.get(field, 0) or 0) for field in SHARE_COUNT_FIELDS},
+            last_shared_on,
+        )
+        for article_id, (counts, last_shared_on) in sorted(entries.items())
+    }
+
+    with transaction.atomic():
+        if connection.vendor in UPSERT_VENDORS:
+            params = []
+            for article_id, (counts, last_shared_on) in normalized.items():
+                params.extend([user_id, article_id])
+                params.extend(counts[field] for field in SHARE_COUNT_FIELDS)
+                params.extend([last_shared_on, now, now])
+            with connection.cursor() as cursor:
+                cursor.execute(_upsert_sql(len(normalized)), params)
+                ids = [row[0] for row in cursor.fetchall()]
+        else:
+            for article_id, (counts, last_shared_on) in normalized.items():
+                _fallback_upsert(user_id, article_id, counts, last_shared_on, now)
+            ids = None
+
+        for article_id, (counts, _) in normalized.items():
+            record_shares(article_id, **counts)
+
+    if ids is not None:
+        return list(Shares.objects.filter(id__in=ids).order_by("article_id"))
+    return list(
+        Shares.objects.filter(user_id=user_id, article_id__in=normalized).order_by(
+            "article_id"
+        )
+    )
+
+
+def _insert_reaction_sql():
+    quote = connection.ops.quote_name
+    return (
+        "INSERT INTO {table} ({user}, {article}, {reacts}, {created_at}) "
+        "VALUES (%s, %s, %s, %s) "
+        "ON CONFLICT ({user}, {article}) DO NOTHING RETURNING {id}".format(
+            table=quote(Reactions._meta.db_table),
+            user=quote("user_id"),
+            article=quote("article_id"),
+            reacts=quote("reacts"),
+            created_at=quote("created_at"),
+            id=quote("id"),
+        )
+    )
+
+
+def insert_reaction(user_id, article_id, reacts):
+    """
+    inserts the user's reaction unless they already reacted to the article,
+    in one statement. Returns True if the reaction was created.
+    """
+    with transaction.atomic():
+        if connection.vendor in UPSERT_VENDORS:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    _insert_reaction_sql(),
+                    [user_id, article_id, reacts, timezone.now()],
+                )
+                created = cursor.fetchone() is not None
+        else:
+            try:
+                with transaction.atomic():
+                    Reactions.objects.create(
+                        user_id=user_id, article_id=article_id, reacts=reacts
+                    )
+                created = True
+            except IntegrityError:
+                if not Reactions.objects.filter(
+                    user_id=user_id, article_id=article_id
+                ).exists():
+                    raise
+                created = False
+
+        if created:
+            record_reaction(article_id, reacts)
+    return created
+
+
+def user_engagement(user_id, article_ids):
+    """
+    ``{article_id: {"my_reaction": ..., "my_shares": ...}}`` of a user for
+    ``article_ids``. ``my_reaction`` is the reaction's value and ``my_shares``
+    the user's share record as a dict, None where they have neither.
+    """
+    engagement = {
+        article_id: {"my_reaction": None, "my_shares": None}
+        for article_id in article_ids
+    }
+    if user_id is None or not engagement:
+        return engagement
+
+    reactions = Reactions.objects.filter(
+        user_id=user_id, article_id__in=engagement
+    ).values_list("article_id", "reacts")
+    for article_id, reacts in reactions:
+        engagement[article_id]["my_reaction"] = int(reacts) if reacts else None
+
+    shares = Shares.objects.filter(user_id=user_id, article_id__in=engagement).values(
+        "article_id", *SHARE_COUNT_FIELDS, "last_shared_on", "updated_at"
+    )
+    for share in shares:
+        article_id = share.pop("article_id")
+        share["last_shared_on"] = (
+            int(share["last_shared_on"]) if share["last_shared_on"] else None
+        )
+        share["last_shared_at"] = share.pop("updated_at")
+        engagement[article_id]["my_shares"] = share
+    return engagement
@@ -0,0 +1,370 @@
+"""
+Coalesced, chunked push notifications for new articles.
+
+Every article launching in the same window joins one ``NotificationDigest``:
+articles launching on a later day share the digest sent at midnight of
+that day, articles launching today the one sent at the next
+``COALESCE_WINDOW`` boundary. The digest is delivered to the active users
+in chunks of ``CHUNK_SIZE`` ids and its cursor is saved after every chunk.
+With a ``RATE`` of users per second, each task sends one chunk and schedules
+the next one for when the rate allows, instead of holding the worker. A
+fan-out whose worker died stops heart-beating and is picked up again by
+``resume_digests`` from its cursor; the chunk in flight at the time of the
+crash is sent again. A digest that is claimed ``MAX_ATTEMPTS`` times in a
+row without delivering a chunk is marked failed and left alone.
+
+The default sender, ``push_to_users``, hands each chunk to ``notify_users``
+in this worker with the chunk's ``user_ids``. A configured sender is called
+the same way, as ``send(message, extra, user_ids=[...])``, when it takes a
+``user_ids`` keyword. Otherwise it is expected to reach every user by
+itself and is called once as ``send(message, extra)``, skipping the
+chunking and the pacing.
+
+Configured through ``settings.ARTICLES_NOTIFICATIONS``::
+
+    ARTICLES_NOTIFICATIONS = {
+        "QUEUE": "super_krishak.articles.fanout.HueyQueue",
+        "SENDER": "super_krishak.articles.fanout.push_to_users",
+        "CHUNK_SIZE": 500,
+        "RATE": 1000,
+        "MAX_ATTEMPTS": 5,
+    }
+
+``LocalQueue`` keeps scheduled digests in memory and runs them on
+``run_due()``, standing in for the task broker in tests.
+"""
+
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import time as clock
+from functools import partial
+
+import pytz
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from super_krishak.articles.models import NotificationDigest
+from super_krishak.notifications.tasks import notify_users
+
+logger = logging.getLogger(__name__)
+
+PENDING, SENDING, SENT, FAILED = 0, 1, 2, 3
+
+DEFAULTS = {
+    "QUEUE": "super_krishak.articles.fanout.HueyQueue",
+    "QUEUE_OPTIONS": {},
+    "SENDER": "super_krishak.articles.fanout.push_to_users",
+    "COALESCE_WINDOW": 60,
+    "CHUNK_SIZE": 500,
+    "RATE": 1000,
+    "STALE_AFTER": 300,
+    "MAX_ATTEMPTS": 5,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARTICLES_NOTIFICATIONS", {})}
+
+
+class HueyQueue:
+    """
+    schedules digests on the huey task ``send_notification_digest``.
+    """
+
+    def __init__(self, task="super_krishak.articles.tasks.send_notification_digest"):
+        self.task = task
+
+    def enqueue(self, digest_id, eta, heartbeat=None):
+        import_string(self.task).schedule((digest_id, heartbeat), eta=eta)
+
+
+class LocalQueue:
+    """
+    In-process queue: digests wait in a heap ordered by send time until
+    ``run_due`` sends the ones that are due.
+    """
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self._scheduled = []
+
+    def enqueue(self, digest_id, eta, heartbeat=None):
+        with self._lock:
+            heapq.heappush(
+                self._scheduled, (eta, next(self._order), digest_id, heartbeat)
+            )
+
+    def scheduled(self):
+        with self._lock:
+            return [
+                (eta, digest_id) for eta, _, digest_id, _ in sorted(self._scheduled)
+            ]
+
+    def run_due(self, now=None):
+        now = now or timezone.now()
+        ran = 0
+        while True:
+            with self._lock:
+                if not self._scheduled or self._scheduled[0][0] > now:
+                    return ran
+                _, _, digest_id, heartbeat = heapq.heappop(self._scheduled)
+            send_digest(digest_id, now=now, heartbeat=heartbeat)
+            ran += 1
+
+
+_queues = {}
+
+
+def get_queue():
+    config = get_config()
+    path = config["QUEUE"]
+    if path not in _queues:
+        _queues[path] = import_string(path)(**config["QUEUE_OPTIONS"])
+    return _queues[path]
+
+
+def window_for(launch_date, now=None):
+    """
+    send time of the digest an article launching on ``launch_date`` joins.
+    """
+    now = now or timezone.now()
+    zone = pytz.timezone(settings.TIME_ZONE)
+    if launch_date and launch_date > now.astimezone(zone).date():
+        return zone.localize(datetime.combine(launch_date, clock(0)))
+
+    step = get_config()["COALESCE_WINDOW"]
+    boundary = (int(now.timestamp()) // step + 1) * step
+    return datetime.fromtimestamp(boundary, tz=pytz.utc)
+
+
+def _pending_digest(send_at):
+    """
+    the locked pending digest at ``send_at``, or at the next window if that
+    one is already being sent.
+    """
+    step = timedelta(seconds=get_config()["COALESCE_WINDOW"])
+    while True:
+        digest, created = NotificationDigest.objects.get_or_create(send_at=send_at)
+        # the lock keeps the digest pending until the articles are linked
+        digest = NotificationDigest.objects.select_for_update().get(pk=digest.pk)
+        if digest.state == PENDING:
+            return digest, created
+        send_at += step
+
+
+def schedule_digests(articles):
+    """
+    adds the articles to the pending digests of their windows, creating and
+    scheduling a digest for every window that has none yet.
+    """
+    windows = defaultdict(list)
+    for article in articles:
+        windows[window_for(article.launch_date)].append(article)
+
+    digests = []
+    for send_at in sorted(windows):
+        with transaction.atomic():
+            digest, created = _pending_digest(send_at)
+            digest.articles.add(*windows[send_at])
+        if created:
+            transaction.on_commit(
+                partial(get_queue().enqueue, digest.id, digest.send_at)
+            )
+        digests.append(digest)
+    return digests
+
+
+def schedule_digest(article):
+    return schedule_digests([article])[0]
+
+
+def digest_message(digest):
+    """
+    ``(message, extra)`` of the push; a single article keeps the per-article
+    payload the apps already handle.
+    """
+    article_ids = list(digest.articles.order_by("id").values_list("id", flat=True))
+    if not article_ids:
+        return None, None
+    if len(article_ids) == 1:
+        return "New article alert.", {"type": "article", "article_id": article_ids[0]}
+    return (
+        "{} new articles.".format(len(article_ids)),
+        {"type": "digest", "article_ids": article_ids},
+    )
+
+
+def _claim(digest_id, now, config, heartbeat=None):
+    """
+    takes the digest over, or continues the fan-out whose last chunk left
+    the digest at ``heartbeat``.
+    """
+    stale = now - timedelta(seconds=config["STALE_AFTER"])
+    claimable = Q(state=PENDING, send_at__lte=now) | Q(
+        state=SENDING, updated_at__lt=stale
+    )
+    if heartbeat is not None:
+        claimable |= Q(state=SENDING, updated_at=heartbeat)
+    beat = timezone.now()
+    claimed = (
+        NotificationDigest.objects.filter(
+            pk=digest_id, attempts__lt=config["MAX_ATTEMPTS"]
+        )
+        .filter(claimable)
+        .update(state=SENDING, attempts=F("attempts") + 1, updated_at=beat)
+    )
+    return beat if claimed else None
+
+
+def push_to_users(message, extra, user_ids):
+    """
+    pushes one chunk of the digest to its users. ``notify_users`` runs in
+    this worker rather than as a task of its own, so the chunk is delivered
+    before the cursor moves past it and the pacing holds for the delivery.
+    """
+    return notify_users.call_local(message, extra, user_ids=user_ids)
+
+
+def _sender(config):
+    """
+    the configured sender and whether it takes a ``user_ids`` keyword.
+    """
+    send = import_string(config["SENDER"])
+    # a huey task runs in this worker, its own function has the signature
+    target = getattr(send, "func", send)
+    send = getattr(send, "call_local", send)
+    try:
+        parameters = inspect.signature(target).parameters.values()
+    except (TypeError, ValueError):
+        return send, False
+    chunked = any(
+        parameter.name == "user_ids" or parameter.kind is parameter.VAR_KEYWORD
+        for parameter in parameters
+    )
+    return send, chunked
+
+
+def _send_chunks(digest, heartbeat, send, message, extra, config):
+    """
+    sends the digest to the active users after its cursor, chunk by chunk.
+    With a ``RATE`` only one chunk is sent and the next one is scheduled.
+    Returns ``(sent, heartbeat, done)``, the heartbeat None when another
+    worker took the digest over.
+    """
+    users = get_user_model().objects.filter(is_active=True).order_by("pk")
+    cursor, sent = digest.cursor, 0
+    while True:
+        user_ids = list(
+            users.filter(pk__gt=cursor).values_list("pk", flat=True)[
+                : config["CHUNK_SIZE"]
+            ]
+        )
+        if not user_ids:
+            return sent, heartbeat, True
+
+        send(message, extra, user_ids=user_ids)
+
+        cursor = user_ids[-1]
+        beat = timezone.now()
+        saved = NotificationDigest.objects.filter(
+            pk=digest.pk, updated_at=heartbeat
+        ).update(
+            cursor=cursor,
+            delivered=F("delivered") + len(user_ids),
+            attempts=0,
+            updated_at=beat,
+        )
+        if not saved:
+            logger.warning("Digest %s was taken over by another worker.", digest.pk)
+            return sent, None, False
+        heartbeat = beat
+        sent += len(user_ids)
+
+        if config["RATE"]:
+            if not users.filter(pk__gt=cursor).exists():
+                return sent, heartbeat, True
+            eta = beat + timedelta(seconds=len(user_ids) / config["RATE"])
+            get_queue().enqueue(digest.pk, eta, heartbeat)
+            return sent, heartbeat, False
+
+
+def send_digest(digest_id, now=None, heartbeat=None):
+    """
+    delivers the digest from its cursor onwards, continuing the fan-out left
+    at ``heartbeat`` by the previous chunk. Returns the number of users it
+    was sent to by this call, 0 when another worker owns the digest or it
+    isn't due yet.
+    """
+    now = now or timezone.now()
+    config = get_config()
+    heartbeat = _claim(digest_id, now, config, heartbeat)
+    if heartbeat is None:
+        return 0
+
+    digest = NotificationDigest.objects.get(pk=digest_id)
+    message, extra = digest_message(digest)
+    send, chunked = _sender(config)
+    sent, delivered = 0, F("delivered")
+    try:
+        if message is not None and chunked:
+            sent, heartbeat, done = _send_chunks(
+                digest, heartbeat, send, message, extra, config
+            )
+            if not done:
+                return sent
+        elif message is not None:
+            send(message, extra)
+            sent = delivered = get_user_model().objects.filter(is_active=True).count()
+    except Exception:
+        logger.exception("Sending digest %s failed.", digest_id)
+        # left sending, resume_digests retries it once the heartbeat is stale
+        NotificationDigest.objects.filter(
+            pk=digest_id, state=SENDING, attempts__gte=config["MAX_ATTEMPTS"]
+        ).update(state=FAILED, updated_at=timezone.now())
+        return sent
+
+    finished = timezone.now()
+    NotificationDigest.objects.filter(pk=digest_id, updated_at=heartbeat).update(
+        state=SENT, delivered=delivered, sent_at=finished, updated_at=finished
+    )
+    return sent
+
+
+def resume_digests(now=None):
+    """
+    enqueues the due digests that aren't being sent: scheduled ones whose
+    task was lost and fan-outs whose worker stopped heart-beating or failed.
+    Those out of attempts are marked failed instead.
+    """
+    now = now or timezone.now()
+    config = get_config()
+    stale = now - timedelta(seconds=config["STALE_AFTER"])
+    due = NotificationDigest.objects.filter(
+        Q(state=PENDING, send_at__lt=stale) | Q(state=SENDING, updated_at__lt=stale)
+    )
+    failed = due.filter(attempts__gte=config["MAX_ATTEMPTS"]).update(
+        state=FAILED, updated_at=now
+    )
+    if failed:
+        logger.error(
+            "%s digests failed %s times and were given up.",
+            failed,
+            config["MAX_ATTEMPTS"],
+        )
+    digest_ids = list(
+        due.filter(attempts__lt=config["MAX_ATTEMPTS"]).values_list("id", flat=True)
+    )
+    queue = get_queue()
+    for digest_id in digest_ids:
+        queue.enqueue(digest_id, now)
+    return len(digest_ids)
@@ -0,0 +1,42 @@
+"""
+Replay of responses to requests retried with the same ``Idempotency-Key``
+header, so a retry over a flaky connection costs one cache read.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+
+TIMEOUT = getattr(settings, "ARTICLES_IDEMPOTENCY_TIMEOUT", 60 * 60 * 24)
+
+
+def cache_key(request, key):
+    return "articles:idempotency:{}:{}:{}".format(
+        request.user.pk, request.path, key[:64]
+    )
+
+
+def replayed_response(request):
+    """
+    the response stored for the request's idempotency key, if any.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return None
+    stored = cache.get(cache_key(request, key))
+    if stored is None:
+        return None
+    return Response(stored["data"], status=stored["status"])
+
+
+def remember_response(request, response):
+    key = request.headers.get(HEADER)
+    if key:
+        cache.set(
+            cache_key(request, key),
+            {"data": response.data, "status": response.status_code},
+            TIMEOUT,
+        )
+    return response
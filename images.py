@@ -0,0 +1,436 @@
+"""
+Gallery image ingestion for article uploads.
+
+Uploads are verified and hashed in a thread pool (Pillow and hashlib
+release the GIL), and only content that isn't stored yet is saved, with one
+``bulk_create`` of ``Gallery`` rows under a sharded content-addressed path
+(see ``models.upload_path``); ``Gallery.save`` applies the same
+deduplication to rows saved one at a time. Every upload, new or reused, is
+linked to the article with one bulk insert into the through table. Each
+row records the image's size as read during ingestion, never on load.
+Re-encoding to drop EXIF metadata, GPS positions from field photos mostly,
+runs afterwards in the background task ``process_gallery_images``, which
+then generates the ``gallery`` rendition set ahead of time and records each
+rendition's path and size on the row, so serializers never have to touch
+storage.
+
+Rows stored before content hashing are hashed, merged and moved into the
+sharded tree by the ``hash_gallery_images`` command.
+
+``settings.ARTICLES_IMAGE_WORKERS`` sets the pool size and the rendition
+set can be overridden through
+``settings.VERSATILEIMAGEFIELD_RENDITION_KEY_SETS["gallery"]``.
+"""
+
+import copy
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from super_krishak.articles.models import (
+    Articles,
+    Gallery,
+    file_hash,
+    image_size,
+    upload_path,
+)
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = getattr(settings, "ARTICLES_IMAGE_WORKERS", 4)
+
+RENDITION_KEY_SET = "gallery"
+
+RENDITIONS = getattr(settings, "VERSATILEIMAGEFIELD_RENDITION_KEY_SETS", {}).get(
+    RENDITION_KEY_SET,
+    [
+        ("thumbnail", "thumbnail__200x200"),
+        ("feed_card", "thumbnail__640x360"),
+        ("full_screen", "thumbnail__1280x1280"),
+    ],
+)
+
+
+def _in_worker(func):
+    def run(item):
+        try:
+            return func(item)
+        finally:
+            # pool threads open their own connections and nothing else closes them
+            connections.close_all()
+
+    return run
+
+
+def _map(func, items):
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(IMAGE_WORKERS, len(items))) as pool:
+        return list(pool.map(_in_worker(func), items))
+
+
+def validate_upload(upload):
+    """
+    returns an error message if the upload isn't a readable image.
+    """
+    try:
+        with Image.open(upload) as image:
+            image.verify()
+    except Exception:
+        return "{} is not a valid image.".format(upload.name)
+    finally:
+        upload.seek(0)
+    return None
+
+
+def validate_uploads(uploads):
+    return [error for error in _map(validate_upload, uploads) if error]
+
+
+def inspect_upload(upload):
+    return file_hash(upload), image_size(upload)
+
+
+def _create_galleries(uploads):
+    """
+    stores ``{hash: (upload, (width, height))}`` as new rows and returns
+    them. Hashes stored concurrently by another request are skipped and
+    their files deleted.
+    """
+    rows = [
+        Gallery(picture=upload, content_hash=digest, width=width, height=height)
+        for digest, (upload, (width, height)) in uploads.items()
+    ]
+    try:
+        with transaction.atomic():
+            created = Gallery.objects.bulk_create(rows)
+    except IntegrityError:
+        # one row at a time, still without post_save: the caller schedules
+        # the processing of what it created. The bulk attempt stored every
+        # file already and the retries reuse them; a row that loses to a
+        # concurrent upload drops its file unless storage overwrote the
+        # stored row's file in place, as in Gallery.save.
+        created = []
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    created.extend(Gallery.objects.bulk_create([row]))
+            except IntegrityError:
+                stored = Gallery.objects.get(content_hash=row.content_hash)
+                if row.picture._committed and row.picture.name != stored.picture.name:
+                    row.picture.storage.delete(row.picture.name)
+
+    if any(gallery.pk is None for gallery in created):
+        # backends that can't return ids from a bulk insert
+        created = list(
+            Gallery.objects.filter(
+                content_hash__in=[gallery.content_hash for gallery in created]
+            )
+        )
+    return created
+
+
+def attach_images(article, uploads):
+    """
+    links the uploads to the article, storing only the ones whose content
+    isn't stored yet. Returns ``(galleries, created)``, the rows linked and
+    the ones that were stored by this call.
+    """
+    inspected = _map(inspect_upload, uploads)
+    hashes = [digest for digest, _ in inspected]
+    stored = {
+        gallery.content_hash: gallery
+        for gallery in Gallery.objects.filter(content_hash__in=set(hashes))
+    }
+    new_uploads = {}
+    for (digest, size), upload in zip(inspected, uploads):
+        if digest not in stored:
+            new_uploads.setdefault(digest, (upload, size))
+
+    created = _create_galleries(new_uploads) if new_uploads else []
+    stored.update((gallery.content_hash, gallery) for gallery in created)
+    missing = set(hashes) - set(stored)
+    if missing:
+        stored.update(
+            (gallery.content_hash, gallery)
+            for gallery in Gallery.objects.filter(content_hash__in=missing)
+        )
+    galleries = list({digest: stored[digest] for digest in hashes}.values())
+
+    through = Articles.image_files.through
+    through.objects.bulk_create(
+        [
+            through(articles_id=article.id, gallery_id=gallery.id)
+            for gallery in galleries
+        ],
+        ignore_conflicts=True,
+    )
+    refresh_covers([article.id])
+    return galleries, created
+
+
+def refresh_covers(article_ids):
+    """
+    points ``Articles.cover_image`` at each article's first image.
+    """
+    first_image = (
+        Articles.image_files.through.objects.filter(articles_id=OuterRef("pk"))
+        .order_by("gallery__created_at", "gallery_id")
+        .values("gallery_id")[:1]
+    )
+    Articles.objects.filter(id__in=article_ids).update(
+        cover_image=Subquery(first_image), updated_at=timezone.now()
+    )
+
+
+def release_images(article):
+    """
+    deletes the article's images that no other article uses.
+    """
+    through = Articles.image_files.through
+    ids = article.image_files.values_list("id", flat=True)
+    shared = through.objects.filter(gallery_id__in=ids).exclude(articles_id=article.id)
+    Gallery.objects.filter(id__in=ids).exclude(
+        id__in=shared.values_list("gallery_id", flat=True)
+    ).delete()
+
+
+def _stored_hash(gallery):
+    picture = gallery.picture
+    try:
+        with picture.storage.open(picture.name, "rb") as stored:
+            return file_hash(stored)
+    except OSError:
+        logger.warning("Could not read %s of gallery %s.", picture.name, gallery.pk)
+        return None
+
+
+def _merge_into(duplicate, keeper):
+    """
+    moves the duplicate's article links and covers over to ``keeper`` and
+    deletes the duplicate row.
+    """
+    through = Articles.image_files.through
+    links = through.objects.filter(gallery_id=duplicate.pk)
+    article_ids = list(links.values_list("articles_id", flat=True))
+    through.objects.bulk_create(
+        [through(articles_id=pk, gallery_id=keeper.pk) for pk in article_ids],
+        ignore_conflicts=True,
+    )
+    links.delete()
+    Articles.objects.filter(cover_image=duplicate).update(cover_image=keeper)
+    duplicate.delete()
+    refresh_covers(article_ids)
+
+
+def _hash_chunk(galleries):
+    """
+    hashes, deduplicates and moves one chunk of rows. Returns the rows kept
+    and the number merged into other rows.
+    """
+    digests = _map(_stored_hash, galleries)
+    keepers = {
+        gallery.content_hash: gallery
+        for gallery in Gallery.objects.filter(content_hash__in=set(digests) - {None})
+    }
+    kept, duplicates, stale, copies = [], [], [], []
+    for gallery, digest in zip(galleries, digests):
+        if digest is None:
+            continue
+        if digest in keepers:
+            duplicates.append((gallery, keepers[digest]))
+            stale.append(gallery.picture)
+            continue
+        keepers[digest] = gallery
+        kept.append(gallery)
+        gallery.content_hash = digest
+        picture = gallery.picture
+        target = upload_path(gallery, os.path.basename(picture.name))
+        if picture.name != target:
+            # copied first, the old file only goes once the row moved
+            stale.append(copy.copy(picture))
+            with picture.storage.open(picture.name, "rb") as source:
+                picture.name = picture.storage.save(target, source)
+            copies.append(picture)
+            gallery.renditions = {}
+
+    try:
+        with transaction.atomic():
+            fields = ["content_hash", "picture", "renditions"]
+            Gallery.objects.bulk_update(kept, fields)
+            for duplicate, keeper in duplicates:
+                _merge_into(duplicate, keeper)
+    except Exception:
+        for picture in copies:
+            picture.storage.delete(picture.name)
+        raise
+
+    # rows may share a file, one still pointed at stays
+    in_use = set(
+        Gallery.objects.filter(
+            picture__in={picture.name for picture in stale}
+        ).values_list("picture", flat=True)
+    )
+    for picture in stale:
+        if picture.name not in in_use:
+            picture.delete_all_created_images()
+            picture.storage.delete(picture.name)
+    unprocessed = [gallery.pk for gallery in kept if not gallery.renditions]
+    if unprocessed:
+        process_images(unprocessed)
+    return kept, len(duplicates)
+
+
+def hash_stored_images(chunk_size=100):
+    """
+    hashes the rows stored before ``content_hash`` existed, chunk by chunk:
+    rows whose files turn out identical are merged into the oldest one, the
+    others move to their sharded path and get their renditions again.
+    Returns ``(hashed, merged)``.
+
+    The stored bytes are hashed, which for rows processed already are those
+    of the copy without EXIF data, so those rows only match identical
+    stored files, never new uploads of the original.
+    """
+    queryset = (
+        Gallery.objects.filter(content_hash__isnull=True)
+        .exclude(picture="")
+        .order_by("id")
+    )
+    hashed = merged = last_id = 0
+    while True:
+        galleries = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not galleries:
+            return hashed, merged
+        last_id = galleries[-1].id
+        kept, merged_now = _hash_chunk(galleries)
+        hashed += len(kept) + merged_now
+        merged += merged_now
+
+
+def strip_metadata(gallery):
+    """
+    re-encodes the stored picture without EXIF data, applying the EXIF
+    orientation first. Returns True if the file was rewritten.
+    """
+    picture = gallery.picture
+    if not picture:
+        return False
+
+    with picture.open("rb") as stored:
+        image = Image.open(stored)
+        image.load()
+    if "exif" not in image.info:
+        return False
+
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    image.info.pop("exif", None)
+    buffer = BytesIO()
+    options = {"quality": 90, "optimize": True} if image_format == "JPEG" else {}
+    image.save(buffer, format=image_format, **options)
+
+    # the stripped copy is stored next to the original, which the row keeps
+    # pointing at until it is switched over; storages that overwrite in
+    # place return the original name and there is nothing to delete. Its
+    # bytes differ from the upload's, so content_hash stays the hash of the
+    # file as uploaded and is only meant for matching new uploads, not for
+    # verifying storage.
+    storage, original = picture.storage, picture.name
+    name = storage.save(original, ContentFile(buffer.getvalue()))
+    try:
+        gallery.picture.name = name
+        gallery.width, gallery.height = image.size
+        gallery.save(update_fields=["picture", "width", "height"])
+    except Exception:
+        if name != original:
+            storage.delete(name)
+        raise
+    if name != original:
+        storage.delete(original)
+    return True
+
+
+def fitted_size(width, height, box):
+    """
+    size of a ``thumbnail`` rendition: scaled down to fit the box, keeping
+    the aspect ratio, never scaled up.
+    """
+    box_width, box_height = box
+    ratio = min(box_width / width, box_height / height, 1)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def warm_renditions(gallery):
+    """
+    creates the missing renditions of the rendition set and stores their
+    paths and sizes on the row. Returns the number of renditions recorded.
+    """
+    picture = gallery.picture
+    if not picture:
+        return 0
+    if gallery.width is None or gallery.height is None:
+        # rows stored before sizes were recorded, read once here
+        gallery.width, gallery.height = picture.width, picture.height
+
+    picture.create_on_demand = True
+    renditions = {}
+    for name, spec in RENDITIONS:
+        attr, size = spec.split("__")
+        box = tuple(int(value) for value in size.split("x"))
+        sized = getattr(picture, attr)[size]
+        if attr == "thumbnail":
+            width, height = fitted_size(gallery.width, gallery.height, box)
+        else:
+            width, height = box
+        renditions[name] = {"path": sized.name, "width": width, "height": height}
+
+    gallery.renditions = renditions
+    gallery.save(update_fields=["width", "height", "renditions"])
+    return len(renditions)
+
+
+def rendition_urls(gallery):
+    """
+    rendition urls and sizes from the stored paths; storage.url only builds
+    a string for the usual backends, nothing is read from storage.
+    """
+    return stored_rendition_urls(gallery.picture.storage, gallery.renditions)
+
+
+def stored_rendition_urls(storage, renditions):
+    return {
+        name: {
+            "url": storage.url(rendition["path"]),
+            "width": rendition["width"],
+            "height": rendition["height"],
+        }
+        for name, rendition in (renditions or {}).items()
+    }
+
+
+def process_image(gallery):
+    strip_metadata(gallery)
+    return warm_renditions(gallery)
+
+
+def process_images(gallery_ids):
+    """
+    strips metadata and warms the renditions of the given Gallery rows in
+    the worker pool. Returns the number of renditions recorded.
+    """
+    recorded = sum(_map(process_image, Gallery.objects.filter(id__in=gallery_ids)))
+    # the rendition urls are part of the article payloads
+    Articles.objects.filter(image_files__in=gallery_ids).update(
+        updated_at=timezone.now()
+    )
+    return recorded
@@ -0,0 +1,92 @@
+"""
+Reaction insights, computed with one conditional aggregation and cached per
+article until the next reaction on it is written.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from super_krishak.articles.models import Reactions
+
+CACHE_TIMEOUT = getattr(settings, "ARTICLES_INSIGHTS_CACHE_TIMEOUT", 60 * 60)
+
+ALL_ARTICLES = "all"
+
+REACTION_COUNTS = {
+    "total": Count("id"),
+    "bad": Count("id", filter=Q(reacts=1)),
+    "good": Count("id", filter=Q(reacts=2)),
+    "informative": Count("id", filter=Q(reacts=3)),
+}
+
+
+def cache_key(article_id):
+    return "articles:reaction-insights:{}".format(article_id)
+
+
+def format_insights(total=0, bad=0, good=0, informative=0):
+    if total == 0:
+        return {
+            "total_reactions": 0,
+            "total_bad_reactions": 0,
+            "total_good_reactions": 0,
+            "total_informative_reactions": 0,
+        }
+
+    return {
+        "total_reactions": total,
+        "total_bad_reactions": float("{:.2f}".format(100 * bad / total)),
+        "total_good_reactions": float("{:.2f}".format(100 * good / total)),
+        "total_informative_reactions": float(
+            "{:.2f}".format(100 * informative / total)
+        ),
+    }
+
+
+def reaction_insights(article_ids):
+    """
+    returns ``{article_id: insights}`` using a single query for every
+    article that isn't cached.
+    """
+    keys = {cache_key(article_id): article_id for article_id in article_ids}
+    insights = {keys[key]: data for key, data in cache.get_many(keys).items()}
+
+    missing = [article_id for article_id in article_ids if article_id not in insights]
+    if missing:
+        computed = {article_id: format_insights() for article_id in missing}
+        rows = (
+            Reactions.objects.filter(article_id__in=missing)
+            .values("article_id")
+            .annotate(**REACTION_COUNTS)
+            .order_by()
+        )
+        for row in rows:
+            article_id = row.pop("article_id")
+            computed[article_id] = format_insights(**row)
+
+        cache.set_many(
+            {cache_key(article_id): data for article_id, data in computed.items()},
+            CACHE_TIMEOUT,
+        )
+        insights.update(computed)
+    return insights
+
+
+def overall_insights():
+    key = cache_key(ALL_ARTICLES)
+    data = cache.get(key)
+    if data is None:
+        data = format_insights(**Reactions.objects.aggregate(**REACTION_COUNTS))
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_insights(article_id):
+    """
+    drops the cached insights of an article once the current transaction
+    commits, so a concurrent read can't cache the pre-commit counts.
+    """
+    keys = [cache_key(article_id), cache_key(ALL_ARTICLES)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,275 @@
+"""
+Per-route SQL and latency metrics for the articles API.
+
+``InstrumentationMiddleware`` is opt-in: add it to ``MIDDLEWARE`` and set
+``ENABLED``. For every request served by an articles view it records, per
+route, method and view, the total latency, the number of queries, the time
+spent in SQL, the time spent serializing (``serializer.data``, timed by the
+views through ``serialized``) and the time the renderer spends encoding the
+response body, as histograms. Statements whose SQL text runs
+``N_PLUS_ONE_THRESHOLD`` times or more in one request, whatever their
+parameters, are counted as N+1 patterns against the view and logged with
+their SQL.
+
+Metrics live in the worker process and are served in the Prometheus text
+format by the admin-only ``metrics/`` endpoint.
+
+Configured through ``settings.ARTICLES_INSTRUMENTATION``::
+
+    ARTICLES_INSTRUMENTATION = {"ENABLED": True, "N_PLUS_ONE_THRESHOLD": 5}
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULTS = {
+    "ENABLED": False,
+    "N_PLUS_ONE_THRESHOLD": 5,
+    "LATENCY_BUCKETS": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    "QUERY_BUCKETS": [1, 2, 5, 10, 20, 50, 100, 200, 500],
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARTICLES_INSTRUMENTATION", {})}
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    return "{" + ",".join('{}="{}"'.format(k, _escape(v)) for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = list(buckets)
+        self.samples = {}
+
+    def observe(self, labels, value):
+        sample = self.samples.setdefault(
+            labels, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        )
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample["buckets"][index] += 1
+        sample["sum"] += value
+        sample["count"] += 1
+
+    def render(self):
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} histogram".format(self.name)
+        for labels, sample in sorted(self.samples.items()):
+            for bound, count in zip(self.buckets, sample["buckets"]):
+                yield "{}_bucket{} {}".format(
+                    self.name, _labels(labels, le=bound), count
+                )
+            yield "{}_bucket{} {}".format(
+                self.name, _labels(labels, le="+Inf"), sample["count"]
+            )
+            yield "{}_sum{} {}".format(self.name, _labels(labels), sample["sum"])
+            yield "{}_count{} {}".format(self.name, _labels(labels), sample["count"])
+
+
+class Total:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.samples = Counter()
+
+    def inc(self, labels, amount=1):
+        self.samples[labels] += amount
+
+    def render(self):
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} counter".format(self.name)
+        for labels, value in sorted(self.samples.items()):
+            yield "{}{} {}".format(self.name, _labels(labels), value)
+
+
+class Metrics:
+    """
+    The process' metrics; ``record`` and ``render`` may run concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = None
+
+    def _build(self):
+        config = get_config()
+        latency, queries = config["LATENCY_BUCKETS"], config["QUERY_BUCKETS"]
+        return {
+            "latency": Histogram(
+                "articles_api_request_seconds", "Total request latency.", latency
+            ),
+            "queries": Histogram(
+                "articles_api_queries", "SQL queries per request.", queries
+            ),
+            "sql": Histogram(
+                "articles_api_sql_seconds", "Time spent in SQL per request.", latency
+            ),
+            "serialize": Histogram(
+                "articles_api_serialize_seconds",
+                "Time spent in serializer.data per request.",
+                latency,
+            ),
+            "render": Histogram(
+                "articles_api_render_seconds",
+                "Time the renderer spent encoding the response body per request.",
+                latency,
+            ),
+            "n_plus_one": Total(
+                "articles_api_n_plus_one_total",
+                "Requests that repeated one statement N_PLUS_ONE_THRESHOLD "
+                "times or more.",
+            ),
+        }
+
+    def record(self, labels, collector, latency):
+        with self._lock:
+            if self._metrics is None:
+                self._metrics = self._build()
+            metrics = self._metrics
+            metrics["latency"].observe(labels, latency)
+            metrics["queries"].observe(labels, collector.queries)
+            metrics["sql"].observe(labels, collector.sql_time)
+            metrics["serialize"].observe(labels, collector.serialize_time)
+            metrics["render"].observe(labels, collector.render_time)
+            if collector.repeated:
+                metrics["n_plus_one"].inc(labels)
+
+    def render(self):
+        with self._lock:
+            lines = [
+                line
+                for metric in (self._metrics or {}).values()
+                for line in metric.render()
+            ]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._metrics = None
+
+
+metrics = Metrics()
+
+
+class QueryCollector:
+    """
+    ``execute_wrapper`` counting and timing the statements of a request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+        self.repeated = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def find_repeated(self, threshold):
+        self.repeated = {
+            sql: count for sql, count in self.statements.items() if count >= threshold
+        }
+        return self.repeated
+
+
+def serialized(request, serializer):
+    """
+    ``serializer.data``, timed into the request's serialization metric when
+    the request is instrumented.
+    """
+    collector = getattr(request, "_articles_queries", None)
+    if collector is None:
+        return serializer.data
+    start = time.perf_counter()
+    try:
+        return serializer.data
+    finally:
+        collector.serialize_time += time.perf_counter() - start
+
+
+def view_labels(request):
+    """
+    ``(("route", ...), ("method", ...), ("view", ...))`` of a request served
+    by an articles view, None for any other request.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    func = match.func
+    cls = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    if not func.__module__.startswith("super_krishak.articles"):
+        return None
+    view = "{}.{}".format(func.__module__, cls.__name__ if cls else func.__name__)
+    action = (getattr(func, "actions", None) or {}).get(request.method.lower())
+    if action:
+        view = "{}.{}".format(view, action)
+    return (("route", match.route), ("method", request.method), ("view", view))
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+
+        collector = request._articles_queries = QueryCollector()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        latency = time.perf_counter() - start
+
+        labels = view_labels(request)
+        if labels is not None:
+            repeated = collector.find_repeated(config["N_PLUS_ONE_THRESHOLD"])
+            for sql, count in repeated.items():
+                logger.warning(
+                    "N+1 in %s: statement ran %s times: %s",
+                    dict(labels)["view"],
+                    count,
+                    sql[:500],
+                )
+            metrics.record(labels, collector, latency)
+        return response
+
+    def process_template_response(self, request, response):
+        collector = getattr(request, "_articles_queries", None)
+        if collector is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                collector.render_time = time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from super_krishak.articles.share_analytics import backfill_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the daily share rollups of articles that have shares but no "
+        "rollups. Migration 0016 already builds them; this is for repairs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help=(
+                "Replace every rollup, losing the per-day history of shares "
+                "repeated on several days."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        read = backfill_rollups(options["chunk_size"], options["rebuild"])
+        self.stdout.write(
+            self.style.SUCCESS("Rolled up {} share records.".format(read))
+        )
@@ -0,0 +1,105 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from super_krishak.articles.api.v1.serializers.admin import (
+    ArticleListSerializer,
+    ArticleSerializer,
+    article_rows,
+)
+from super_krishak.articles.models import Articles
+from super_krishak.articles.stats import with_stats
+
+
+def rendered(data):
+    # tag order isn't defined for the prefetched tags, so it isn't compared
+    articles = json.loads(JSONRenderer().render(data))
+    for article in articles:
+        article["tags"] = sorted(article["tags"])
+    return articles
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders a page of articles with ArticleSerializer and with "
+        "ArticleListSerializer, checks both give the same JSON and reports "
+        "their timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Annotate the stats fields, as the admin listing does.",
+        )
+
+    def queryset(self, stats):
+        queryset = (
+            Articles.objects.select_related("creator")
+            .prefetch_related("image_files", "tags")
+            .order_by("-created_at", "-id")
+        )
+        return with_stats(queryset) if stats else queryset
+
+    def measure(self, render, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = render()
+            timings.append(time.perf_counter() - start)
+        with CaptureQueriesContext(connection) as queries:
+            render()
+        return data, timings, len(queries)
+
+    def handle(self, *args, **options):
+        size, repeat = options["page_size"], max(1, options["repeat"])
+        queryset = self.queryset(options["stats"])
+
+        def serializer_page():
+            return ArticleSerializer(list(queryset[:size]), many=True).data
+
+        def fast_page():
+            return ArticleListSerializer(article_rows(queryset)[:size]).data
+
+        expected, slow, slow_queries = self.measure(serializer_page, repeat)
+        actual, fast, fast_queries = self.measure(fast_page, repeat)
+        if not expected:
+            raise CommandError("There are no articles to render.")
+
+        expected, actual = rendered(expected), rendered(actual)
+        for before, after in zip(expected, actual):
+            if before != after:
+                raise CommandError(
+                    "Article {} renders differently:\n{}\n{}".format(
+                        before["id"], before, after
+                    )
+                )
+        if len(expected) != len(actual):
+            raise CommandError("The pages have different lengths.")
+
+        for name, timings, queries in (
+            ("ArticleSerializer", slow, slow_queries),
+            ("ArticleListSerializer", fast, fast_queries),
+        ):
+            self.stdout.write(
+                "{:<22} median {:8.2f} ms  min {:8.2f} ms  {} queries".format(
+                    name,
+                    statistics.median(timings) * 1000,
+                    min(timings) * 1000,
+                    queries,
+                )
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} articles identical, {:.1f}x faster.".format(
+                    len(expected), statistics.median(slow) / statistics.median(fast)
+                )
+            )
+        )
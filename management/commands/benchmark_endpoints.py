@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from super_krishak.articles.benchmarks import (
+    BASELINE_PATH,
+    VOLUMES,
+    BenchmarkError,
+    benchmark,
+    compare,
+    load_baseline,
+    save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic data set in a throwaway test database, benchmarks "
+        "every article endpoint and fails when a result regresses against the "
+        "stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        for name, default in VOLUMES.items():
+            parser.add_argument("--{}".format(name), type=int, default=default)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument(
+            "--only", nargs="+", help="Scenario names to run, all by default."
+        )
+        parser.add_argument("--baseline", default=BASELINE_PATH)
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Store the results as the new baseline instead of comparing.",
+        )
+        parser.add_argument("--time-tolerance", type=float, default=0.5)
+        parser.add_argument("--memory-tolerance", type=float, default=0.25)
+
+    def handle(self, *args, **options):
+        volumes = {name: options[name] for name in VOLUMES}
+        # every scenario makes one call more than --repeat, the traced one
+        if options["repeat"] + 1 >= volumes["articles"]:
+            raise CommandError("--repeat must be lower than --articles - 1.")
+
+        try:
+            results = benchmark(
+                options["seed"], options["repeat"], options["only"], **volumes
+            )
+        except BenchmarkError as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            "{:<24} {:>10} {:>8} {:>12}".format(
+                "scenario", "median ms", "queries", "peak KiB"
+            )
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                "{:<24} {:>10.2f} {:>8} {:>12.1f}".format(
+                    name, result["ms"], result["queries"], result["peak_kib"]
+                )
+            )
+
+        if options["save_baseline"]:
+            save_baseline(results, options["baseline"])
+            self.stdout.write(
+                self.style.SUCCESS("Baseline saved to {}.".format(options["baseline"]))
+            )
+            return
+
+        baseline = load_baseline(options["baseline"])
+        if baseline is None:
+            self.stdout.write(
+                self.style.WARNING(
+                    "No baseline at {}, run with --save-baseline to store one.".format(
+                        options["baseline"]
+                    )
+                )
+            )
+            return
+
+        regressions = compare(
+            results,
+            baseline,
+            options["time_tolerance"],
+            options["memory_tolerance"],
+        )
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from super_krishak.articles.images import hash_stored_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Hashes the gallery images stored before content hashing, merges the "
+        "duplicates and moves the files into the sharded content-addressed tree."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        hashed, merged = hash_stored_images(options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Hashed {} images, merged {} duplicates.".format(hashed, merged)
+            )
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from super_krishak.articles.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes ArticleStats from the reactions and shares tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "article_ids", nargs="*", type=int, help="Only rebuild these articles."
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_stats(options["article_ids"], options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS("Rebuilt stats of {} articles.".format(count))
+        )
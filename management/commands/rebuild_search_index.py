@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from super_krishak.articles.models import Articles
+from super_krishak.articles.search import index_articles
+
+
+class Command(BaseCommand):
+    help = (
+        "Reindexes every article for search, e.g. after changing "
+        "ARTICLES_SEARCH['CONFIG']."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        count = 0
+        batch = []
+        for article in Articles.objects.iterator(chunk_size=batch_size):
+            batch.append(article)
+            if len(batch) == batch_size:
+                index_articles(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            index_articles(batch)
+            count += len(batch)
+        self.stdout.write(self.style.SUCCESS("Reindexed {} articles.".format(count)))
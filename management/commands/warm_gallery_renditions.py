@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from super_krishak.articles.images import process_images
+from super_krishak.articles.models import Gallery
+
+
+class Command(BaseCommand):
+    help = "Generates the gallery renditions of existing images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=100)
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Also re-process images whose renditions are already recorded.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Gallery.objects.exclude(picture="").order_by("id")
+        if not options["all"]:
+            queryset = queryset.filter(renditions={})
+        ids = list(queryset.values_list("id", flat=True))
+
+        created = 0
+        chunk_size = options["chunk_size"]
+        for start in range(0, len(ids), chunk_size):
+            created += process_images(ids[start : start + chunk_size])
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Recorded {} renditions for {} images.".format(created, len(ids))
+            )
+        )
@@ -0,0 +1,142 @@
+# Generated by Django 3.2.10 on 2026-10-16 09:12
+
+import hashlib
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 500
+
+
+class FrozenVisitorSet:
+    """
+    the visitor set of super_krishak.articles.sketches as of this migration,
+    frozen here so later changes to it can't change what this writes: exact
+    up to exact_limit ids, HyperLogLog registers after.
+    """
+
+    def __init__(self, precision, exact_limit):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.sketch = None
+        self.members = set()
+
+    def _add(self, value):
+        hashed = int.from_bytes(
+            hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big'
+        )
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        self.sketch[index] = max(self.sketch[index], rank)
+
+    def update(self, values):
+        if self.sketch is None:
+            self.members.update(values)
+            if len(self.members) <= self.exact_limit:
+                return
+            self.sketch = bytearray(1 << self.precision)
+            values, self.members = self.members, set()
+        for value in values:
+            self._add(value)
+
+    def count(self):
+        if self.sketch is None:
+            return len(self.members)
+        size = len(self.sketch)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -r for r in self.sketch)
+        zeros = self.sketch.count(0)
+        if zeros and estimate <= 2.5 * size:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    @property
+    def registers(self):
+        return b'' if self.sketch is None else bytes(self.sketch)
+
+    @property
+    def member_list(self):
+        return sorted(self.members)
+
+
+def backfill_sketches(apps, schema_editor):
+    Articles = apps.get_model('articles', 'Articles')
+    VisitorSketch = apps.get_model('articles', 'VisitorSketch')
+    through = Articles._meta.get_field('unique_visitors').remote_field.through
+
+    # the sketches have to match the precision the tracker will merge into
+    config = getattr(settings, 'ARTICLES_VISITOR_SKETCH', {})
+    precision = config.get('PRECISION', 12)
+    exact_limit = config.get('EXACT_LIMIT', 256)
+
+    def visitor_set():
+        return FrozenVisitorSet(precision, exact_limit)
+
+    everyone = visitor_set()
+    batch = []
+
+    def add_sketch(article_id, visitors):
+        batch.append(VisitorSketch(
+            scope='article:{}'.format(article_id),
+            article_id=article_id,
+            registers=visitors.registers,
+            members=visitors.member_list,
+            unique_count=visitors.count(),
+        ))
+        if len(batch) >= BATCH_SIZE:
+            VisitorSketch.objects.bulk_create(batch)
+            batch.clear()
+
+    rows = (
+        through.objects.order_by('articles_id')
+        .values_list('articles_id', 'user_id')
+        .iterator(chunk_size=2000)
+    )
+    current, visitors = None, None
+    for article_id, user_id in rows:
+        if article_id != current:
+            if current is not None:
+                add_sketch(current, visitors)
+            current, visitors = article_id, visitor_set()
+        visitors.update([user_id])
+        everyone.update([user_id])
+    if current is not None:
+        add_sketch(current, visitors)
+
+    VisitorSketch.objects.bulk_create(batch)
+    VisitorSketch.objects.create(
+        scope='global',
+        registers=everyone.registers,
+        members=everyone.member_list,
+        unique_count=everyone.count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0011_articles_unique_visitors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('scope', models.CharField(max_length=32, unique=True)),
+                ('registers', models.BinaryField(blank=True, default=b'')),
+                ('members', models.JSONField(blank=True, default=list)),
+                ('unique_count', models.PositiveIntegerField(default=0)),
+                ('article', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketch', to='articles.articles')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.2.10 on 2026-10-16 10:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+REACTION_FIELDS = {'1': 'bad_reacts', '2': 'good_reacts', '3': 'informative_reacts'}
+
+
+def compute_stats(apps, article_ids):
+    """
+    the ArticleStats rows of the articles, counted from reactions and shares;
+    also used by later migrations that change those tables.
+    """
+    ArticleStats = apps.get_model('articles', 'ArticleStats')
+    Reactions = apps.get_model('articles', 'Reactions')
+    Shares = apps.get_model('articles', 'Shares')
+
+    stats = {
+        article_id: ArticleStats(article_id=article_id)
+        for article_id in article_ids
+    }
+
+    reactions = (
+        Reactions.objects.filter(article_id__in=stats)
+        .values('article_id', 'reacts')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in reactions:
+        field = REACTION_FIELDS.get(str(row['reacts']))
+        if field is not None:
+            item = stats[row['article_id']]
+            setattr(item, field, getattr(item, field) + row['count'])
+            item.total_reacts += row['count']
+
+    shares = (
+        Shares.objects.filter(article_id__in=stats)
+        .values('article_id')
+        .annotate(fb=Sum('fb_counts'), twitter=Sum('twitter_counts'), reddit=Sum('reddit_counts'))
+        .order_by()
+    )
+    for row in shares:
+        item = stats[row['article_id']]
+        item.fb_shares = row['fb'] or 0
+        item.twitter_shares = row['twitter'] or 0
+        item.reddit_shares = row['reddit'] or 0
+        item.total_shares = item.fb_shares + item.twitter_shares + item.reddit_shares
+
+    return list(stats.values())
+
+
+def populate_stats(apps, schema_editor):
+    Articles = apps.get_model('articles', 'Articles')
+    ArticleStats = apps.get_model('articles', 'ArticleStats')
+
+    article_ids = list(Articles.objects.values_list('id', flat=True))
+    for start in range(0, len(article_ids), 500):
+        ArticleStats.objects.bulk_create(
+            compute_stats(apps, article_ids[start:start + 500])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0012_visitorsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleStats',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='articles.articles')),
+                ('fb_shares', models.IntegerField(default=0)),
+                ('twitter_shares', models.IntegerField(default=0)),
+                ('reddit_shares', models.IntegerField(default=0)),
+                ('total_shares', models.IntegerField(db_index=True, default=0)),
+                ('bad_reacts', models.IntegerField(default=0)),
+                ('good_reacts', models.IntegerField(default=0)),
+                ('informative_reacts', models.IntegerField(default=0)),
+                ('total_reacts', models.IntegerField(db_index=True, default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.2.10 on 2026-10-16 11:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """
+    AddIndex that only touches PostgreSQL databases; other backends can't
+    build GIN indexes and search without them.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def populate_search_vectors(apps, schema_editor):
+    # the text search config the search module builds vectors with today;
+    # changing it later needs ``manage.py rebuild_search_index``
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = getattr(settings, 'ARTICLES_SEARCH', {}).get('CONFIG', 'simple')
+    schema_editor.execute(
+        """
+        UPDATE articles_articles AS a SET search_vector =
+            setweight(to_tsvector(%(config)s::regconfig, coalesce(a.title, '')), 'A') ||
+            setweight(to_tsvector(%(config)s::regconfig, coalesce((
+                SELECT string_agg(t.name, ' ')
+                FROM taggit_tag t
+                JOIN taggit_taggeditem ti ON ti.tag_id = t.id
+                JOIN django_content_type ct ON ct.id = ti.content_type_id
+                WHERE ti.object_id = a.id
+                    AND ct.app_label = 'articles' AND ct.model = 'articles'
+            ), '')), 'B') ||
+            setweight(to_tsvector(%(config)s::regconfig, coalesce(a.content, '')), 'C')
+        """,
+        {'config': config},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0013_articlestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articles',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        AddPostgresIndex(
+            model_name='articles',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='articles_search_vector_gin'),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
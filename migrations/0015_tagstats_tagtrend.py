@@ -0,0 +1,68 @@
+# Generated by Django 3.2.10 on 2026-10-16 12:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def populate_tag_stats(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    TagStats = apps.get_model('articles', 'TagStats')
+
+    content_type = ContentType.objects.filter(app_label='articles', model='articles').first()
+    if content_type is None:
+        return
+    counts = (
+        TaggedItem.objects.filter(content_type=content_type)
+        .values('tag_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    TagStats.objects.bulk_create(
+        [TagStats(tag_id=row['tag_id'], article_count=row['count']) for row in counts],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0003_taggeditem_add_unique_index'),
+        ('articles', '0014_articles_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='article_stats', serialize=False, to='taggit.tag')),
+                ('article_count', models.IntegerField(db_index=True, default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TagTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('days', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trends', to='taggit.tag')),
+            ],
+            options={
+                'unique_together': {('tag', 'days')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tagtrend',
+            index=models.Index(fields=['days', '-score'], name='articles_tagtrend_days_score'),
+        ),
+        migrations.RunPython(populate_tag_stats, migrations.RunPython.noop),
+    ]
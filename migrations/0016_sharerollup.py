@@ -0,0 +1,75 @@
+# Generated by Django 3.2.10 on 2026-10-16 13:58
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+SHARE_FIELDS = {1: 'fb_counts', 2: 'twitter_counts', 3: 'reddit_counts'}
+
+
+def populate_rollups(apps, schema_editor):
+    """
+    rolls the existing Shares rows up by the day each was last shared, so
+    the rollups are complete before the code that maintains them runs.
+    """
+    Shares = apps.get_model('articles', 'Shares')
+    ShareRollup = apps.get_model('articles', 'ShareRollup')
+
+    counts = defaultdict(int)
+    last_id = 0
+    while True:
+        chunk = list(
+            Shares.objects.filter(id__gt=last_id, article__isnull=False)
+            .order_by('id')
+            .values('id', 'article_id', 'updated_at', *SHARE_FIELDS.values())[:1000]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1]['id']
+        for row in chunk:
+            day = timezone.localtime(row['updated_at']).date()
+            for platform, field in SHARE_FIELDS.items():
+                if row[field]:
+                    counts[(row['article_id'], platform, day)] += row[field]
+
+    ShareRollup.objects.bulk_create(
+        [
+            ShareRollup(article_id=article_id, platform=platform, day=day, count=count)
+            for (article_id, platform, day), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0015_tagstats_tagtrend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShareRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.PositiveSmallIntegerField(choices=[(1, 'facebook'), (2, 'twitter'), (3, 'reddit')])),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='share_rollups', to='articles.articles')),
+            ],
+            options={
+                'unique_together': {('article', 'platform', 'day')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='sharerollup',
+            index=models.Index(fields=['article', 'day'], name='articles_rollup_article_day'),
+        ),
+        migrations.AddIndex(
+            model_name='sharerollup',
+            index=models.Index(fields=['day'], name='articles_rollup_day'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
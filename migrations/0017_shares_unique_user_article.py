@@ -0,0 +1,50 @@
+# Generated by Django 3.2.10 on 2026-10-16 15:07
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_shares(apps, schema_editor):
+    Shares = apps.get_model('articles', 'Shares')
+
+    duplicates = (
+        Shares.objects.values('user_id', 'article_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        rows = list(
+            Shares.objects.filter(
+                user_id=duplicate['user_id'], article_id=duplicate['article_id']
+            ).order_by('id')
+        )
+        kept, extra = rows[0], rows[1:]
+        latest = max(rows, key=lambda row: row.updated_at)
+        for row in extra:
+            kept.fb_counts += row.fb_counts
+            kept.twitter_counts += row.twitter_counts
+            kept.reddit_counts += row.reddit_counts
+        Shares.objects.filter(id=kept.id).update(
+            fb_counts=kept.fb_counts,
+            twitter_counts=kept.twitter_counts,
+            reddit_counts=kept.reddit_counts,
+            last_shared_on=latest.last_shared_on,
+            updated_at=latest.updated_at,
+        )
+        Shares.objects.filter(id__in=[row.id for row in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0016_sharerollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shares',
+            constraint=models.UniqueConstraint(fields=('user', 'article'), name='articles_unique_user_share'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.10 on 2026-10-16 15:52
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# the frozen stats computation of the migration that introduced the table
+compute_stats = import_module(
+    'super_krishak.articles.migrations.0013_articlestats'
+).compute_stats
+
+
+def drop_duplicate_reactions(apps, schema_editor):
+    Reactions = apps.get_model('articles', 'Reactions')
+    ArticleStats = apps.get_model('articles', 'ArticleStats')
+
+    duplicates = (
+        Reactions.objects.values('user_id', 'article_id')
+        .annotate(rows=Count('id'), first=Min('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    article_ids = set()
+    for duplicate in duplicates:
+        Reactions.objects.filter(
+            user_id=duplicate['user_id'], article_id=duplicate['article_id']
+        ).exclude(id=duplicate['first']).delete()
+        if duplicate['article_id'] is not None:
+            article_ids.add(duplicate['article_id'])
+
+    # 0013 counted the duplicates into the stats of their articles
+    article_ids = sorted(article_ids)
+    for start in range(0, len(article_ids), 500):
+        batch = article_ids[start:start + 500]
+        ArticleStats.objects.filter(article_id__in=batch).delete()
+        ArticleStats.objects.bulk_create(compute_stats(apps, batch))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0017_shares_unique_user_article'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_reactions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reactions',
+            constraint=models.UniqueConstraint(fields=('user', 'article'), name='articles_unique_user_reaction'),
+        ),
+    ]
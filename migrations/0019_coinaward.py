@@ -0,0 +1,31 @@
+# Generated by Django 3.2.10 on 2026-10-16 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('articles', '0018_reactions_unique_user_article'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoinAward',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('coins_for', models.CharField(max_length=32)),
+                ('coins', models.IntegerField()),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coin_awards', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='coinaward',
+            index=models.Index(fields=['user', 'applied_at'], name='articles_coin_user_applied'),
+        ),
+    ]
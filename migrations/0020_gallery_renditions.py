@@ -0,0 +1,28 @@
+# Generated by Django 3.2.10 on 2026-10-16 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0019_coinaward'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gallery',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='gallery',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='gallery',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
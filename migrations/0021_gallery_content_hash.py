@@ -0,0 +1,18 @@
+# Generated by Django 3.2.10 on 2026-10-16 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0020_gallery_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gallery',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
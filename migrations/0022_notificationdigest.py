@@ -0,0 +1,32 @@
+# Generated by Django 3.2.10 on 2026-10-16 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0021_gallery_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('send_at', models.DateTimeField(unique=True)),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'pending'), (1, 'sending'), (2, 'sent'), (3, 'failed')], default=0)),
+                ('cursor', models.BigIntegerField(default=0)),
+                ('delivered', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('articles', models.ManyToManyField(related_name='digests', to='articles.Articles')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notificationdigest',
+            index=models.Index(fields=['state', 'send_at'], name='articles_digest_state_send'),
+        ),
+    ]
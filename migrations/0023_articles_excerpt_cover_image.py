@@ -0,0 +1,54 @@
+# Generated by Django 3.2.10 on 2026-10-16 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+def make_excerpt(content, length=280):
+    # frozen copy of models.make_excerpt as of this migration
+    text = ' '.join(strip_tags(content or '').split())
+    return Truncator(text).chars(length)
+
+
+def populate_excerpts(apps, schema_editor):
+    Articles = apps.get_model('articles', 'Articles')
+
+    articles = []
+    for article in Articles.objects.only('id', 'content').iterator(chunk_size=500):
+        article.excerpt = make_excerpt(article.content)
+        articles.append(article)
+        if len(articles) == 500:
+            Articles.objects.bulk_update(articles, ['excerpt'])
+            articles = []
+    Articles.objects.bulk_update(articles, ['excerpt'])
+
+    first_image = (
+        Articles.image_files.through.objects.filter(articles_id=OuterRef('pk'))
+        .order_by('gallery__created_at', 'gallery_id')
+        .values('gallery_id')[:1]
+    )
+    Articles.objects.update(cover_image=Subquery(first_image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0022_notificationdigest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articles',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='articles',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='articles.gallery'),
+        ),
+        migrations.RunPython(populate_excerpts, migrations.RunPython.noop),
+    ]
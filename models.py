@@ -1,9 +1,15 @@
+import hashlib
 import os
 
 from django.conf import settings
-from django.db import models
-from django.utils.text import slugify
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.utils.html import strip_tags
+from django.utils.text import Truncator, slugify
+from PIL import Image
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 from versatileimagefield.fields import VersatileImageField
 
 from super_krishak.core.models import TimeStampAbstractModel
@@ -12,25 +18,96 @@ from super_krishak.core.models import TimeStampAbstractModel
 
 REACTIONS = [(1, "useless"), (2, "good"), (3, "informative")]
 SHARED = [(1, "facebook"), (2, "twitter"), (3, "reddit")]
+EXCERPT_LENGTH = 280
+DIGEST_STATES = [(0, "pending"), (1, "sending"), (2, "sent"), (3, "failed")]
+
+
+def file_hash(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def image_size(upload):
+    """
+    ``(width, height)`` of an uploaded image, read from its header.
+    """
+    try:
+        with Image.open(upload) as image:
+            return image.size
+    except Exception:
+        return None, None
+    finally:
+        upload.seek(0)
 
 
 def upload_path(instance, filename):
+    digest = getattr(instance, "content_hash", None)
+    if digest:
+        # <ClassName>/ab/cd/abcd...<ext>, sharded on the content hash
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(
+            instance.__class__.__name__, digest[:2], digest[2:4], digest + extension
+        )
     return os.path.join(
         instance.__class__.__name__, str(instance.created_at.microsecond), filename
     )
 
 
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    text = " ".join(strip_tags(content or "").split())
+    return Truncator(text).chars(length)
+
+
 class Gallery(TimeStampAbstractModel):
-    picture = VersatileImageField(
-        "Image",
-        upload_to=upload_path,
-        blank=True,
-    )
+    picture = VersatileImageField("Image", upload_to=upload_path, blank=True)
+    # recorded at ingestion and by the image processing, not through
+    # width_field/height_field, which would open the file on every load
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    # {rendition name: {"path": ..., "width": ..., "height": ...}}, filled by
+    # super_krishak.articles.images.warm_renditions
+    renditions = models.JSONField(default=dict, blank=True)
+    # sha256 of the uploaded file, identical uploads share one row
+    content_hash = models.CharField(max_length=64, null=True, blank=True, unique=True)
     updated_at = None
 
     class Meta:
         ordering = ["created_at"]
 
+    def save(self, *args, **kwargs):
+        """
+        hashes a new upload and, when its content is already stored, turns
+        this instance into the stored row instead of inserting a duplicate.
+        ``images.attach_images`` does the same for batches.
+        """
+        picture = self.picture
+        if not (self._state.adding and picture and not picture._committed):
+            return super().save(*args, **kwargs)
+
+        self.content_hash = file_hash(picture.file)
+        if self.width is None or self.height is None:
+            self.width, self.height = image_size(picture.file)
+        stored = Gallery.objects.filter(content_hash=self.content_hash).first()
+        if stored is None:
+            try:
+                with transaction.atomic(using=kwargs.get("using")):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # stored concurrently, drop the file this save wrote
+                stored = Gallery.objects.get(content_hash=self.content_hash)
+                if self.picture.name != stored.picture.name:
+                    self.picture.storage.delete(self.picture.name)
+        self._adopt(stored)
+
+    def _adopt(self, stored):
+        for field in self._meta.concrete_fields:
+            setattr(self, field.attname, getattr(stored, field.attname))
+        self._state.adding = False
+        self._state.db = stored._state.db
+
 
 class Articles(TimeStampAbstractModel):
 
@@ -51,15 +128,38 @@ class Articles(TimeStampAbstractModel):
 
     post_views = models.IntegerField(default=0)
 
+    # DEPRECATED: superseded by VisitorSketch and no longer written; only
+    # migration 0012 reads it. Drop it in a migration of the next release.
     unique_visitors = models.ManyToManyField(
         settings.AUTH_USER_MODEL, related_name="article_views"
     )
 
     launch_date = models.DateField(null=True)
 
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # denormalized for listings, so they never read ``content`` or the images
+    excerpt = models.CharField(max_length=300, blank=True, editable=False)
+    cover_image = models.ForeignKey(
+        Gallery,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+    )
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if "content" not in self.get_deferred_fields():
+            self.excerpt = make_excerpt(self.content)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and "content" in update_fields:
+                kwargs["update_fields"] = {*update_fields, "excerpt"}
+        super().save(*args, **kwargs)
+
     @property
     def slug_of_title(self):
 
@@ -72,6 +172,10 @@ class Articles(TimeStampAbstractModel):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # created on PostgreSQL only, see migration 0014
+            GinIndex(fields=["search_vector"], name="articles_search_vector_gin"),
+        ]
 
 
 class Reactions(TimeStampAbstractModel):
@@ -95,6 +199,13 @@ class Reactions(TimeStampAbstractModel):
             self.user.name, self.article.title, self.reacts
         )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="articles_unique_user_reaction"
+            )
+        ]
+
 
 class Shares(TimeStampAbstractModel):
 
@@ -125,3 +236,205 @@ class Shares(TimeStampAbstractModel):
             self.article.title,
             self.user.name,
         )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "article"], name="articles_unique_user_share"
+            )
+        ]
+
+
+class VisitorSketch(TimeStampAbstractModel):
+    """
+    unique visitor state of one article, or of the whole site for the
+    ``global`` scope. See ``super_krishak.articles.sketches.VisitorSet``.
+    """
+
+    GLOBAL = "global"
+
+    scope = models.CharField(max_length=32, unique=True)
+    article = models.OneToOneField(
+        Articles,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="visitor_sketch",
+    )
+    registers = models.BinaryField(blank=True, default=b"")
+    members = models.JSONField(default=list, blank=True)
+    unique_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "{} unique visitors of {}".format(self.unique_count, self.scope)
+
+    @staticmethod
+    def scope_for(article_id):
+        return "article:{}".format(article_id)
+
+
+class ArticleStats(TimeStampAbstractModel):
+    """
+    engagement totals of an article, kept up to date by
+    ``super_krishak.articles.stats`` on every reaction and share write.
+    """
+
+    article = models.OneToOneField(
+        Articles,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+    )
+
+    fb_shares = models.IntegerField(default=0)
+    twitter_shares = models.IntegerField(default=0)
+    reddit_shares = models.IntegerField(default=0)
+    total_shares = models.IntegerField(default=0, db_index=True)
+
+    bad_reacts = models.IntegerField(default=0)
+    good_reacts = models.IntegerField(default=0)
+    informative_reacts = models.IntegerField(default=0)
+    total_reacts = models.IntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return "Stats of {}".format(self.article.title)
+
+
+class TagStats(TimeStampAbstractModel):
+    """
+    number of articles carrying a tag, maintained by
+    ``super_krishak.articles.tag_stats`` as articles gain or lose tags.
+    """
+
+    tag = models.OneToOneField(
+        Tag,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="article_stats",
+    )
+    article_count = models.IntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return "{} articles tagged {}".format(self.article_count, self.tag.name)
+
+
+class TagTrend(TimeStampAbstractModel):
+    """
+    time-decayed engagement score of a tag over the last ``days`` days,
+    recomputed periodically by ``tag_stats.refresh_trends``.
+    """
+
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="trends")
+    days = models.PositiveSmallIntegerField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = [("tag", "days")]
+        indexes = [
+            models.Index(fields=["days", "-score"], name="articles_tagtrend_days_score")
+        ]
+
+
+class ShareRollup(models.Model):
+    """
+    shares of an article on one platform during one day, maintained by
+    ``super_krishak.articles.stats.record_shares``.
+    """
+
+    article = models.ForeignKey(
+        Articles,
+        on_delete=models.CASCADE,
+        related_name="share_rollups",
+    )
+    platform = models.PositiveSmallIntegerField(choices=SHARED)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [("article", "platform", "day")]
+        indexes = [
+            models.Index(fields=["article", "day"], name="articles_rollup_article_day"),
+            models.Index(fields=["day"], name="articles_rollup_day"),
+        ]
+
+
+class CoinAward(TimeStampAbstractModel):
+    """
+    append-only ledger of coins earned through articles, folded into the
+    user's ``UserCoin`` balance by ``super_krishak.articles.coins``.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="coin_awards",
+    )
+    coins_for = models.CharField(max_length=32)
+    coins = models.IntegerField()
+    applied_at = models.DateTimeField(null=True, blank=True)
+    updated_at = None
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "applied_at"], name="articles_coin_user_applied"
+            )
+        ]
+
+    def __str__(self):
+        return "{} coins to {} for {}".format(self.coins, self.user_id, self.coins_for)
+
+
+class NotificationDigest(TimeStampAbstractModel):
+    """
+    one push announcing every article launching in the same window, sent to
+    the audience in chunks by ``super_krishak.articles.fanout``. ``cursor``
+    is the last user id delivered, so an interrupted fan-out resumes there.
+    ``attempts`` counts the claims since a chunk was last delivered.
+    """
+
+    send_at = models.DateTimeField(unique=True)
+    articles = models.ManyToManyField(Articles, related_name="digests")
+    state = models.PositiveSmallIntegerField(choices=DIGEST_STATES, default=0)
+    cursor = models.BigIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "send_at"], name="articles_digest_state_send")
+        ]
+
+    def __str__(self):
+        return "digest at {}".format(self.send_at)
+
+
+class RequestProfile(TimeStampAbstractModel):
+    """
+    profile of an articles API request an admin asked for, recorded by
+    ``super_krishak.articles.profiling``. ``stats`` is the marshalled
+    cProfile data, loadable with ``pstats``.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="request_profiles",
+    )
+    method = models.CharField(max_length=8)
+    path = models.TextField()
+    view = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration = models.FloatField()
+    call_tree = models.TextField(blank=True)
+    # [{"sql": ..., "params": ..., "duration": ..., "plan": ...}, ...]
+    queries = models.JSONField(default=list, blank=True)
+    stats = models.BinaryField(blank=True, default=b"")
+    updated_at = None
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return "{} {} ({:.0f} ms)".format(self.method, self.path, self.duration * 1000)
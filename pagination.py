@@ -0,0 +1,137 @@
+"""
+Keyset pagination on ``(created_at, id)``.
+
+``DynamicPageSizePagination`` pays a ``COUNT(*)`` plus a growing OFFSET per
+page. ``KeysetPagination`` seeks straight to the row after the last one
+served, using an opaque cursor that encodes that row's sort key, and never
+counts. Views opt in with ``?pagination=cursor``; the ``next``/``previous``
+links carry the cursor from then on.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from super_krishak.core.pagination import DynamicPageSizePagination
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, descending=True):
+        self.descending = descending
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        # rows are model instances, or dicts for ``.values()`` listings
+        if isinstance(row, dict):
+            created_at, pk = row["created_at"], row["id"]
+        else:
+            created_at, pk = row.created_at, row.pk
+        position = {"t": created_at.isoformat(), "i": pk, "r": int(reverse)}
+        token = json.dumps(position, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(token).decode()
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(token.encode()))
+            created_at = parse_datetime(position["t"])
+            cursor = created_at, int(position["i"]), bool(position["r"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # parse_datetime returns None for strings that aren't datetimes
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        # walking backwards flips the direction of both the seek and the sort
+        forwards = self.descending != reverse
+        if forwards:
+            ordering = ("-created_at", "-id")
+        else:
+            ordering = ("created_at", "id")
+        queryset = queryset.order_by(*ordering)
+
+        if cursor is not None:
+            created_at, pk, _ = cursor
+            lookup = "lt" if forwards else "gt"
+            queryset = queryset.filter(
+                Q(**{"created_at__" + lookup: created_at})
+                | Q(created_at=created_at, **{"id__" + lookup: pk})
+            )
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1], False)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[0], True)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+def uses_cursor(request):
+    params = request.query_params
+    return params.get("pagination") == "cursor" or "cursor" in params
+
+
+def get_paginator(request, keyset=True):
+    """
+    paginator for a listing: keyset when the client asked for it and the
+    listing is in its default ``created_at`` order, page numbers otherwise.
+    """
+    if keyset and uses_cursor(request):
+        return KeysetPagination()
+    return DynamicPageSizePagination()
@@ -0,0 +1,224 @@
+"""
+On-demand profiling of articles API requests.
+
+With ``ENABLED`` set, an admin adds the ``X-Articles-Profile`` header or the
+``?_profile=1`` query flag to any articles API request. The request then runs
+under cProfile with every SQL statement captured, and after it has been
+served the slowest distinct ``SELECT``s are run again under ``EXPLAIN``.
+The result is stored as a ``RequestProfile`` and its id is returned in the
+``X-Articles-Profile-Id`` response header. It can be downloaded from the
+admin ``profiles/`` endpoints.
+
+A flagged request is authenticated up front with the API's authentication
+classes, since token users are still anonymous at middleware time; anyone
+but staff is served without being profiled. Requests without the flag, and
+every request while ``ENABLED`` is off, cost a dictionary lookup.
+
+Configured through ``settings.ARTICLES_PROFILING``::
+
+    ARTICLES_PROFILING = {"ENABLED": True, "EXPLAIN_LIMIT": 20, "KEEP": 200}
+"""
+
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from super_krishak.articles.instrumentation import view_labels
+from super_krishak.articles.models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+HEADER = "HTTP_X_ARTICLES_PROFILE"
+QUERY_FLAG = "_profile"
+RESPONSE_HEADER = "X-Articles-Profile-Id"
+
+DEFAULTS = {"ENABLED": False, "EXPLAIN_LIMIT": 20, "CALL_TREE_LINES": 80, "KEEP": 200}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARTICLES_PROFILING", {})}
+
+
+def _plain(params):
+    if isinstance(params, (list, tuple)):
+        return [
+            (
+                param
+                if isinstance(param, (int, float, str, bool, type(None)))
+                else str(param)
+            )
+            for param in params
+        ]
+    return None if params is None else str(params)
+
+
+class QueryLog:
+    """
+    ``execute_wrapper`` keeping every statement of a request.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "alias": context["connection"].alias,
+                    "sql": sql,
+                    "params": params,
+                    "many": many,
+                    "duration": time.perf_counter() - start,
+                }
+            )
+
+
+def explain(query):
+    connection = connections[query["alias"]]
+    prefix = connection.ops.explain_query_prefix()
+    try:
+        with transaction.atomic(using=query["alias"]):
+            with connection.cursor() as cursor:
+                cursor.execute("{} {}".format(prefix, query["sql"]), query["params"])
+                return "\n".join(
+                    " ".join(str(column) for column in row) for row in cursor.fetchall()
+                )
+    except DatabaseError as error:
+        return "EXPLAIN failed: {}".format(error)
+
+
+def captured_queries(log, limit):
+    """
+    the statements as stored on the profile, the ``limit`` slowest distinct
+    ``SELECT``s with their plans.
+    """
+    explained = {}
+    candidates = sorted(
+        (query for query in log.queries if not query["many"]),
+        key=lambda query: query["duration"],
+        reverse=True,
+    )
+    for query in candidates:
+        if len(explained) >= limit:
+            break
+        key = (query["sql"], repr(query["params"]))
+        if key not in explained and query["sql"].lstrip().upper().startswith("SELECT"):
+            explained[key] = explain(query)
+
+    return [
+        {
+            "sql": query["sql"],
+            "params": _plain(query["params"]),
+            "duration": query["duration"],
+            "plan": explained.get((query["sql"], repr(query["params"]))),
+        }
+        for query in log.queries
+    ]
+
+
+def call_tree(profiler, lines):
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats("cumulative").print_stats(lines)
+    stats.print_callees(lines // 4)
+    return output.getvalue()
+
+
+def requested(request):
+    return HEADER in request.META or QUERY_FLAG in request.GET
+
+
+def staff_user(request):
+    """
+    the staff user behind a request, authenticated like the API views do;
+    None for anyone else.
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        authenticators = [
+            authentication()
+            for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ]
+        try:
+            user = Request(request, authenticators=authenticators).user
+        except APIException:
+            return None
+    return user if user is not None and user.is_staff else None
+
+
+def store_profile(request, user, response, profiler, log, duration, config):
+    labels = view_labels(request)
+    if labels is None:
+        return None
+
+    profiler.create_stats()
+    profile = RequestProfile.objects.create(
+        user=user,
+        method=request.method,
+        path=request.get_full_path(),
+        view=dict(labels)["view"],
+        status_code=response.status_code,
+        duration=duration,
+        call_tree=call_tree(profiler, config["CALL_TREE_LINES"]),
+        queries=captured_queries(log, config["EXPLAIN_LIMIT"]),
+        stats=marshal.dumps(profiler.stats),
+    )
+    stale = RequestProfile.objects.values_list("id", flat=True)[config["KEEP"] :]
+    RequestProfile.objects.filter(id__in=list(stale)).delete()
+    return profile
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not requested(request):
+            return self.get_response(request)
+        config = get_config()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+        user = staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        log = QueryLog()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler is already running in this thread
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        try:
+            profile = store_profile(
+                request, user, response, profiler, log, duration, config
+            )
+        except Exception:
+            logger.exception("Could not store the profile of %s.", request.path)
+            return response
+        if profile is not None:
+            response[RESPONSE_HEADER] = str(profile.id)
+        return response
@@ -0,0 +1,359 @@
+"""
+Ranked article search over title, tags and content.
+
+On PostgreSQL every article keeps a weighted ``search_vector`` (title A,
+tags B, content C) behind a GIN index. Queries are ``to_tsquery``s built
+from the words of ``tokenize``, each a ``word:*`` prefix, ranked with
+``ts_rank``; PostgreSQL still normalizes every word with the configured
+text search config, like it did the articles. Other databases, SQLite in
+tests mostly, use an in-process inverted index with the same weights and
+prefix matching, and return the ``MAX_RESULTS`` best matches only.
+
+Both are updated incrementally from the article signals. ``?search=`` keeps
+its comma separated form: an article matches a term when it contains every
+word of it, and matches the search when it matches any term. Words are runs
+of letters, digits, underscores and combining marks; ``str.isalnum`` alone
+would split Devanagari words at every vowel sign. Searches are ordered by
+rank, so searching listings paginate by page number, never by cursor.
+
+Configured through ``settings.ARTICLES_SEARCH``::
+
+    ARTICLES_SEARCH = {"CONFIG": "simple", "MAX_RESULTS": 500}
+
+Stored vectors keep the config they were built with, so after changing
+``CONFIG`` run ``manage.py rebuild_search_index`` or queries and vectors
+will normalize words differently.
+"""
+
+import math
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Max,
+    TextField,
+    Value,
+    When,
+)
+
+from super_krishak.articles.models import Articles
+
+# same proportions as ts_rank's default weights for A, B and C
+FIELD_WEIGHTS = {"title": 1.0, "tags": 0.4, "content": 0.2}
+
+DEFAULTS = {"CONFIG": "simple", "MAX_RESULTS": 500}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARTICLES_SEARCH", {})}
+
+
+@lru_cache(maxsize=4096)
+def is_word_char(char):
+    return char == "_" or unicodedata.category(char)[0] in "LMN"
+
+
+def tokenize(text):
+    """
+    ``"किसान धान खेती"``
+    -> ``["किसान", "धान", "खेती"]``
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return [
+        "".join(chars).lower()
+        for is_word, chars in groupby(text, key=is_word_char)
+        if is_word
+    ]
+
+
+def parse_terms(terms):
+    """
+    ``["rice farming", "maize"]`` -> ``[["rice", "farming"], ["maize"]]``
+    """
+    return [words for words in (tokenize(term) for term in terms) if words]
+
+
+def document_fields(article):
+    return {
+        "title": article.title,
+        "tags": " ".join(article.tags.names()),
+        "content": article.content,
+    }
+
+
+def tag_texts(article_ids):
+    """
+    ``{article id: "tag names"}`` for the articles that still exist.
+    """
+    return {
+        article.id: " ".join(tag.name for tag in article.tags.all())
+        for article in Articles.objects.filter(id__in=article_ids)
+        .prefetch_related("tags")
+        .only("id")
+    }
+
+
+class PostgresSearchBackend:
+    def vector(self, tags):
+        from django.contrib.postgres.search import SearchVector
+
+        config = get_config()["CONFIG"]
+        return (
+            SearchVector("title", weight="A", config=config)
+            + SearchVector(tags, weight="B", config=config)
+            + SearchVector("content", weight="C", config=config)
+        )
+
+    def index(self, article):
+        tags_text = document_fields(article)["tags"]
+        Articles.objects.filter(pk=article.pk).update(
+            search_vector=self.vector(Value(tags_text))
+        )
+
+    def index_many(self, articles):
+        texts = tag_texts([article.pk for article in articles])
+        if not texts:
+            return
+        tags = Case(
+            *[When(pk=pk, then=Value(text)) for pk, text in texts.items()],
+            default=Value(""),
+            output_field=TextField(),
+        )
+        Articles.objects.filter(pk__in=texts).update(search_vector=self.vector(tags))
+
+    def remove(self, article_id):
+        pass
+
+    def search(self, queryset, terms):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        config = get_config()["CONFIG"]
+        query = None
+        for words in parse_terms(terms):
+            # word characters only, nothing tsquery would read as an operator
+            raw = " & ".join("'{}':*".format(word) for word in words)
+            term = SearchQuery(raw, search_type="raw", config=config)
+            query = term if query is None else query | term
+        if query is None:
+            return queryset
+
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "-created_at")
+        )
+
+
+class InvertedIndex:
+    """
+    token -> {article id: weighted term frequency}, with a sorted token list
+    for prefix lookups.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self._tokens = []
+        self._dirty = False
+
+    def add(self, article_id, fields):
+        self.remove(article_id)
+        scores = defaultdict(float)
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                scores[token] += weight
+        for token, score in scores.items():
+            if token not in self.postings:
+                self._dirty = True
+            self.postings[token][article_id] = score
+        self.documents[article_id] = set(scores)
+
+    def remove(self, article_id):
+        for token in self.documents.pop(article_id, ()):
+            postings = self.postings[token]
+            postings.pop(article_id, None)
+            if not postings:
+                del self.postings[token]
+                self._dirty = True
+
+    def expand(self, prefix):
+        if self._dirty:
+            self._tokens = sorted(self.postings)
+            self._dirty = False
+        start = bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def score_word(self, word):
+        total = len(self.documents) or 1
+        scores = {}
+        for token in self.expand(word):
+            postings = self.postings[token]
+            idf = math.log(1 + total / len(postings))
+            for article_id, frequency in postings.items():
+                score = (1 + math.log(frequency + 1)) * idf
+                scores[article_id] = max(scores.get(article_id, 0.0), score)
+        return scores
+
+    def search(self, terms):
+        """
+        returns ``[(article id, score)]``, best match first.
+        """
+        ranked = defaultdict(float)
+        for words in terms:
+            matched = None
+            for word in words:
+                scores = self.score_word(word)
+                if matched is None:
+                    matched = scores
+                else:
+                    matched = {
+                        article_id: score + scores[article_id]
+                        for article_id, score in matched.items()
+                        if article_id in scores
+                    }
+            for article_id, score in (matched or {}).items():
+                ranked[article_id] += score
+        return sorted(ranked.items(), key=lambda item: (-item[1], -item[0]))
+
+
+class PythonSearchBackend:
+    """
+    In-process index, loaded lazily. Whenever the article count or latest
+    ``updated_at`` no longer match the version it last read, the articles
+    updated since are indexed again and a changed count reloads everything,
+    so writes from other processes are picked up too. Local writes update
+    the index right away but leave the version alone: only the database
+    tells what else moved in the meantime.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+
+    def _current_version(self):
+        return tuple(
+            Articles.objects.aggregate(
+                count=Count("id"), updated=Max("updated_at")
+            ).values()
+        )
+
+    def _load(self, index, articles):
+        articles = articles.prefetch_related("tags").only("id", "title", "content")
+        for article in articles:
+            index.add(
+                article.id,
+                {
+                    "title": article.title,
+                    "tags": " ".join(tag.name for tag in article.tags.all()),
+                    "content": article.content,
+                },
+            )
+        return index
+
+    def get_index(self):
+        version = self._current_version()
+        with self._lock:
+            if self._index is not None and version != self._version:
+                updated = self._version[1]
+                if updated is not None:
+                    changed = Articles.objects.filter(updated_at__gte=updated)
+                    self._load(self._index, changed)
+                if len(self._index.documents) != version[0]:
+                    self._index = None
+            if self._index is None:
+                self._index = self._load(InvertedIndex(), Articles.objects.all())
+            self._version = version
+            return self._index
+
+    def index(self, article):
+        fields = document_fields(article)
+        with self._lock:
+            if self._index is not None:
+                self._index.add(article.pk, fields)
+
+    def index_many(self, articles):
+        texts = tag_texts([article.pk for article in articles])
+        with self._lock:
+            if self._index is not None:
+                for article in articles:
+                    self._index.add(
+                        article.pk,
+                        {
+                            "title": article.title,
+                            "tags": texts.get(article.pk, ""),
+                            "content": article.content,
+                        },
+                    )
+
+    def remove(self, article_id):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(article_id)
+
+    def search(self, queryset, terms):
+        """
+        the ``MAX_RESULTS`` best matches of ``queryset``, best first; lower
+        ranked articles are left out.
+        """
+        terms = parse_terms(terms)
+        if not terms:
+            return queryset
+
+        results = self.get_index().search(terms)[: get_config()["MAX_RESULTS"]]
+        ranking = [
+            When(id=article_id, then=Value(position))
+            for position, (article_id, _) in enumerate(results)
+        ]
+        if not ranking:
+            return queryset.none()
+        return queryset.filter(
+            id__in=[article_id for article_id, _ in results]
+        ).order_by(Case(*ranking, output_field=IntegerField()), "-created_at")
+
+
+_backends = {}
+
+
+def get_backend():
+    vendor = connection.vendor
+    if vendor not in _backends:
+        if vendor == "postgresql":
+            _backends[vendor] = PostgresSearchBackend()
+        else:
+            _backends[vendor] = PythonSearchBackend()
+    return _backends[vendor]
+
+
+def search_articles(queryset, terms):
+    return get_backend().search(queryset, terms)
+
+
+def index_article(article):
+    get_backend().index(article)
+
+
+def index_articles(articles):
+    """
+    indexes several articles at once, one UPDATE on PostgreSQL.
+    """
+    if articles:
+        get_backend().index_many(articles)
+
+
+def remove_article(article_id):
+    get_backend().remove(article_id)
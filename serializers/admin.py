@@ -1,8 +1,20 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
-from taggit.models import Tag
+from rest_framework.exceptions import ValidationError
+from taggit.models import Tag, TaggedItem
 from taggit_serializer.serializers import TaggitSerializer, TagListSerializerField
 
-from super_krishak.articles.models import Articles, Gallery, Reactions, Shares
+from super_krishak.articles.engagement import user_engagement
+from super_krishak.articles.images import rendition_urls, stored_rendition_urls
+from super_krishak.articles.models import (
+    Articles,
+    Gallery,
+    Reactions,
+    RequestProfile,
+    Shares,
+)
 from super_krishak.users.models import User
 
 
@@ -13,9 +25,15 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class GallerySerializer(serializers.ModelSerializer):
+
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = Gallery
-        fields = ["id", "picture", "created_at"]
+        fields = ["id", "picture", "width", "height", "renditions", "created_at"]
+
+    def get_renditions(self, obj):
+        return rendition_urls(obj)
 
 
 class ReactionSerializer(serializers.ModelSerializer):
@@ -73,6 +91,7 @@ class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
 
     tags = TagListSerializerField(required=False)
     image_files = GallerySerializer(many=True, read_only=True)
+    cover_image = GallerySerializer(read_only=True)
     user = serializers.StringRelatedField(source="creator")
 
     total_shares = serializers.FloatField(read_only=True)
@@ -81,6 +100,8 @@ class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
     good_reacts = serializers.FloatField(read_only=True)
     informative_reacts = serializers.FloatField(read_only=True)
     launch_date = serializers.DateField(required=True)
+    my_reaction = serializers.SerializerMethodField()
+    my_shares = serializers.SerializerMethodField()
 
     class Meta:
         model = Articles
@@ -90,7 +111,9 @@ class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
             "title",
             "tags",
             "image_files",
+            "cover_image",
             "content",
+            "excerpt",
             "video_content",
             "post_views",
             "launch_date",
@@ -99,6 +122,8 @@ class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
             "bad_reacts",
             "good_reacts",
             "informative_reacts",
+            "my_reaction",
+            "my_shares",
         ]
 
         extra_kwargs = {
@@ -107,6 +132,37 @@ class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
             }
         }
 
+    def __init__(self, *args, fields=None, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self._engagement = None
+        if user is None:
+            for name in ENGAGEMENT_FIELDS:
+                self.fields.pop(name)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def engagement(self, article):
+        """
+        the user's engagement with an article, read once for every article
+        the serializer renders.
+        """
+        if self._engagement is None:
+            articles = self.root.instance
+            if isinstance(articles, Articles):
+                articles = [articles]
+            self._engagement = user_engagement(
+                self.user.id, [item.id for item in articles]
+            )
+        return self._engagement[article.id]
+
+    def get_my_reaction(self, obj):
+        return self.engagement(obj)["my_reaction"]
+
+    def get_my_shares(self, obj):
+        return render_shares(self.engagement(obj)["my_shares"])
+
     def create(self, validated_data):
         tags = validated_data.pop("tags", None)
         instance = super(ArticleSerializer, self).create(validated_data)
@@ -116,8 +172,281 @@ class ArticleSerializer(TaggitSerializer, serializers.ModelSerializer):
         instance.save()
         return instance
 
+    def update(self, instance, validated_data):
+        tags = validated_data.pop("tags", None)
+        instance = super(ArticleSerializer, self).update(instance, validated_data)
+        if tags is not None:
+            current = set(instance.tags.names())
+            added = set(tags) - current
+            removed = current - set(tags)
+            if removed:
+                instance.tags.remove(*removed)
+            if added:
+                instance.tags.add(*added)
+        return instance
+
+
+ENGAGEMENT_FIELDS = ["my_reaction", "my_shares"]
+STATS_FIELDS = [
+    "total_shares",
+    "total_reacts",
+    "bad_reacts",
+    "good_reacts",
+    "informative_reacts",
+]
+GALLERY_VALUES = ["id", "picture", "width", "height", "renditions", "created_at"]
+# ``.values()`` columns behind each ArticleSerializer field
+ARTICLE_VALUES = {
+    "id": ["id"],
+    "user": ["creator_id"],
+    "title": ["title"],
+    "cover_image": ["cover_image__" + name for name in GALLERY_VALUES],
+    "content": ["content"],
+    "excerpt": ["excerpt"],
+    "video_content": ["video_content"],
+    "post_views": ["post_views"],
+    "launch_date": ["launch_date"],
+}
+# model fields behind each ArticleSerializer field, for ``.only()``
+ARTICLE_COLUMNS = {
+    "id": "id",
+    "user": "creator",
+    "title": "title",
+    "cover_image": "cover_image",
+    "content": "content",
+    "excerpt": "excerpt",
+    "video_content": "video_content",
+    "post_views": "post_views",
+    "launch_date": "launch_date",
+}
+FIELD_SETS = {
+    "card": [
+        "id",
+        "user",
+        "title",
+        "cover_image",
+        "excerpt",
+        "post_views",
+        "launch_date",
+        *STATS_FIELDS,
+        *ENGAGEMENT_FIELDS,
+    ]
+}
+
+
+def render_shares(shares):
+    if shares is None:
+        return None
+    last_shared_at = serializers.DateTimeField().to_representation(
+        shares["last_shared_at"]
+    )
+    return {**shares, "last_shared_at": last_shared_at}
+
+
+def requested_fields(request):
+    """
+    the ArticleSerializer fields named in ``?fields=``, where ``card`` stands
+    for the fields of a feed card. None when the parameter isn't given.
+    """
+    param = request.query_params.get("fields")
+    if not param:
+        return None
+    fields = set()
+    for name in filter(None, (name.strip() for name in param.split(","))):
+        fields.update(FIELD_SETS.get(name, [name]))
+    unknown = fields - set(ArticleSerializer.Meta.fields)
+    if unknown:
+        raise ValidationError(
+            {"fields": "Unknown fields: {}.".format(", ".join(sorted(unknown)))}
+        )
+    return fields
+
+
+def narrow_queryset(queryset, fields):
+    """
+    loads only the columns and relations ``fields`` are rendered from.
+    ``created_at`` and ``post_views`` are kept for pagination and the view
+    counter.
+    """
+    if fields is None:
+        return queryset
+    columns = {"id", "created_at", "post_views"}
+    columns.update(ARTICLE_COLUMNS[name] for name in fields if name in ARTICLE_COLUMNS)
+    queryset = queryset.select_related(None).prefetch_related(None).only(*columns)
+    related = [name for name in ("creator", "cover_image") if name in columns]
+    if related:
+        queryset = queryset.select_related(*related)
+    prefetched = [name for name in ("tags", "image_files") if name in fields]
+    return queryset.prefetch_related(*prefetched)
+
+
+def article_rows(queryset, fields=None):
+    """
+    the ``.values()`` rows ``ArticleListSerializer`` renders ``fields`` from,
+    with the stats fields the queryset is annotated with.
+    """
+    names = ArticleSerializer.Meta.fields if fields is None else fields
+    columns = ["id", "created_at"]
+    for name in names:
+        columns.extend(ARTICLE_VALUES.get(name, []))
+    columns.extend(
+        name
+        for name in STATS_FIELDS
+        if name in names and name in queryset.query.annotations
+    )
+    return queryset.prefetch_related(None).values(*dict.fromkeys(columns))
+
+
+class ArticleListSerializer:
+    """
+    Read-only equivalent of ``ArticleSerializer(many=True)`` for listings.
+
+    Renders ``article_rows`` dicts into the same JSON; the page's tags,
+    images and creators are read with one query each, only when asked for,
+    and no field objects are bound per row. Stats fields are only rendered
+    when the rows have them, as ``ArticleSerializer`` skips them when they
+    aren't annotated. ``my_reaction`` and ``my_shares`` are rendered when a
+    ``user`` is given, read for the whole page with one query per table.
+    """
+
+    date_field = serializers.DateField()
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, rows, context=None, fields=None, user=None):
+        self.rows = list(rows)
+        self.context = context or {}
+        self.user = user
+        self.fields = set(ArticleSerializer.Meta.fields if fields is None else fields)
+        if user is None:
+            self.fields.difference_update(ENGAGEMENT_FIELDS)
+
+    def file_url(self, storage, name):
+        if not name:
+            return None
+        url = storage.url(name)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def gallery(self, storage, pk, picture, width, height, renditions, created_at):
+        return {
+            "id": pk,
+            "picture": self.file_url(storage, picture),
+            "width": width,
+            "height": height,
+            "renditions": stored_rendition_urls(storage, renditions),
+            "created_at": self.datetime_field.to_representation(created_at),
+        }
+
+    def tags_by_article(self, ids):
+        tags = defaultdict(list)
+        items = (
+            TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(Articles),
+                object_id__in=ids,
+            )
+            .order_by("id")
+            .values_list("object_id", "tag__name")
+        )
+        for article_id, name in items:
+            tags[article_id].append(name)
+        return tags
+
+    def images_by_article(self, ids, storage):
+        images = defaultdict(list)
+        links = (
+            Articles.image_files.through.objects.filter(articles_id__in=ids)
+            .order_by("gallery__created_at")
+            .values_list(
+                "articles_id", *["gallery__" + name for name in GALLERY_VALUES]
+            )
+        )
+        for article_id, *values in links:
+            images[article_id].append(self.gallery(storage, *values))
+        return images
+
+    @property
+    def data(self):
+        ids = [row["id"] for row in self.rows]
+        if not ids:
+            return []
+        storage = Gallery._meta.get_field("picture").storage
+        tags = images = creators = engagement = None
+        if "tags" in self.fields:
+            tags = self.tags_by_article(ids)
+        if "image_files" in self.fields:
+            images = self.images_by_article(ids, storage)
+        if "user" in self.fields:
+            creators = User.objects.in_bulk(
+                {row["creator_id"] for row in self.rows if row["creator_id"]}
+            )
+        if self.fields.intersection(ENGAGEMENT_FIELDS):
+            engagement = user_engagement(self.user.id, ids)
+
+        data = []
+        for row in self.rows:
+            article = {
+                name: row[name]
+                for name in ("id", "title", "content", "excerpt", "video_content")
+                if name in row
+            }
+            if creators is not None:
+                creator = creators.get(row["creator_id"])
+                article["user"] = str(creator) if creator is not None else None
+            if tags is not None:
+                article["tags"] = tags.get(row["id"], [])
+            if images is not None:
+                article["image_files"] = images.get(row["id"], [])
+            if "cover_image__id" in row:
+                article["cover_image"] = None
+                if row["cover_image__id"] is not None:
+                    article["cover_image"] = self.gallery(
+                        storage,
+                        *[row["cover_image__" + name] for name in GALLERY_VALUES],
+                    )
+            if "post_views" in row:
+                article["post_views"] = row["post_views"]
+            if "launch_date" in row:
+                article["launch_date"] = self.date_field.to_representation(
+                    row["launch_date"]
+                )
+            for name in STATS_FIELDS:
+                if name in row:
+                    article[name] = float(row[name])
+            if engagement is not None:
+                mine = engagement[row["id"]]
+                article["my_reaction"] = mine["my_reaction"]
+                article["my_shares"] = render_shares(mine["my_shares"])
+            data.append(
+                {
+                    name: article[name]
+                    for name in ArticleSerializer.Meta.fields
+                    if name in self.fields and name in article
+                }
+            )
+        return data
+
 
 class TagsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ["name"]
+
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestProfile
+        fields = [
+            "id",
+            "user",
+            "method",
+            "path",
+            "view",
+            "status_code",
+            "duration",
+            "created_at",
+        ]
+
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    class Meta(RequestProfileSerializer.Meta):
+        fields = RequestProfileSerializer.Meta.fields + ["call_tree", "queries"]
@@ -0,0 +1,120 @@
+"""
+Share totals and time series read from the per-day ``ShareRollup`` rows,
+so every query is an indexed range scan over at most three rows per
+article and day instead of a pass over the ``Shares`` table.
+
+Migration 0016 builds the rollups of the shares that existed before them
+and ``stats.record_shares`` keeps them current from then on. Rollups are a
+history of when shares happened and keep the shares of deleted rows, so
+their totals can exceed the all-time ``ArticleStats.total_shares`` once
+users or shares are deleted. ``backfill_rollups`` fills
+in articles that have shares but no rollups, and with ``rebuild`` replaces
+all of them. A share row only knows when it was last shared, so the
+backfill dates all of a row's counts on that day and loses the per-day
+history the live rollups hold; rebuild only to repair rollups known to be
+wrong.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDay, TruncWeek
+from django.utils import timezone
+
+from super_krishak.articles.models import ShareRollup, Shares
+
+PLATFORMS = {1: "facebook", 2: "twitter", 3: "reddit"}
+
+INTERVALS = {"day": TruncDay, "week": TruncWeek}
+
+PLATFORM_SUMS = {
+    name: Sum("count", filter=Q(platform=platform))
+    for platform, name in PLATFORMS.items()
+}
+
+
+def rollups(article_id=None, start=None, end=None):
+    queryset = ShareRollup.objects.all()
+    if article_id is not None:
+        queryset = queryset.filter(article_id=article_id)
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lte=end)
+    return queryset
+
+
+def share_totals(article_id=None, start=None, end=None):
+    """
+    returns ``{"facebook": n, "twitter": n, "reddit": n}``.
+    """
+    totals = rollups(article_id, start, end).aggregate(**PLATFORM_SUMS)
+    return {name: count or 0 for name, count in totals.items()}
+
+
+def share_series(article_id=None, start=None, end=None, interval="day"):
+    """
+    returns one ``{"period": date, "facebook": n, ...}`` entry per day or
+    week that had shares, oldest first.
+    """
+    rows = (
+        rollups(article_id, start, end)
+        .annotate(period=INTERVALS[interval]("day"))
+        .values("period")
+        .annotate(**PLATFORM_SUMS)
+        .order_by("period")
+    )
+    return [
+        {
+            "period": row["period"],
+            **{name: row[name] or 0 for name in PLATFORMS.values()},
+        }
+        for row in rows
+    ]
+
+
+def backfill_rollups(chunk_size=1000, rebuild=False):
+    """
+    rolls up the ``Shares`` rows of the articles without rollups, dated on
+    the day each row was last shared. ``rebuild`` replaces every rollup
+    instead. Returns the number of ``Shares`` rows read.
+    """
+    fields = {1: "fb_counts", 2: "twitter_counts", 3: "reddit_counts"}
+    counts = defaultdict(int)
+    last_id = 0
+    read = 0
+
+    shares = Shares.objects.filter(article__isnull=False)
+    if not rebuild:
+        shares = shares.exclude(article_id__in=ShareRollup.objects.values("article_id"))
+
+    with transaction.atomic():
+        while True:
+            chunk = list(
+                shares.filter(id__gt=last_id)
+                .order_by("id")
+                .values("id", "article_id", "updated_at", *fields.values())[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1]["id"]
+            read += len(chunk)
+            for row in chunk:
+                day = timezone.localtime(row["updated_at"]).date()
+                for platform, field in fields.items():
+                    if row[field]:
+                        counts[(row["article_id"], platform, day)] += row[field]
+
+        if rebuild:
+            ShareRollup.objects.all().delete()
+        ShareRollup.objects.bulk_create(
+            [
+                ShareRollup(
+                    article_id=article_id, platform=platform, day=day, count=count
+                )
+                for (article_id, platform, day), count in counts.items()
+            ],
+            batch_size=chunk_size,
+        )
+    return read
@@ -0,0 +1,112 @@
+"""
+Deferred, batched article side effects.
+
+Saving an article schedules its notification digest, creates its
+``ArticleStats`` row and indexes it for search, one call per row from the
+``post_save`` receivers in ``signals.py``. Inside ``deferred_side_effects()``
+the receivers only record which articles were created or changed, and the
+effects run once for the whole block after the transaction commits:
+notifications are scheduled per launch window, stats rows are created with
+one ``bulk_create`` and the search index is updated in one pass. Articles
+created or removed more than once in the block are handled once, and
+articles rolled back in the meantime are skipped::
+
+    with deferred_side_effects() as batch:
+        for row in rows:
+            Articles.objects.create(**row)
+        batch.created(Articles.objects.bulk_create(more))
+
+``bulk_create`` doesn't send ``post_save``, so its articles are passed to
+``articles_created``, which also stores the excerpts ``Articles.save``
+computes, or to ``batch.created`` inside a block.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from super_krishak.articles.fanout import schedule_digests
+from super_krishak.articles.models import Articles, ArticleStats, make_excerpt
+from super_krishak.articles.search import index_articles
+
+_state = threading.local()
+
+
+class SideEffects:
+    """
+    articles collected by a ``deferred_side_effects`` block, keyed by id.
+    """
+
+    def __init__(self):
+        self._created = {}
+        self._indexed = {}
+
+    def created(self, articles):
+        for article in articles:
+            self._created[article.pk] = article
+            self._indexed[article.pk] = article
+
+    def indexed(self, articles):
+        for article in articles:
+            self._indexed[article.pk] = article
+
+    def dispatch(self):
+        ids = set(self._created) | set(self._indexed)
+        existing = set(Articles.objects.filter(id__in=ids).values_list("id", flat=True))
+        created = [a for pk, a in self._created.items() if pk in existing]
+        indexed = [a for pk, a in self._indexed.items() if pk in existing]
+        self._created, self._indexed = {}, {}
+
+        if created:
+            ArticleStats.objects.bulk_create(
+                [ArticleStats(article_id=article.pk) for article in created],
+                ignore_conflicts=True,
+            )
+            schedule_digests(created)
+        index_articles(indexed)
+
+
+def current_batch():
+    """
+    the ``SideEffects`` of the enclosing ``deferred_side_effects`` block in
+    this thread, or None.
+    """
+    return getattr(_state, "batch", None)
+
+
+@contextmanager
+def deferred_side_effects():
+    """
+    runs the block in a transaction and dispatches the article side effects
+    it collected once that commits. Nested blocks join the outer one.
+    """
+    batch = current_batch()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = _state.batch = SideEffects()
+    try:
+        with transaction.atomic():
+            yield batch
+    finally:
+        _state.batch = None
+    transaction.on_commit(batch.dispatch)
+
+
+def articles_created(articles):
+    """
+    runs the post-save side effects of articles stored without signals,
+    storing the excerpts ``Articles.save`` would have computed first.
+    """
+    stale = []
+    for article in articles:
+        excerpt = make_excerpt(article.content)
+        if article.excerpt != excerpt:
+            article.excerpt = excerpt
+            stale.append(article)
+    with deferred_side_effects() as batch:
+        if stale:
+            Articles.objects.bulk_update(stale, ["excerpt"])
+        batch.created(articles)
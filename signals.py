@@ -1,26 +1,150 @@
-from datetime import datetime, time, timedelta
-
-import pytz
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
 from django.dispatch import receiver
 from django.utils import timezone
 
-from super_krishak.articles.models import Articles
-from super_krishak.notifications.tasks import notify_users
+from super_krishak.articles.fanout import schedule_digest
+from super_krishak.articles.images import refresh_covers
+from super_krishak.articles.models import (
+    Articles,
+    ArticleStats,
+    Gallery,
+    Reactions,
+    Shares,
+)
+from super_krishak.articles.search import index_article, remove_article
+from super_krishak.articles.side_effects import current_batch
+from super_krishak.articles.stats import release_rows
+from super_krishak.articles.tag_stats import record_tag_changes
+from super_krishak.articles.tasks import process_gallery_images
 
 
 @receiver(post_save, sender=Articles)
 def send_notification(sender, instance, created, **kwargs):
     if created:
-        if timezone.now().date() == instance.launch_date:
-            start = timezone.now() + timedelta(seconds=5)
+        batch = current_batch()
+        if batch is not None:
+            batch.created([instance])
         else:
-            start_time = time(0)
-            start = datetime.combine(instance.launch_date, start_time)
-        notification_send_time = start
-        zone = pytz.timezone(settings.TIME_ZONE)
-        eta = notification_send_time.astimezone(zone)
-        extra = {"type": "article", "article_id": instance.id}
-        res = notify_users.schedule(("New article alert.", extra), eta=eta)
-        res()
+            schedule_digest(instance)
+
+
+@receiver(post_save, sender=Articles)
+def create_stats(sender, instance, created, **kwargs):
+    if created and current_batch() is None:
+        ArticleStats.objects.get_or_create(article=instance)
+
+
+@receiver(post_save, sender=Articles)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {"title", "content"} & set(update_fields):
+        return
+    batch = current_batch()
+    if batch is not None:
+        batch.indexed([instance])
+    else:
+        index_article(instance)
+
+
+@receiver(post_delete, sender=Articles)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_article(instance.pk)
+
+
+@receiver(m2m_changed, sender=Articles.tags.through)
+def update_search_tags(sender, instance, action, **kwargs):
+    if isinstance(instance, Articles) and action in (
+        "post_add",
+        "post_remove",
+        "post_clear",
+    ):
+        # other processes' search indexes and the ETags follow updated_at
+        Articles.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+        batch = current_batch()
+        if batch is not None:
+            batch.indexed([instance])
+        else:
+            index_article(instance)
+
+
+@receiver(m2m_changed, sender=Articles.tags.through)
+def count_tag_changes(sender, instance, action, pk_set, **kwargs):
+    """
+    keeps ``TagStats`` in step with every tagging path. taggit sends the ids
+    of the tags it added, the names of the ones asked to be removed, whether
+    the article has them or not, and nothing on clear, hence the lookups of
+    the tags the article has before the removal.
+    """
+    if not isinstance(instance, Articles):
+        return
+    if action == "pre_clear":
+        instance._cleared_tag_ids = list(instance.tags.values_list("id", flat=True))
+    elif action == "post_clear":
+        record_tag_changes(removed=instance.__dict__.pop("_cleared_tag_ids", ()))
+    elif action == "post_add" and pk_set:
+        record_tag_changes(added=pk_set)
+    elif action == "pre_remove" and pk_set:
+        ids = {value for value in pk_set if not isinstance(value, str)}
+        names = pk_set - ids
+        instance._removed_tag_ids = list(
+            instance.tags.filter(Q(id__in=ids) | Q(name__in=names)).values_list(
+                "id", flat=True
+            )
+        )
+    elif action == "post_remove":
+        record_tag_changes(removed=instance.__dict__.pop("_removed_tag_ids", ()))
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def release_user_activity(sender, instance, **kwargs):
+    # the user's reactions and shares cascade as fast deletes, without signals
+    release_rows(
+        reactions=Reactions.objects.filter(user=instance),
+        shares=Shares.objects.filter(user=instance),
+    )
+
+
+@receiver(pre_delete, sender=Articles)
+def release_tags(sender, instance, **kwargs):
+    # taggit deletes the tagged items of a deleted article without m2m_changed
+    record_tag_changes(removed=instance.tags.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Gallery)
+def prepare_gallery_image(sender, instance, created, **kwargs):
+    """
+    bulk ingestion schedules its own processing, this covers single creates.
+    """
+    if created and instance.picture:
+        transaction.on_commit(lambda: process_gallery_images([instance.id]))
+
+
+@receiver(m2m_changed, sender=Articles.image_files.through)
+def update_cover_image(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_covers([instance.pk])
+    elif pk_set:
+        refresh_covers(pk_set)
+
+
+@receiver(pre_delete, sender=Gallery)
+def remember_gallery_articles(sender, instance, **kwargs):
+    instance._article_ids = list(
+        Articles.objects.filter(cover_image=instance).values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Gallery)
+def replace_deleted_cover(sender, instance, **kwargs):
+    article_ids = getattr(instance, "_article_ids", None)
+    if article_ids:
+        refresh_covers(article_ids)
@@ -0,0 +1,144 @@
+"""
+Cardinality sketches for unique visitor counts.
+
+``HyperLogLog`` keeps one byte register per bucket, so a sketch at the
+default precision of 12 is 4 KiB with a standard error of about 1.6%,
+whatever the number of visitors. ``VisitorSet`` wraps it with an exact
+mode: small audiences are kept as a plain list of user ids and only
+converted into registers once they outgrow ``exact_limit``.
+
+Both are plain python. Migration 0012 keeps its own frozen copy, so a
+change to the hashing or the register layout needs a data migration of
+the stored sketches.
+"""
+
+import hashlib
+import math
+
+DEFAULT_PRECISION = 12
+DEFAULT_EXACT_LIMIT = 256
+
+
+class HyperLogLog:
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16.")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers:
+            if len(registers) != self.size:
+                raise ValueError("registers do not match the sketch precision.")
+            self.registers = bytearray(registers)
+        else:
+            self.registers = bytearray(self.size)
+
+    @staticmethod
+    def _hash(value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, value):
+        """
+        adds a value to the sketch, returns True if a register changed.
+        """
+        hashed = self._hash(value)
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * size:
+            # linear counting is more accurate while many buckets are empty
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data, precision=DEFAULT_PRECISION):
+        return cls(precision=precision, registers=data)
+
+
+class VisitorSet:
+    """
+    set of visitor ids that is exact while small and a HyperLogLog after.
+    State round-trips through ``registers`` (bytes) and ``members`` (list).
+    """
+
+    def __init__(
+        self,
+        registers=b"",
+        members=None,
+        precision=DEFAULT_PRECISION,
+        exact_limit=DEFAULT_EXACT_LIMIT,
+    ):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.sketch = HyperLogLog(precision, registers) if registers else None
+        self.members = set(members or ())
+        if self.sketch is not None or len(self.members) > exact_limit:
+            self._to_sketch()
+
+    @property
+    def is_exact(self):
+        return self.sketch is None
+
+    def _to_sketch(self):
+        if self.sketch is None:
+            self.sketch = HyperLogLog(self.precision)
+        for member in self.members:
+            self.sketch.add(member)
+        self.members = set()
+
+    def update(self, values):
+        """
+        adds visitor ids, returns True if the stored state changed.
+        """
+        if self.sketch is not None:
+            changed = False
+            for value in values:
+                changed = self.sketch.add(value) or changed
+            return changed
+
+        before = len(self.members)
+        self.members.update(values)
+        if len(self.members) > self.exact_limit:
+            self._to_sketch()
+            return True
+        return len(self.members) != before
+
+    def merge(self, other):
+        if other.sketch is None:
+            return self.update(other.members)
+        self._to_sketch()
+        before = self.sketch.to_bytes()
+        self.sketch.merge(other.sketch)
+        return self.sketch.to_bytes() != before
+
+    def count(self):
+        if self.sketch is None:
+            return len(self.members)
+        return self.sketch.count()
+
+    @property
+    def registers(self):
+        return b"" if self.sketch is None else self.sketch.to_bytes()
+
+    @property
+    def member_list(self):
+        return sorted(self.members)
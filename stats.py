@@ -0,0 +1,275 @@
+"""
+Maintenance of the per-article ``ArticleStats`` counters.
+
+Every reaction or share write calls ``record_reaction``/``record_shares``
+in the same transaction, which bumps the counters with a single
+``UPDATE ... SET col = col + n``. Deleted reactions and shares, including
+the ones a deleted user takes along through CASCADE, are subtracted by
+``release_rows`` with one UPDATE per article: the ``pre_delete`` receiver
+of the user model in ``signals`` and the admin call it before deleting.
+Reactions and shares have no delete receivers of their own, so the
+cascades of user and article deletes stay fast deletes; those of an
+article go along with its stats row. The share rollups are left alone:
+they record the days shares happened on, which a share row doesn't keep,
+so a delete couldn't take back exactly what was rolled up. Other deletes
+(the shell, raw SQL, data migrations) leave the counters stale until
+``rebuild_stats`` recomputes them from the reactions and shares tables, see
+the ``rebuild_article_stats`` management command.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value
+from django.db.models.expressions import When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from super_krishak.articles.insights import invalidate_insights
+from super_krishak.articles.models import (
+    ArticleStats,
+    Articles,
+    Reactions,
+    ShareRollup,
+    Shares,
+)
+
+REACTION_FIELDS = {"1": "bad_reacts", "2": "good_reacts", "3": "informative_reacts"}
+
+SHARE_FIELDS = {
+    "fb_counts": "fb_shares",
+    "twitter_counts": "twitter_shares",
+    "reddit_counts": "reddit_shares",
+}
+
+SHARE_PLATFORMS = {"fb_shares": 1, "twitter_shares": 2, "reddit_shares": 3}
+
+ORDERING_FIELDS = {
+    "reacts_count": "stats__total_reacts",
+    "total_reacts": "stats__total_reacts",
+    "total_shares": "stats__total_shares",
+}
+
+dummy_divisor = 0.0
+
+
+def check(result, divisor):
+
+    return Case(
+        When(
+            **{
+                divisor: 0.0,
+                "then": Value(dummy_divisor, FloatField()),
+            }
+        ),
+        default=result,
+        output_field=FloatField(),
+    )
+
+
+def _increment(model, lookup, values=None, **deltas):
+    """
+    ``UPDATE ... SET col = col + n`` on the row matching ``lookup``, creating
+    it first when it doesn't exist yet. ``values`` are set as they are.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updates.update(values or {})
+    rows = model.objects.filter(**lookup)
+
+    if not rows.update(**updates):
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup)
+        except IntegrityError:
+            pass
+        rows.update(**updates)
+
+
+def _apply(article_id, **deltas):
+    _increment(
+        ArticleStats,
+        {"article_id": article_id},
+        values={"updated_at": timezone.now()},
+        **deltas,
+    )
+
+
+def record_reaction(article_id, reacts, delta=1):
+    field = REACTION_FIELDS.get(str(reacts))
+    if article_id is None or field is None:
+        return
+    _apply(article_id, total_reacts=delta, **{field: delta})
+    invalidate_insights(article_id)
+
+
+def _release(article_id, **deltas):
+    # never creates the row: it is gone already when the article is deleted
+    ArticleStats.objects.filter(article_id=article_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) - delta for field, delta in deltas.items()},
+    )
+    invalidate_insights(article_id)
+
+
+def release_rows(reactions=None, shares=None):
+    """
+    subtracts the ``Reactions`` and ``Shares`` of the querysets from the
+    totals, with one UPDATE per article. Call it before deleting them.
+    """
+    deltas = defaultdict(Counter)
+    if reactions is not None:
+        rows = reactions.values("article_id", "reacts").annotate(count=Count("id"))
+        for row in rows.order_by():
+            field = REACTION_FIELDS.get(str(row["reacts"]))
+            if row["article_id"] is None or field is None:
+                continue
+            deltas[row["article_id"]].update(
+                {"total_reacts": row["count"], field: row["count"]}
+            )
+    if shares is not None:
+        rows = shares.values("article_id").annotate(
+            **{"sum_" + field: Sum(field) for field in SHARE_FIELDS}
+        )
+        for row in rows.order_by():
+            share_deltas = _share_deltas(
+                {field: row["sum_" + field] for field in SHARE_FIELDS}
+            )
+            if row["article_id"] is None or not share_deltas:
+                continue
+            deltas[row["article_id"]].update(
+                total_shares=sum(share_deltas.values()), **share_deltas
+            )
+
+    for article_id in sorted(deltas):
+        _release(article_id, **deltas[article_id])
+    return len(deltas)
+
+
+def _share_deltas(counts):
+    return {
+        SHARE_FIELDS[field]: int(count or 0)
+        for field, count in counts.items()
+        if int(count or 0)
+    }
+
+
+def record_shares(article_id, **counts):
+    """
+    adds share counts, keyed by the ``Shares`` column names, e.g.
+    ``record_shares(article.id, fb_counts=1)``.
+    """
+    deltas = _share_deltas(counts)
+    if article_id is None or not deltas:
+        return
+    _apply(article_id, total_shares=sum(deltas.values()), **deltas)
+
+    today = timezone.localdate()
+    for field, delta in deltas.items():
+        _increment(
+            ShareRollup,
+            {
+                "article_id": article_id,
+                "platform": SHARE_PLATFORMS[field],
+                "day": today,
+            },
+            count=delta,
+        )
+
+
+def stats_annotations():
+    """
+    the ``total_*`` and reaction percentage fields of ``ArticleSerializer``,
+    read from the joined stats row.
+    """
+
+    def percentage(field):
+        return Coalesce(
+            check(
+                100.0 * F("stats__{}".format(field)) / F("stats__total_reacts"),
+                "stats__total_reacts",
+            ),
+            0.0,
+            output_field=FloatField(),
+        )
+
+    return {
+        "total_shares": Coalesce(
+            F("stats__total_shares"), 0.0, output_field=FloatField()
+        ),
+        "total_reacts": Coalesce(
+            F("stats__total_reacts"), 0.0, output_field=FloatField()
+        ),
+        "bad_reacts": percentage("bad_reacts"),
+        "good_reacts": percentage("good_reacts"),
+        "informative_reacts": percentage("informative_reacts"),
+    }
+
+
+def with_stats(queryset):
+    return queryset.select_related("stats").annotate(**stats_annotations())
+
+
+def ordering_for(query):
+    """
+    maps ``?ordering=`` values on the stats totals to their indexed columns.
+    """
+    descending = query.startswith("-")
+    field = ORDERING_FIELDS.get(query.lstrip("-"))
+    if field is None:
+        return query
+    return "-" + field if descending else field
+
+
+def compute_stats(article_ids):
+    stats = {
+        article_id: ArticleStats(article_id=article_id) for article_id in article_ids
+    }
+
+    reactions = (
+        Reactions.objects.filter(article_id__in=article_ids)
+        .values("article_id", "reacts")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for row in reactions:
+        field = REACTION_FIELDS.get(str(row["reacts"]))
+        if field is not None:
+            item = stats[row["article_id"]]
+            setattr(item, field, getattr(item, field) + row["count"])
+            item.total_reacts += row["count"]
+
+    shares = (
+        Shares.objects.filter(article_id__in=article_ids)
+        .values("article_id")
+        .annotate(
+            fb=Sum("fb_counts"),
+            twitter=Sum("twitter_counts"),
+            reddit=Sum("reddit_counts"),
+        )
+        .order_by()
+    )
+    for row in shares:
+        item = stats[row["article_id"]]
+        item.fb_shares = row["fb"] or 0
+        item.twitter_shares = row["twitter"] or 0
+        item.reddit_shares = row["reddit"] or 0
+        item.total_shares = item.fb_shares + item.twitter_shares + item.reddit_shares
+
+    return list(stats.values())
+
+
+def rebuild_stats(article_ids=None, batch_size=500):
+    """
+    recomputes the stats rows from scratch, returns the number of articles.
+    """
+    queryset = Articles.objects.order_by("id")
+    if article_ids:
+        queryset = queryset.filter(id__in=article_ids)
+    ids = list(queryset.values_list("id", flat=True))
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start : start + batch_size]
+        with transaction.atomic():
+            ArticleStats.objects.filter(article_id__in=batch).delete()
+            ArticleStats.objects.bulk_create(compute_stats(batch))
+    return len(ids)
@@ -0,0 +1,145 @@
+"""
+Tag popularity without aggregating the taggit tables per request.
+
+All-time counts live in ``TagStats`` and are adjusted by
+``record_tag_changes``, which the ``m2m_changed`` receiver on the taggit
+through model calls with the ids of the tags taggit actually added or
+removed, so every tagging path counts and names are already normalized.
+Trending scores live in ``TagTrend``, one row per tag and window, and are
+refreshed by a periodic task from engagement timestamped inside the window:
+every reaction and share an article received there adds its weight times
+``0.5 ** (age / half life)`` to each of the article's tags, the half life
+being half the window. ``post_views`` is an all-time total and has no say.
+
+Configured through ``settings.ARTICLES_TAG_TRENDING``::
+
+    ARTICLES_TAG_TRENDING = {"WINDOWS": [1, 7, 30], "DEFAULT_WINDOW": 7}
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from super_krishak.articles.models import (
+    Articles,
+    Reactions,
+    ShareRollup,
+    TagStats,
+    TagTrend,
+)
+
+DEFAULTS = {
+    "WINDOWS": [1, 7, 30],
+    "DEFAULT_WINDOW": 7,
+    "REACTION_WEIGHT": 1,
+    "SHARE_WEIGHT": 2,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "ARTICLES_TAG_TRENDING", {})}
+
+
+def record_tag_changes(added=(), removed=()):
+    """
+    adjusts the article counts of the tag ids in ``added``/``removed``, once
+    per occurrence.
+    """
+    deltas = defaultdict(int)
+    for tag_id in added:
+        deltas[tag_id] += 1
+    for tag_id in removed:
+        deltas[tag_id] -= 1
+    deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    TagStats.objects.bulk_create(
+        [TagStats(tag_id=tag_id) for tag_id in deltas], ignore_conflicts=True
+    )
+    now = timezone.now()
+    for tag_id in sorted(deltas):
+        TagStats.objects.filter(tag_id=tag_id).update(
+            article_count=F("article_count") + deltas[tag_id], updated_at=now
+        )
+
+
+def top_tags(limit):
+    return Tag.objects.filter(article_stats__article_count__gt=0).order_by(
+        "-article_stats__article_count", "name"
+    )[:limit]
+
+
+def trending_tags(limit, days):
+    return Tag.objects.filter(trends__days=days, trends__score__gt=0).order_by(
+        "-trends__score", "name"
+    )[:limit]
+
+
+def compute_trends(days, now=None):
+    """
+    returns ``{tag id: score}`` for the window ending at ``now``.
+    """
+    config = get_config()
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    start = today - timedelta(days=days)
+    half_life = max(days / 2, 0.5)
+
+    # (article id, day, count) of the reactions and shares inside the window
+    reactions = (
+        Reactions.objects.filter(created_at__lte=now, article__launch_date__lte=today)
+        .annotate(day=TruncDate("created_at"))
+        .filter(day__gt=start)
+        .values_list("article_id", "day")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    shares = (
+        ShareRollup.objects.filter(
+            day__gt=start, day__lte=today, article__launch_date__lte=today
+        )
+        .values_list("article_id", "day")
+        .annotate(count=Sum("count"))
+        .order_by()
+    )
+
+    engagement = defaultdict(float)
+    for rows, weight in (
+        (reactions, config["REACTION_WEIGHT"]),
+        (shares, config["SHARE_WEIGHT"]),
+    ):
+        for article_id, day, count in rows:
+            age = (today - day).days
+            engagement[article_id] += weight * count * 0.5 ** (age / half_life)
+    if not engagement:
+        return {}
+
+    scores = defaultdict(float)
+    tagged = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Articles),
+        object_id__in=engagement,
+    ).values_list("object_id", "tag_id")
+    for article_id, tag_id in tagged:
+        scores[tag_id] += engagement[article_id]
+    return scores
+
+
+def refresh_trends():
+    for days in get_config()["WINDOWS"]:
+        scores = compute_trends(days)
+        with transaction.atomic():
+            TagTrend.objects.filter(days=days).delete()
+            TagTrend.objects.bulk_create(
+                [
+                    TagTrend(tag_id=tag_id, days=days, score=score)
+                    for tag_id, score in scores.items()
+                ]
+            )
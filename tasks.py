@@ -0,0 +1,57 @@
+from huey import crontab
+from huey.contrib.djhuey import db_periodic_task, db_task
+
+from super_krishak.articles.coins import apply_coin_awards
+from super_krishak.articles.counters import view_counter
+from super_krishak.articles.dashboard import refresh_totals
+from super_krishak.articles.fanout import resume_digests, send_digest
+from super_krishak.articles.images import process_images
+from super_krishak.articles.tag_stats import refresh_trends
+from super_krishak.articles.visitors import visitor_tracker
+
+
+@db_periodic_task(crontab(minute="*"))
+def flush_view_counts():
+    """
+    flushes the buffered article views of the shared counter backend.
+    """
+    return view_counter.flush()
+
+
+@db_periodic_task(crontab(minute="*"))
+def flush_visitors():
+    """
+    merges the buffered unique visits into the visitor sketches.
+    """
+    return visitor_tracker.flush()
+
+
+@db_periodic_task(crontab(minute="5"))
+def refresh_tag_trends():
+    refresh_trends()
+
+
+@db_periodic_task(crontab(minute="*"))
+def refresh_dashboard_totals():
+    refresh_totals()
+
+
+@db_periodic_task(crontab(minute="*"))
+def apply_pending_coin_awards():
+    while apply_coin_awards():
+        pass
+
+
+@db_task()
+def process_gallery_images(gallery_ids):
+    return process_images(gallery_ids)
+
+
+@db_task()
+def send_notification_digest(digest_id, heartbeat=None):
+    return send_digest(digest_id, heartbeat=heartbeat)
+
+
+@db_periodic_task(crontab(minute="*"))
+def resume_notification_digests():
+    resume_digests()
@@ -1,3 +1,1412 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, models, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+    tag,
+)
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from taggit.models import TaggedItem
+
+from super_krishak.articles.api.v1.serializers.admin import (
+    ArticleListSerializer,
+    ArticleSerializer,
+    article_rows,
+    narrow_queryset,
+    requested_fields,
+)
+from super_krishak.articles.benchmarks import (
+    BASELINE_PATH,
+    REQUIRE_BASELINE,
+    benchmark_settings,
+    compare,
+    load_baseline,
+    run_benchmarks,
+    seed_data,
+)
+from super_krishak.articles.coins import (
+    apply_coin_awards,
+    award_coins,
+    balance_field,
+    coin_balance,
+)
+from super_krishak.articles.counters import (
+    CacheCounterBackend,
+    LocalCounterBackend,
+    ViewCounter,
+    view_counter,
+)
+from super_krishak.articles.dashboard import (
+    LOCK_KEY,
+    dashboard_totals,
+    refresh_totals,
+)
+from super_krishak.articles.engagement import (
+    insert_reaction,
+    record_shares_upsert,
+    user_engagement,
+)
+from super_krishak.articles.fanout import (
+    SENDING,
+    SENT,
+    _queues,
+    _sender,
+    get_config,
+    get_queue,
+    push_to_users,
+    resume_digests,
+    send_digest,
+)
+from super_krishak.articles.insights import overall_insights, reaction_insights
+from super_krishak.articles.instrumentation import QueryCollector
+from super_krishak.articles.models import (
+    EXCERPT_LENGTH,
+    ArticleStats,
+    Articles,
+    CoinAward,
+    Gallery,
+    NotificationDigest,
+    Reactions,
+    RequestProfile,
+    ShareRollup,
+    Shares,
+    TagStats,
+    TagTrend,
+)
+from super_krishak.articles.pagination import KeysetPagination
+from super_krishak.articles.profiling import RESPONSE_HEADER, ProfilingMiddleware
+from super_krishak.articles.search import InvertedIndex, parse_terms, tokenize
+from super_krishak.articles.side_effects import deferred_side_effects
+from super_krishak.articles.sketches import HyperLogLog, VisitorSet
+from super_krishak.articles.stats import (
+    ordering_for,
+    rebuild_stats,
+    release_rows,
+    with_stats,
+)
+from super_krishak.articles.tag_stats import refresh_trends, top_tags, trending_tags
+from super_krishak.articles.visitors import VisitorTracker, visitor_tracker
+from super_krishak.users.models import UserCoin
 
 # Create your tests here.
+
+USERS_URLCONF = "super_krishak.articles.api.v1.urls.users"
+ADMIN_URLCONF = "super_krishak.articles.api.v1.urls.admin"
+
+
+def create_user(index, **fields):
+    """
+    a user with a value for the ``USERNAME_FIELD`` and each of the
+    ``REQUIRED_FIELDS``, whatever the user model names them.
+    """
+    User = get_user_model()
+    for name in {User.USERNAME_FIELD, *User.REQUIRED_FIELDS}:
+        field = User._meta.get_field(name)
+        if field.choices:
+            value = field.choices[0][0]
+        elif isinstance(field, models.EmailField):
+            value = "farmer{}@example.com".format(index)
+        elif isinstance(field, models.BigIntegerField):
+            value = 9800000000 + index
+        elif isinstance(field, models.IntegerField):
+            value = index + 1
+        else:
+            value = "98{:08d}".format(index)
+        fields.setdefault(field.attname, value)
+    return User.objects.create(**fields)
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"}
+)
+class ApiTestCase(TestCase):
+    """
+    calls the article API views through their URL confs as an authenticated
+    user, with view and visit buffers of the test's own.
+    """
+
+    def setUp(self):
+        for buffer in (view_counter, visitor_tracker):
+            patcher = mock.patch.object(buffer, "_backend", LocalCounterBackend())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def call(
+        self, method, path, data=None, user=None, urlconf=USERS_URLCONF, **headers
+    ):
+        factory = APIRequestFactory()
+        if data is None:
+            request = getattr(factory, method)(path, **headers)
+        else:
+            request = getattr(factory, method)(path, data, format="json", **headers)
+        force_authenticate(request, user=user or self.user)
+        match = resolve(path.split("?")[0], urlconf=urlconf)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        return response
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "counter-tests",
+        }
+    }
+)
+class CacheCounterBackendTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.backend = CacheCounterBackend(prefix="test:views")
+
+    def test_incr_and_drain(self):
+        self.backend.incr(1)
+        self.backend.incr(1)
+        self.assertEqual(self.backend.incr(2, 3), 5)
+        self.assertEqual(self.backend.get(1), 2)
+
+        self.assertEqual(self.backend.drain(), {1: 2, 2: 3})
+        self.assertEqual(self.backend.get(1), 0)
+        self.assertEqual(self.backend.drain(), {})
+
+    def test_increments_after_a_drain_are_registered_again(self):
+        self.backend.incr(1)
+        self.backend.drain()
+        self.backend.incr(1, 4)
+        self.assertEqual(self.backend.drain(), {1: 4})
+
+    def test_drain_while_another_worker_drains(self):
+        self.backend.incr(1)
+        self.backend.cache.add(self.backend._lock_key, "other", timeout=None)
+        self.assertEqual(self.backend.drain(), {})
+
+        self.backend.cache.delete(self.backend._lock_key)
+        self.assertEqual(self.backend.drain(), {1: 1})
+
+    def test_restore(self):
+        self.backend.incr(1, 2)
+        counts = self.backend.drain()
+        self.backend.restore(counts)
+        self.assertEqual(self.backend.get(1), 2)
+        self.assertEqual(self.backend.drain(), {1: 2})
+
+    def test_failed_flush_restores_the_counts(self):
+        article = Articles.objects.create(
+            title="Paddy", launch_date=timezone.localdate()
+        )
+        counter = ViewCounter(backend=self.backend, flush_threshold=0)
+        counter.increment(article.id, 3)
+
+        with mock.patch(
+            "super_krishak.articles.counters.Articles.objects.filter",
+            side_effect=DatabaseError("database is down"),
+        ):
+            with self.assertRaises(DatabaseError):
+                counter.flush()
+        self.assertEqual(counter.pending(article.id), 3)
+
+        self.assertEqual(counter.flush(), 3)
+        article.refresh_from_db()
+        self.assertEqual((article.post_views, counter.pending(article.id)), (3, 0))
+
+
+class HyperLogLogTests(SimpleTestCase):
+    def sketch(self, values, precision=12):
+        sketch = HyperLogLog(precision)
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def test_estimate_is_close(self):
+        sketch = self.sketch(range(20000))
+        self.assertAlmostEqual(sketch.count(), 20000, delta=20000 * 0.05)
+
+    def test_small_counts_are_near_exact(self):
+        self.assertAlmostEqual(self.sketch(range(50)).count(), 50, delta=1)
+
+    def test_merge_is_the_union(self):
+        merged = self.sketch(range(0, 6000)).merge(self.sketch(range(4000, 10000)))
+        union = self.sketch(range(10000))
+        self.assertEqual(merged.to_bytes(), union.to_bytes())
+        self.assertEqual(merged.count(), union.count())
+
+    def test_merge_rejects_other_precision(self):
+        with self.assertRaises(ValueError):
+            self.sketch([1], 12).merge(self.sketch([1], 10))
+
+    def test_bytes_round_trip(self):
+        sketch = self.sketch(range(1000))
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.count(), sketch.count())
+
+
+class VisitorSetTests(SimpleTestCase):
+    def test_exact_until_the_limit(self):
+        visitors = VisitorSet(exact_limit=10)
+        self.assertTrue(visitors.update(range(10)))
+        self.assertFalse(visitors.update([3]))
+        self.assertTrue(visitors.is_exact)
+        self.assertEqual(visitors.count(), 10)
+
+        visitors.update([10])
+        self.assertFalse(visitors.is_exact)
+        self.assertEqual(visitors.member_list, [])
+        self.assertAlmostEqual(visitors.count(), 11, delta=1)
+
+    def test_merge_of_exact_and_sketched_sets(self):
+        small = VisitorSet(exact_limit=10)
+        small.update(range(5))
+        large = VisitorSet(exact_limit=10)
+        large.update(range(3, 500))
+        self.assertTrue(small.merge(large))
+        self.assertFalse(small.is_exact)
+        self.assertAlmostEqual(small.count(), 500, delta=25)
+
+    def test_state_round_trip(self):
+        visitors = VisitorSet(exact_limit=10)
+        visitors.update(range(100))
+        restored = VisitorSet(
+            registers=visitors.registers,
+            members=visitors.member_list,
+            exact_limit=10,
+        )
+        self.assertEqual(restored.count(), visitors.count())
+
+
+class VisitorTrackerTests(TestCase):
+    def setUp(self):
+        self.tracker = VisitorTracker(backend=LocalCounterBackend(), flush_threshold=0)
+        today = timezone.localdate()
+        self.articles = [
+            Articles.objects.create(title=title, launch_date=today)
+            for title in ("Paddy", "Maize")
+        ]
+
+    def test_flush_merges_visits(self):
+        first, second = self.articles
+        for user_id in (1, 2, 2):
+            self.tracker.record(first.id, user_id)
+        self.tracker.record(second.id, 3)
+
+        self.assertEqual(self.tracker.flush(), 3)
+        self.assertEqual(self.tracker.unique_visitors(first.id), 2)
+        self.assertEqual(self.tracker.unique_visits(), 3)
+        self.assertEqual(self.tracker.global_unique_visitors(), 3)
+
+    def test_visits_of_a_deleted_article_are_dropped(self):
+        kept, deleted = self.articles
+        self.tracker.record(kept.id, 1)
+        self.tracker.record(deleted.id, 2)
+        deleted.delete()
+
+        self.assertEqual(self.tracker.flush(), 2)
+        self.assertEqual(self.tracker.unique_visitors(kept.id), 1)
+        self.assertEqual(self.tracker.global_unique_visitors(), 1)
+        # nothing was put back for the next flush to fail on
+        self.assertEqual(self.tracker.flush(), 0)
+        self.tracker.record(kept.id, 3)
+        self.assertEqual(self.tracker.flush(), 2)
+        self.assertEqual(self.tracker.unique_visitors(kept.id), 2)
+
+
+class KeysetCursorTests(SimpleTestCase):
+    created_at = datetime(2026, 10, 16, 9, 30, 15, 250, tzinfo=timezone.utc)
+
+    def decode(self, token):
+        request = Request(APIRequestFactory().get("/", {"cursor": token}))
+        return KeysetPagination().decode_cursor(request)
+
+    def test_round_trip_of_rows(self):
+        paginator = KeysetPagination()
+        row = {"created_at": self.created_at, "id": 7}
+        self.assertEqual(
+            self.decode(paginator.encode_cursor(row, False)),
+            (self.created_at, 7, False),
+        )
+        instance = SimpleNamespace(created_at=self.created_at, pk=8)
+        self.assertEqual(
+            self.decode(paginator.encode_cursor(instance, True)),
+            (self.created_at, 8, True),
+        )
+
+    def test_no_cursor(self):
+        request = Request(APIRequestFactory().get("/"))
+        self.assertIsNone(KeysetPagination().decode_cursor(request))
+
+    def test_invalid_cursors(self):
+        def encoded(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+        for token in (
+            "not-a-cursor",
+            encoded({"t": self.created_at.isoformat()}),
+            encoded({"t": self.created_at.isoformat(), "i": "seven", "r": 0}),
+            encoded({"t": "yesterday", "i": 7, "r": 0}),
+        ):
+            with self.subTest(token=token), self.assertRaises(NotFound):
+                self.decode(token)
+
+
+class SearchTests(SimpleTestCase):
+    def test_tokenize_devanagari(self):
+        # vowel signs are combining marks and stay inside their words
+        self.assertEqual(
+            tokenize("किसान, धान-खेती!"),
+            ["किसान", "धान", "खेती"],
+        )
+
+    def test_tokenize_latin(self):
+        self.assertEqual(
+            tokenize("Rice_Farming in 2026: PADDY"),
+            ["rice_farming", "in", "2026", "paddy"],
+        )
+
+    def test_parse_terms_skips_empty_terms(self):
+        self.assertEqual(
+            parse_terms(["rice farming", " , ", "धान"]),
+            [["rice", "farming"], ["धान"]],
+        )
+
+    def index(self):
+        index = InvertedIndex()
+        index.add(1, {"title": "Paddy nursery", "tags": "paddy", "content": ""})
+        index.add(2, {"title": "Maize", "tags": "", "content": "after the paddy"})
+        index.add(
+            3,
+            {
+                "title": "धान की खेती",
+                "tags": "धान",
+                "content": "खेती",
+            },
+        )
+        return index
+
+    def test_title_matches_rank_first(self):
+        ranked = self.index().search(parse_terms(["paddy"]))
+        self.assertEqual([article_id for article_id, _ in ranked], [1, 2])
+
+    def test_words_of_a_term_must_all_match(self):
+        ranked = self.index().search(parse_terms(["paddy nursery"]))
+        self.assertEqual([article_id for article_id, _ in ranked], [1])
+
+    def test_prefix_matches(self):
+        ranked = self.index().search(parse_terms(["padd"]))
+        self.assertEqual({article_id for article_id, _ in ranked}, {1, 2})
+
+    def test_devanagari_matches(self):
+        ranked = self.index().search(parse_terms(["धान"]))
+        self.assertEqual([article_id for article_id, _ in ranked], [3])
+
+    def test_remove(self):
+        index = self.index()
+        index.remove(1)
+        ranked = index.search(parse_terms(["nursery"]))
+        self.assertEqual(ranked, [])
+        self.assertNotIn("nursery", index.postings)
+
+
+class RebuildSearchIndexTests(TestCase):
+    def test_reindexes_every_article_in_batches(self):
+        articles = [
+            Articles.objects.create(title=title, launch_date=timezone.localdate())
+            for title in ("Paddy", "Maize", "Wheat")
+        ]
+        batches = []
+        with mock.patch(
+            "super_krishak.articles.management.commands.rebuild_search_index"
+            ".index_articles",
+            side_effect=lambda batch: batches.append([a.pk for a in batch]),
+        ):
+            call_command("rebuild_search_index", batch_size=2, stdout=StringIO())
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertCountEqual(
+            [pk for batch in batches for pk in batch],
+            [article.pk for article in articles],
+        )
+
+
+STAT_FIELDS = (
+    "total_reacts",
+    "bad_reacts",
+    "good_reacts",
+    "informative_reacts",
+    "total_shares",
+    "fb_shares",
+    "twitter_shares",
+    "reddit_shares",
+)
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"}
+)
+class ArticleStatsTests(TestCase):
+    def setUp(self):
+        self.users = [create_user(index) for index in range(3)]
+        today = timezone.localdate()
+        self.articles = [
+            Articles.objects.create(title=title, launch_date=today)
+            for title in ("Paddy", "Maize")
+        ]
+        article = self.articles[0]
+        for user, reacts in zip(self.users, ("1", "2", "2")):
+            insert_reaction(user.id, article.id, reacts)
+        record_shares_upsert(self.users[0].id, {article.id: ({"fb_counts": 2}, "1")})
+        record_shares_upsert(
+            self.users[1].id, {article.id: ({"twitter_counts": 1}, "2")}
+        )
+
+    def stats(self):
+        return {
+            row.pop("article_id"): row
+            for row in ArticleStats.objects.values("article_id", *STAT_FIELDS)
+        }
+
+    def assertMatchesRebuild(self):
+        maintained = self.stats()
+        rebuild_stats()
+        self.assertEqual(maintained, self.stats())
+
+    def test_new_articles_get_a_stats_row(self):
+        self.assertEqual(
+            self.stats()[self.articles[1].id], dict.fromkeys(STAT_FIELDS, 0)
+        )
+
+    def test_writes_are_counted(self):
+        stats = self.stats()[self.articles[0].id]
+        self.assertEqual(
+            [stats[field] for field in STAT_FIELDS], [3, 1, 2, 0, 3, 2, 1, 0]
+        )
+        self.assertMatchesRebuild()
+
+    def test_released_rows_are_subtracted(self):
+        reactions = Reactions.objects.filter(reacts="2", user=self.users[1])
+        shares = Shares.objects.filter(user=self.users[0])
+        release_rows(reactions=reactions, shares=shares)
+        reactions.delete()
+        shares.delete()
+        self.assertMatchesRebuild()
+
+    def test_deleted_user_takes_their_activity_along(self):
+        self.users[1].delete()
+        stats = self.stats()[self.articles[0].id]
+        self.assertEqual((stats["total_reacts"], stats["total_shares"]), (2, 2))
+        self.assertMatchesRebuild()
+
+    def test_ordering_by_reacts_keeps_articles_without_stats(self):
+        reacted, unreacted = self.articles
+        ArticleStats.objects.filter(article=unreacted).delete()
+
+        self.assertEqual(ordering_for("-total_reacts"), "-stats__total_reacts")
+        rows = with_stats(Articles.objects.all()).order_by(
+            ordering_for("-total_reacts")
+        )
+        # where the missing row sorts depends on the database's NULL order
+        self.assertCountEqual(
+            [(row.id, row.total_reacts) for row in rows],
+            [(reacted.id, 3.0), (unreacted.id, 0.0)],
+        )
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"},
+    ARTICLES_TAG_TRENDING={"WINDOWS": [7]},
+)
+class TagStatsTests(TestCase):
+    def setUp(self):
+        self.user = create_user(1)
+        today = timezone.localdate()
+        self.paddy, self.maize = [
+            Articles.objects.create(title=title, launch_date=today)
+            for title in ("Paddy", "Maize")
+        ]
+        self.paddy.tags.add("kharif", "paddy")
+        self.maize.tags.add("kharif", "maize")
+
+    def counts(self):
+        return dict(
+            TagStats.objects.filter(article_count__gt=0).values_list(
+                "tag__name", "article_count"
+            )
+        )
+
+    def assertMatchesTaggedItems(self):
+        tagged = TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Articles)
+        )
+        expected = dict(
+            tagged.values_list("tag__name").annotate(count=Count("id")).order_by()
+        )
+        self.assertEqual(self.counts(), expected)
+
+    def test_tagging_is_counted(self):
+        self.assertEqual(self.counts(), {"kharif": 2, "paddy": 1, "maize": 1})
+        self.assertEqual([tag.name for tag in top_tags(2)], ["kharif", "maize"])
+
+    def test_only_tags_the_article_had_are_removed(self):
+        self.paddy.tags.remove("maize", "paddy")
+        self.assertEqual(self.counts(), {"kharif": 2, "maize": 1})
+        self.assertMatchesTaggedItems()
+
+    def test_clear_and_delete(self):
+        self.paddy.tags.clear()
+        self.maize.delete()
+        self.assertEqual(self.counts(), {})
+        self.assertMatchesTaggedItems()
+
+    def test_trends_follow_recent_engagement(self):
+        insert_reaction(self.user.id, self.paddy.id, "2")
+        record_shares_upsert(self.user.id, {self.maize.id: ({"fb_counts": 1}, "1")})
+        refresh_trends()
+
+        scores = dict(TagTrend.objects.filter(days=7).values_list("tag__name", "score"))
+        # a share weighs twice a reaction, kharif gets both
+        self.assertEqual(set(scores), {"kharif", "paddy", "maize"})
+        self.assertAlmostEqual(scores["maize"], 2 * scores["paddy"])
+        self.assertAlmostEqual(scores["kharif"], 3 * scores["paddy"])
+        self.assertEqual(
+            [tag.name for tag in trending_tags(3, 7)],
+            ["kharif", "maize", "paddy"],
+        )
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"}
+)
+class ShareUpsertTests(TestCase):
+    def setUp(self):
+        self.user = create_user(1)
+        today = timezone.localdate()
+        self.articles = [
+            Articles.objects.create(title=title, launch_date=today)
+            for title in ("Paddy", "Maize")
+        ]
+
+    def test_repeated_shares_update_one_row(self):
+        article = self.articles[0]
+        record_shares_upsert(self.user.id, {article.id: ({"fb_counts": 1}, "1")})
+        record_shares_upsert(self.user.id, {article.id: ({"fb_counts": 1}, "1")})
+        (share,) = record_shares_upsert(
+            self.user.id, {article.id: ({"twitter_counts": 2}, "2")}
+        )
+
+        self.assertEqual(Shares.objects.filter(article=article).count(), 1)
+        self.assertEqual(
+            (share.fb_counts, share.twitter_counts, share.reddit_counts), (2, 2, 0)
+        )
+        self.assertEqual(share.last_shared_on, "2")
+
+        stats = ArticleStats.objects.get(article=article)
+        self.assertEqual(
+            (stats.total_shares, stats.fb_shares, stats.twitter_shares), (4, 2, 2)
+        )
+        rollups = dict(
+            ShareRollup.objects.filter(article=article).values_list("platform", "count")
+        )
+        self.assertEqual(rollups, {1: 2, 2: 2})
+
+    def test_batch_writes_every_article(self):
+        first, second = self.articles
+        shares = record_shares_upsert(
+            self.user.id,
+            {
+                second.id: ({"reddit_counts": 3}, "3"),
+                first.id: ({"fb_counts": 1}, "1"),
+            },
+        )
+        self.assertEqual(
+            [
+                (share.article_id, share.fb_counts, share.reddit_counts)
+                for share in shares
+            ],
+            [(first.id, 1, 0), (second.id, 0, 3)],
+        )
+
+    def test_empty_batch(self):
+        self.assertEqual(record_shares_upsert(self.user.id, {}), [])
+        self.assertFalse(Shares.objects.exists())
+
+
+class CsvExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(0, is_staff=True)
+        self.readers = [create_user(index) for index in range(1, 4)]
+        today = timezone.localdate()
+        self.article, other = [
+            Articles.objects.create(title=title, launch_date=today)
+            for title in ("Paddy", "Maize")
+        ]
+        for reader, reacts in zip(self.readers, ("1", "2", "3")):
+            insert_reaction(reader.id, self.article.id, reacts)
+            record_shares_upsert(
+                reader.id, {self.article.id: ({"twitter_counts": 1}, "2")}
+            )
+        insert_reaction(self.readers[0].id, other.id, "2")
+
+    def export(self, path):
+        # the whole export is one query, however many rows it streams
+        with self.assertNumQueries(1):
+            response = self.call("get", path, urlconf=ADMIN_URLCONF)
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        return list(csv.reader(content.splitlines()))
+
+    def test_reactions(self):
+        header, *rows = self.export("/reactions/{}/csv/".format(self.article.id))
+        self.assertEqual(header[2], "Reaction")
+        self.assertCountEqual([row[2] for row in rows], ["1", "2", "3"])
+
+    def test_shares(self):
+        header, *rows = self.export("/shares/{}/csv/".format(self.article.id))
+        self.assertEqual(header[2], "Media")
+        self.assertEqual([row[2] for row in rows], ["twitter"] * 3)
+
+
+@override_settings(ARTICLES_COIN_AWARDS={"article": 2})
+class CoinLedgerTests(TestCase):
+    """
+    runs with the project's ``ARTICLES_COIN_BALANCE_FIELD``.
+    """
+
+    def setUp(self):
+        self.user = create_user(1)
+
+    def applied(self):
+        return (
+            UserCoin.objects.filter(user=self.user)
+            .values_list(balance_field(), flat=True)
+            .first()
+            or 0
+        )
+
+    def test_award_records_the_configured_coins(self):
+        award = award_coins(self.user, "article")
+        self.assertEqual((award.coins, award.applied_at), (2, None))
+
+    def test_balance_includes_pending_awards(self):
+        award_coins(self.user, "article")
+        award_coins(self.user, "article")
+        self.assertEqual(coin_balance(self.user), self.applied() + 4)
+
+    def test_applying_is_idempotent(self):
+        before = self.applied()
+        award_coins(self.user, "article")
+        award_coins(self.user, "article")
+
+        self.assertEqual(apply_coin_awards(), 2)
+        self.assertEqual(apply_coin_awards(), 0)
+        self.assertEqual(self.applied(), before + 4)
+        self.assertEqual(coin_balance(self.user), before + 4)
+        self.assertFalse(CoinAward.objects.filter(applied_at__isnull=True).exists())
+
+    def test_unconfigured_awards_fail_loudly(self):
+        with self.assertRaises(ImproperlyConfigured):
+            award_coins(self.user, "comment")
+        with override_settings():
+            del settings.ARTICLES_COIN_AWARDS
+            with self.assertRaises(ImproperlyConfigured):
+                award_coins(self.user, "article")
+        self.assertFalse(CoinAward.objects.exists())
+
+
+@override_settings(
+    ARTICLES_COIN_AWARDS={"article": 2},
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "reaction-tests",
+        }
+    },
+)
+class ReactionWriteTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.user = create_user(1)
+        self.article = Articles.objects.create(
+            title="Paddy", launch_date=timezone.localdate()
+        )
+        self.path = "/reactions/{}/".format(self.article.id)
+
+    def test_duplicate_reaction_is_204_without_coins(self):
+        first = self.call("post", self.path, {"reacts": "2"})
+        self.assertEqual(first.status_code, 201)
+        again = self.call("post", self.path, {"reacts": "3"})
+        self.assertEqual(again.status_code, 204)
+
+        self.assertEqual(
+            list(Reactions.objects.values_list("user_id", "reacts")),
+            [(self.user.id, "2")],
+        )
+        self.assertEqual(CoinAward.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(ArticleStats.objects.get(article=self.article).total_reacts, 1)
+
+    def test_retry_with_the_same_key_replays_the_first_response(self):
+        first = self.call("post", self.path, {"reacts": "2"}, HTTP_IDEMPOTENCY_KEY="a1")
+        retry = self.call("post", self.path, {"reacts": "2"}, HTTP_IDEMPOTENCY_KEY="a1")
+        self.assertEqual(
+            (retry.status_code, retry.data), (first.status_code, first.data)
+        )
+        self.assertEqual(first.status_code, 201)
+
+        other_key = self.call(
+            "post", self.path, {"reacts": "2"}, HTTP_IDEMPOTENCY_KEY="a2"
+        )
+        self.assertEqual(other_key.status_code, 204)
+        self.assertEqual(CoinAward.objects.filter(user=self.user).count(), 1)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "insights-tests",
+        }
+    }
+)
+class ReactionInsightsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.users = [create_user(index) for index in range(3)]
+        self.user = self.users[0]
+        today = timezone.localdate()
+        self.reacted, self.unreacted = [
+            Articles.objects.create(title=title, launch_date=today)
+            for title in ("Paddy", "Maize")
+        ]
+        for user, reacts in zip(self.users[:2], ("1", "2")):
+            insert_reaction(user.id, self.reacted.id, reacts)
+
+    def test_one_query_for_every_uncached_article(self):
+        ids = [self.reacted.id, self.unreacted.id]
+        with self.assertNumQueries(1):
+            insights = reaction_insights(ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(reaction_insights(ids), insights)
+
+        self.assertEqual(
+            insights[self.reacted.id],
+            {
+                "total_reactions": 2,
+                "total_bad_reactions": 50.0,
+                "total_good_reactions": 50.0,
+                "total_informative_reactions": 0.0,
+            },
+        )
+        self.assertEqual(insights[self.unreacted.id]["total_reactions"], 0)
+
+    def test_reaction_refreshes_the_cached_insights(self):
+        reaction_insights([self.reacted.id])
+        overall_insights()
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_reaction(self.users[2].id, self.reacted.id, "3")
+
+        insights = reaction_insights([self.reacted.id])[self.reacted.id]
+        self.assertEqual(
+            (insights["total_reactions"], insights["total_informative_reactions"]),
+            (3, 33.33),
+        )
+        self.assertEqual(overall_insights()["total_reactions"], 3)
+
+    def test_ids_query(self):
+        path = "/reactions/?ids={},{}".format(self.unreacted.id, self.reacted.id)
+        response = self.call("get", path)
+        self.assertEqual(
+            [(row["article"], row["total_reactions"]) for row in response.data],
+            [(self.unreacted.id, 0), (self.reacted.id, 2)],
+        )
+        response = self.call("get", "/reactions/?ids=1,paddy")
+        self.assertEqual(response.status_code, 400)
+
+
+class RecordingSender:
+    """
+    a chunked sender that records the user ids of every push.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.fail_next = False
+
+    def __call__(self, message, extra, user_ids):
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("push failed")
+        self.chunks.append(user_ids)
+
+
+push = RecordingSender()
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={
+        "QUEUE": "super_krishak.articles.fanout.LocalQueue",
+        "SENDER": "super_krishak.articles.tests.push",
+        "CHUNK_SIZE": 2,
+        "RATE": 2,
+    }
+)
+class DigestFanoutTests(TestCase):
+    def setUp(self):
+        self.user_ids = [create_user(index).pk for index in range(5)]
+        article = Articles.objects.create(
+            title="Paddy", launch_date=timezone.localdate()
+        )
+        self.digest = NotificationDigest.objects.create(
+            send_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.digest.articles.add(article)
+        push.chunks.clear()
+        push.fail_next = False
+        _queues.clear()
+        self.queue = get_queue()
+
+    def test_default_sender_sends_chunks_and_resumes(self):
+        config = {
+            "QUEUE": "super_krishak.articles.fanout.LocalQueue",
+            "CHUNK_SIZE": 2,
+            "RATE": 2,
+        }
+        # only the push transport is replaced, the fan-out runs as configured
+        transport = SimpleNamespace(call_local=push)
+        with override_settings(ARTICLES_NOTIFICATIONS=config), mock.patch(
+            "super_krishak.articles.fanout.notify_users", transport
+        ):
+            self.assertEqual(_sender(get_config()), (push_to_users, True))
+
+            self.assertEqual(send_digest(self.digest.pk), 2)
+            push.fail_next = True
+            self.queue.run_due(now=timezone.now() + timedelta(minutes=1))
+            self.digest.refresh_from_db()
+            self.assertEqual(
+                (self.digest.state, self.digest.cursor), (SENDING, self.user_ids[1])
+            )
+
+            later = timezone.now() + timedelta(hours=1)
+            resume_digests(now=later)
+            self.queue.run_due(now=later)
+
+        ids = self.user_ids
+        self.assertEqual(push.chunks, [ids[:2], ids[2:4], ids[4:]])
+        self.digest.refresh_from_db()
+        self.assertEqual((self.digest.state, self.digest.delivered), (SENT, 5))
+
+    def test_paced_chunks_are_scheduled(self):
+        self.assertEqual(send_digest(self.digest.pk), 2)
+        ids = self.user_ids
+        self.assertEqual(push.chunks, [ids[:2]])
+
+        # two users at two per second hold the next chunk back a second
+        self.digest.refresh_from_db()
+        self.assertEqual(
+            self.queue.scheduled(),
+            [(self.digest.updated_at + timedelta(seconds=1), self.digest.pk)],
+        )
+
+        self.queue.run_due(now=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(push.chunks, [ids[:2], ids[2:4], ids[4:]])
+        self.assertEqual(self.queue.scheduled(), [])
+        self.digest.refresh_from_db()
+        self.assertEqual((self.digest.state, self.digest.delivered), (SENT, 5))
+
+    def test_resumes_from_the_saved_cursor(self):
+        send_digest(self.digest.pk)
+        push.fail_next = True
+        self.queue.run_due(now=timezone.now() + timedelta(minutes=1))
+        self.digest.refresh_from_db()
+        self.assertEqual(
+            (self.digest.state, self.digest.cursor, self.digest.delivered),
+            (SENDING, self.user_ids[1], 2),
+        )
+        self.assertEqual(self.queue.scheduled(), [])
+
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(resume_digests(now=later), 1)
+        self.queue.run_due(now=later)
+
+        ids = self.user_ids
+        self.assertEqual(push.chunks, [ids[:2], ids[2:4], ids[4:]])
+        self.digest.refresh_from_db()
+        self.assertEqual((self.digest.state, self.digest.delivered), (SENT, 5))
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"}
+)
+class ArticleListSerializerTests(TestCase):
+    def setUp(self):
+        self.user = create_user(1)
+        reader = create_user(2)
+        today = timezone.localdate()
+        self.articles = [
+            Articles.objects.create(
+                creator=self.user,
+                title=title,
+                content="<p>{} nursery care</p>".format(title),
+                launch_date=today,
+            )
+            for title in ("Paddy", "Maize")
+        ]
+        article = self.articles[0]
+        article.tags.add("paddy", "nursery")
+        article.image_files.add(
+            Gallery.objects.create(picture="Gallery/ab/cd/abcd.jpg", width=4, height=3),
+            Gallery.objects.create(picture="Gallery/ef/01/ef01.png", width=8, height=6),
+        )
+        insert_reaction(self.user.id, article.id, "2")
+        insert_reaction(reader.id, article.id, "3")
+        record_shares_upsert(self.user.id, {article.id: ({"fb_counts": 1}, "1")})
+
+    def fields(self, query):
+        factory = APIRequestFactory()
+        return requested_fields(Request(factory.get("/" + query)))
+
+    def render(self, fields):
+        queryset = narrow_queryset(
+            with_stats(
+                Articles.objects.select_related("creator")
+                .prefetch_related("image_files", "tags")
+                .order_by("-created_at")
+            ),
+            fields,
+        )
+        from_models = ArticleSerializer(
+            list(queryset), many=True, fields=fields, user=self.user
+        ).data
+        from_rows = ArticleListSerializer(
+            article_rows(queryset, fields), fields=fields, user=self.user
+        ).data
+        # tags have no order of their own
+        return [
+            json.loads(json.dumps(data, default=str), object_hook=self.sort_tags)
+            for data in (from_models, from_rows)
+        ]
+
+    @staticmethod
+    def sort_tags(item):
+        if isinstance(item.get("tags"), list):
+            item["tags"] = sorted(item["tags"])
+        return item
+
+    def test_rows_render_like_the_model_serializer(self):
+        for query in ("", "?fields=title,tags,image_files", "?fields=card"):
+            with self.subTest(query=query):
+                from_models, from_rows = self.render(self.fields(query))
+                self.assertEqual(len(from_rows), 2)
+                self.assertEqual(from_rows, from_models)
+
+    def test_card_fields(self):
+        _, (maize, paddy) = self.render(self.fields("?fields=card"))
+        self.assertNotIn("content", paddy)
+        self.assertEqual(paddy["excerpt"], "Paddy nursery care")
+        self.assertEqual(paddy["cover_image"]["width"], 4)
+        self.assertEqual((paddy["total_reacts"], paddy["my_reaction"]), (2.0, 2))
+        self.assertIsNone(maize["cover_image"])
+
+
+class ArticleFieldsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(1)
+        self.article = Articles.objects.create(
+            title="Paddy",
+            content="<p>Transplant   the\n<b>paddy</b></p>",
+            launch_date=timezone.localdate() - timedelta(days=1),
+        )
+
+    def test_excerpt_is_stored_with_the_content(self):
+        self.assertEqual(self.article.excerpt, "Transplant the paddy")
+
+        self.article.content = "<p>{}</p>".format("paddy " * 100)
+        self.article.save(update_fields=["content"])
+        self.article.refresh_from_db()
+        self.assertEqual(len(self.article.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(self.article.excerpt.endswith("…"))
+
+    def test_saving_without_the_content_keeps_the_excerpt(self):
+        article = Articles.objects.only("id", "title").get(pk=self.article.pk)
+        article.title = "Paddy nursery"
+        article.save()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.excerpt, "Transplant the paddy")
+
+    def test_cover_image_is_the_first_image(self):
+        first, second = [Gallery.objects.create(width=w, height=3) for w in (4, 8)]
+        self.article.image_files.add(second, first)
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.cover_image_id, first.id)
+
+        first.delete()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.cover_image_id, second.id)
+
+    def test_sparse_fields(self):
+        response = self.call("get", "/?fields=title,excerpt")
+        self.assertEqual(
+            response.data["results"],
+            [{"title": "Paddy", "excerpt": "Transplant the paddy"}],
+        )
+        response = self.call("get", "/{}/?fields=title".format(self.article.id))
+        self.assertEqual(response.data, {"title": "Paddy"})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.call("get", "/?fields=title,bogus")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("bogus", str(response.data["fields"]))
+
+
+class GalleryDedupTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        patcher = override_settings(MEDIA_ROOT=media_root)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def upload(self, name, color="green"):
+        buffer = BytesIO()
+        Image.new("RGB", (4, 3), color).save(buffer, format="PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_identical_upload_adopts_the_stored_row(self):
+        first = Gallery(picture=self.upload("field.png"))
+        first.save()
+        again = Gallery(picture=self.upload("copy-of-field.png"))
+        again.save()
+
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(again.picture.name, first.picture.name)
+        self.assertEqual((again.width, again.height), (4, 3))
+        self.assertEqual(Gallery.objects.count(), 1)
+
+    def test_other_content_is_stored(self):
+        first = Gallery(picture=self.upload("field.png"))
+        first.save()
+        other = Gallery(picture=self.upload("field.png", color="brown"))
+        other.save()
+
+        self.assertNotEqual(other.pk, first.pk)
+        self.assertNotEqual(other.content_hash, first.content_hash)
+        self.assertEqual(Gallery.objects.count(), 2)
+
+
+@override_settings(
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"}
+)
+class DeferredSideEffectsTests(TestCase):
+    def create(self, title):
+        return Articles.objects.create(title=title, launch_date=timezone.localdate())
+
+    def test_side_effects_run_once_the_block_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_side_effects():
+                articles = [self.create(title) for title in ("Paddy", "Maize")]
+                self.assertFalse(ArticleStats.objects.exists())
+                self.assertFalse(NotificationDigest.objects.exists())
+
+        ids = {article.id for article in articles}
+        self.assertEqual(
+            set(ArticleStats.objects.values_list("article_id", flat=True)), ids
+        )
+        (digest,) = NotificationDigest.objects.all()
+        self.assertEqual(set(digest.articles.values_list("id", flat=True)), ids)
+
+    def test_rolled_back_block_dispatches_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with deferred_side_effects():
+                    self.create("Paddy")
+                    raise RuntimeError("rolled back")
+
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Articles.objects.exists())
+        self.assertFalse(ArticleStats.objects.exists())
+
+    def test_articles_rolled_back_inside_the_block_are_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_side_effects():
+                kept = self.create("Paddy")
+                try:
+                    with transaction.atomic():
+                        self.create("Maize")
+                        raise RuntimeError("rolled back")
+                except RuntimeError:
+                    pass
+
+        self.assertEqual(
+            list(ArticleStats.objects.values_list("article_id", flat=True)),
+            [kept.id],
+        )
+
+
+class QueryCollectorTests(SimpleTestCase):
+    def run_statements(self, collector, statements):
+        for sql, params in statements:
+            collector(lambda *args: None, sql, params, False, {})
+
+    def test_statements_repeated_up_to_the_threshold(self):
+        collector = QueryCollector()
+        tags = 'SELECT "name" FROM "tag" WHERE "article_id" = %s'
+        self.run_statements(
+            collector,
+            [(tags, (article_id,)) for article_id in range(5)]
+            + [('SELECT "id" FROM "articles"', ())] * 2,
+        )
+
+        self.assertEqual(collector.queries, 7)
+        self.assertEqual(collector.find_repeated(5), {tags: 5})
+        self.assertEqual(collector.find_repeated(6), {})
+
+    def test_same_parameters_count_as_repeats(self):
+        collector = QueryCollector()
+        sql = 'SELECT "id" FROM "articles" WHERE "id" = %s'
+        self.run_statements(collector, [(sql, (1,))] * 3)
+        self.assertEqual(collector.find_repeated(3), {sql: 3})
+
+
+@override_settings(ARTICLES_PROFILING={"ENABLED": True})
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.served = []
+        self.middleware = ProfilingMiddleware(self.serve)
+
+    def serve(self, request):
+        self.served.append(request)
+        return HttpResponse("ok")
+
+    def request(self, user, path="/api/v1/articles/?_profile=1"):
+        request = RequestFactory().get(path)
+        request.user = user
+        return request
+
+    def assertServedUnprofiled(self, request):
+        with mock.patch("super_krishak.articles.profiling.cProfile") as profiler:
+            response = self.middleware(request)
+        profiler.Profile.assert_not_called()
+        self.assertEqual(self.served, [request])
+        self.assertNotIn(RESPONSE_HEADER, response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_non_staff_users_are_not_profiled(self):
+        self.assertServedUnprofiled(self.request(create_user(1)))
+
+    def test_unflagged_requests_are_not_profiled(self):
+        staff = create_user(1, is_staff=True)
+        self.assertServedUnprofiled(self.request(staff, "/api/v1/articles/"))
+
+    def test_disabled_profiling(self):
+        staff = create_user(1, is_staff=True)
+        with override_settings(ARTICLES_PROFILING={"ENABLED": False}):
+            self.assertServedUnprofiled(self.request(staff))
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "dashboard-tests",
+        }
+    },
+    ARTICLES_NOTIFICATIONS={"QUEUE": "super_krishak.articles.fanout.LocalQueue"},
+    ARTICLES_DASHBOARD={"MAX_AGE": 60},
+)
+class DashboardTotalsTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.now = 1000000.0
+        clock = SimpleNamespace(time=lambda: self.now)
+        patcher = mock.patch("super_krishak.articles.dashboard.time", clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.create("Paddy")
+
+    def create(self, title):
+        return Articles.objects.create(title=title, launch_date=timezone.localdate())
+
+    def test_totals_are_cached_until_max_age(self):
+        self.assertEqual(dashboard_totals()["articles"], 1)
+        self.create("Maize")
+        self.now += 30
+        self.assertEqual(dashboard_totals()["articles"], 1)
+
+        self.now += 31
+        totals = dashboard_totals()
+        self.assertEqual(totals["articles"], 2)
+        self.assertEqual(totals["computed_at"].timestamp(), self.now)
+
+    def test_stale_totals_are_served_while_another_request_refreshes(self):
+        dashboard_totals()
+        self.create("Maize")
+        self.now += 61
+        caches["default"].add(LOCK_KEY, 1, 30)
+        self.assertEqual(dashboard_totals()["articles"], 1)
+
+    def test_refresh_task_replaces_the_totals(self):
+        dashboard_totals()
+        self.create("Maize")
+        refresh_totals()
+        self.assertEqual(dashboard_totals()["articles"], 2)
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(1)
+        self.reader = create_user(2)
+        self.article = Articles.objects.create(
+            title="Paddy", launch_date=timezone.localdate() - timedelta(days=1)
+        )
+        self.detail = "/{}/".format(self.article.id)
+
+    def etag(self, path):
+        response = self.call("get", path)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def assertStale(self, path, etag):
+        response = self.call("get", path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_matching_etag_gets_304(self):
+        for path in (self.detail, "/"):
+            etag = self.etag(path)
+            response = self.call("get", path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_reaction_invalidates(self):
+        etags = {path: self.etag(path) for path in (self.detail, "/")}
+        insert_reaction(self.reader.id, self.article.id, "3")
+        for path, etag in etags.items():
+            self.assertStale(path, etag)
+
+    def test_tag_invalidates(self):
+        etags = {path: self.etag(path) for path in (self.detail, "/")}
+        self.article.tags.add("paddy")
+        for path, etag in etags.items():
+            self.assertStale(path, etag)
+
+    def test_image_invalidates(self):
+        etags = {path: self.etag(path) for path in (self.detail, "/")}
+        self.article.image_files.add(Gallery.objects.create(width=4, height=3))
+        for path, etag in etags.items():
+            self.assertStale(path, etag)
+
+    def test_etag_is_per_user(self):
+        etag = self.etag(self.detail)
+        response = self.call(
+            "get", self.detail, user=self.reader, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class UserEngagementTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(1)
+        self.reader = create_user(2)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.reacted, self.shared = [
+            Articles.objects.create(title=title, launch_date=yesterday)
+            for title in ("Paddy", "Maize")
+        ]
+        insert_reaction(self.user.id, self.reacted.id, "2")
+        insert_reaction(self.reader.id, self.shared.id, "3")
+        record_shares_upsert(self.user.id, {self.shared.id: ({"fb_counts": 2}, "1")})
+
+    def test_one_query_per_table(self):
+        ids = [self.reacted.id, self.shared.id]
+        with self.assertNumQueries(2):
+            engagement = user_engagement(self.user.id, ids)
+
+        self.assertEqual(
+            engagement[self.reacted.id], {"my_reaction": 2, "my_shares": None}
+        )
+        mine = engagement[self.shared.id]
+        self.assertIsNone(mine["my_reaction"])
+        self.assertEqual(
+            (mine["my_shares"]["fb_counts"], mine["my_shares"]["last_shared_on"]),
+            (2, 1),
+        )
+
+    def test_anonymous_reads_nothing(self):
+        with self.assertNumQueries(0):
+            engagement = user_engagement(None, [self.reacted.id])
+        self.assertEqual(
+            engagement, {self.reacted.id: {"my_reaction": None, "my_shares": None}}
+        )
+
+    def test_feed_shows_the_requesting_users_engagement(self):
+        path = "/?fields=title,my_reaction,my_shares"
+        for user, expected in (
+            (self.user, {"Paddy": (2, False), "Maize": (None, True)}),
+            (self.reader, {"Paddy": (None, False), "Maize": (3, False)}),
+        ):
+            with self.subTest(user=user.pk):
+                rows = self.call("get", path, user=user).data["results"]
+                self.assertEqual(
+                    {
+                        row["title"]: (row["my_reaction"], row["my_shares"] is not None)
+                        for row in rows
+                    },
+                    expected,
+                )
+                detail = self.call(
+                    "get", "/{}/?fields=my_reaction".format(self.shared.id), user=user
+                ).data
+                self.assertEqual(detail["my_reaction"], expected["Maize"][0])
+
+
+@tag("benchmark")
+class EndpointBenchmarkTests(TestCase):
+    """
+    the CI gate for the endpoint benchmarks: no scenario may run more
+    queries or allocate more memory than the stored baseline. A missing
+    baseline skips the test, unless ``REQUIRE_BASELINE`` is set as in the CI
+    job. Timings depend on the machine and are only compared by
+    ``benchmark_endpoints``.
+    """
+
+    def test_no_regressions(self):
+        baseline = load_baseline()
+        if baseline is None:
+            message = (
+                "No benchmark baseline at {}, store one with "
+                "benchmark_endpoints --save-baseline.".format(BASELINE_PATH)
+            )
+            if REQUIRE_BASELINE:
+                self.fail(message)
+            self.skipTest(message)
+        with benchmark_settings():
+            results = run_benchmarks(seed_data(), repeat=3)
+        self.assertEqual(compare(results, baseline, time_tolerance=None), [])
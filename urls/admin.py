@@ -15,6 +15,13 @@ urlpatterns = [
     ),
     path("shares/<int:pk>/", admin.SharesView.as_view({"get": "list"})),
     path("shares/<int:pk>/csv/", admin.SharesView.as_view({"get": "get_csv"})),
+    path("metrics/", admin.MetricsView.as_view()),
+    path("profiles/", admin.ProfilesView.as_view({"get": "list"})),
+    path("profiles/<int:pk>/", admin.ProfilesView.as_view({"get": "retrieve"})),
+    path(
+        "profiles/<int:pk>/download/",
+        admin.ProfilesView.as_view({"get": "download"}),
+    ),
 ]
 
 
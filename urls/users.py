@@ -12,6 +12,8 @@ urlpatterns = [
     path("reactions/", users.ReactionsView.as_view()),
     path("reactions/<int:pk>/", users.ReactionsView.as_view()),
     path("shares/", users.SharesView.as_view()),
+    path("shares/batch/", users.SharesBatchView.as_view()),
     path("shares/<int:pk>/", users.SharesView.as_view()),
     path("tags/", users.TagsView.as_view()),
+    path("coins/", users.CoinsView.as_view()),
 ]
@@ -1,44 +1,85 @@
 import csv
+from itertools import chain
 
-from django.db.models import Case, Count, F, FloatField, Q, Sum, Value
-from django.db.models.expressions import When
-from django.db.models.functions import Coalesce
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from super_krishak.articles.api.v1.serializers.admin import (
+    ArticleListSerializer,
     ArticleSerializer,
     ReactionDetailSerializer,
+    RequestProfileDetailSerializer,
+    RequestProfileSerializer,
     ShareDetailSerializer,
+    article_rows,
+    narrow_queryset,
+    requested_fields,
 )
-from super_krishak.articles.models import Articles, Gallery, Reactions, Shares
+from super_krishak.articles.dashboard import dashboard_totals
+from super_krishak.articles.images import (
+    attach_images,
+    release_images,
+    validate_uploads,
+)
+from super_krishak.articles.instrumentation import CONTENT_TYPE, metrics, serialized
+from super_krishak.articles.models import (
+    SHARED,
+    Articles,
+    Reactions,
+    RequestProfile,
+    Shares,
+)
+from super_krishak.articles.pagination import get_paginator
+from super_krishak.articles.side_effects import deferred_side_effects
+
+# check and dummy_divisor live in stats now, still importable from here
+from super_krishak.articles.stats import (  # noqa: F401
+    check,
+    dummy_divisor,
+    ordering_for,
+    with_stats,
+)
+from super_krishak.articles.tasks import process_gallery_images
 from super_krishak.core.pagination import DynamicPageSizePagination
 
+CSV_CHUNK_SIZE = 2000
 
-def permission_denied():
-    message = "This Article belongs to another creator."
-    raise PermissionDenied(message)
+CSV_USER_FIELDS = ["user__name", "user__address", "user__email", "user__mobile"]
 
+SHARED_MEDIA = {str(value): name for value, name in SHARED}
 
-dummy_divisor = 0.0
 
+class Echo:
+    """
+    An object that implements just the write method of the file-like
+    interface, so csv.writer hands back each row instead of buffering it.
+    """
 
-def check(result, divisor):
+    def write(self, value):
+        return value
 
-    return Case(
-        When(
-            **{
-                divisor: 0.0,
-                "then": Value(dummy_divisor, FloatField()),
-            }
-        ),
-        default=result,
-        output_field=FloatField(),
-    )
+
+def stream_csv(filename, header, rows):
+    """
+    streams the rows as a csv attachment, one row in memory at a time.
+    """
+    writer = csv.writer(Echo())
+    content = chain([writer.writerow(header)], (writer.writerow(row) for row in rows))
+    response = StreamingHttpResponse(content, content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+
+def permission_denied():
+    message = "This Article belongs to another creator."
+    raise PermissionDenied(message)
 
 
 class ArticlesView(viewsets.ModelViewSet):
@@ -52,118 +93,75 @@ class ArticlesView(viewsets.ModelViewSet):
         if images_list:
             request.data.pop("image_files")
             serializer = self.serializer_class(data=request.data)
+            errors = validate_uploads(images_list)
+            if errors:
+                return Response(
+                    {"image_files": errors}, status=status.HTTP_400_BAD_REQUEST
+                )
             if serializer.is_valid():
-                serializer.save(creator=user)
-                id = serializer.data["id"]
-                article_obj = get_object_or_404(Articles, id=id)
-
-                for image in images_list:
-                    image_content = Gallery.objects.create(picture=image)
-                    article_obj.image_files.add(image_content)
-
-                data = {
-                    "id": article_obj.id,
-                    "user": request.user,
-                    "title": article_obj.title,
-                    "tags": article_obj.tags,
-                    "image_files": article_obj.image_files,
-                    "video_content": article_obj.video_content,
-                    "post_views": article_obj.post_views,
-                    "launch_date": article_obj.launch_date,
-                }
-                serializer = self.serializer_class(data)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                with deferred_side_effects():
+                    article_obj = serializer.save(creator=user)
+                    _, created = attach_images(article_obj, images_list)
+                    gallery_ids = [gallery.id for gallery in created]
+                    transaction.on_commit(lambda: process_gallery_images(gallery_ids))
+
+                serializer = self.serializer_class(article_obj)
+                return Response(
+                    serialized(request, serializer), status=status.HTTP_200_OK
+                )
         else:
             data = request.data
             serializer = self.serializer_class(data=data)
             if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                with deferred_side_effects():
+                    serializer.save()
+                return Response(
+                    serialized(request, serializer), status=status.HTTP_200_OK
+                )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get_queryset(self):
-        qs = (
-            Articles.objects.select_related("creator")
-            .prefetch_related(
+        qs = with_stats(
+            Articles.objects.select_related("creator").prefetch_related(
                 "image_files",
                 "tags",
             )
-            .annotate(
-                total_shares=Sum(
-                    F("article_shares__fb_counts")
-                    + F("article_shares__twitter_counts")
-                    + F("article_shares__reddit_counts"),
-                    output_field=FloatField(),
-                ),
-                total_reacts=Count("article_reacts") / 1.0,
-                bad_reacts=Coalesce(
-                    check(
-                        100.0
-                        * Count("article_reacts", filter=Q(article_reacts__reacts=1))
-                        / Count("article_reacts")
-                        / 1.0,
-                        "total_reacts",
-                    ),
-                    0.0,
-                    output_field=FloatField(),
-                ),
-                good_reacts=Coalesce(
-                    check(
-                        100.0
-                        * Count("article_reacts", filter=Q(article_reacts__reacts=2))
-                        / Count("article_reacts")
-                        / 1.0,
-                        "total_reacts",
-                    ),
-                    0.0,
-                    output_field=FloatField(),
-                ),
-                informative_reacts=Coalesce(
-                    check(
-                        100.0
-                        * Count("article_reacts", filter=Q(article_reacts__reacts=3))
-                        / Count("article_reacts")
-                        / 1.0,
-                        "total_reacts",
-                    ),
-                    0.0,
-                    output_field=FloatField(),
-                ),
-            )
         )
 
         query = self.request.GET.get("ordering", None)
 
         if query:
-            if query == "reacts_count":
-                query = "total_reacts"
-            elif query and query == "-reacts_count":
-                query = "-total_reacts"
-            qs = qs.order_by(query)
+            qs = qs.order_by(ordering_for(query))
         return qs
 
     def list(self, request, *args, **kwargs):
         id = kwargs.get("pk")
 
+        fields = requested_fields(request)
         if id is not None:
-            article = self.get_queryset().get(id=id)
-            serializer = self.serializer_class(article)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            article = narrow_queryset(self.get_queryset(), fields).get(id=id)
+            serializer = self.serializer_class(article, fields=fields)
+            return Response(serialized(request, serializer), status=status.HTTP_200_OK)
 
         else:
+            totals = dashboard_totals()
             additional_field = {
-                "total_post_views": Articles.objects.aggregate(
-                    total_views=Sum("post_views")
-                ),
-                "total_unique_views": Articles.objects.aggregate(
-                    unique_visits=Count("unique_visitors")
-                ),
+                "total_post_views": {"total_views": totals["post_views"]},
+                "total_unique_views": {"unique_visits": totals["unique_visits"]},
+                "total_unique_visitors": {
+                    "unique_visitors": totals["unique_visitors"],
+                },
+                "totals": totals,
             }
 
             paginator = DynamicPageSizePagination()
-            result_page = paginator.paginate_queryset(self.get_queryset(), request)
-            serializer = self.serializer_class(result_page, many=True)
-            return paginator.get_paginated_response([additional_field, serializer.data])
+            result_page = paginator.paginate_queryset(
+                article_rows(self.get_queryset(), fields), request
+            )
+            serializer = ArticleListSerializer(result_page, fields=fields)
+            return paginator.get_paginated_response(
+                [additional_field, serialized(request, serializer)]
+            )
 
     def is_creator(self, article_id):
         """
@@ -188,7 +186,7 @@ class ArticlesView(viewsets.ModelViewSet):
         article = get_object_or_404(Articles, id=id)
 
         if self.is_creator(id):
-            article.image_files.all().delete()
+            release_images(article)
             article.delete()
 
             return Response(
@@ -245,19 +243,34 @@ class ReactionsDetailView(viewsets.ModelViewSet):
         id = self.kwargs.get("pk")
         queryset = self.get_queryset().filter(article=id)
 
-        paginator = DynamicPageSizePagination()
+        # keyset pages follow created_at, so they only apply without ?ordering=
+        paginator = get_paginator(request, keyset="ordering" not in request.GET)
         result_page = paginator.paginate_queryset(queryset, request)
         serializer = ReactionDetailSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serialized(request, serializer))
 
     def get_csv(self, request, pk=None):
 
-        article_id = pk
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = 'attachment; filename="reactions.csv"'
-        writer = csv.writer(response)
-        queryset = self.get_queryset().filter(article=article_id)
-        writer.writerow(
+        queryset = (
+            self.get_queryset()
+            .filter(article=pk)
+            .select_related("user")
+            .only(*CSV_USER_FIELDS, "reacts", "created_at")
+            .iterator(chunk_size=CSV_CHUNK_SIZE)
+        )
+        rows = (
+            [
+                q.user.name,
+                q.user.address,
+                q.reacts,
+                q.user.email,
+                q.user.mobile,
+                q.created_at,
+            ]
+            for q in queryset
+        )
+        return stream_csv(
+            "reactions.csv",
             [
                 "Name",
                 "Address",
@@ -265,22 +278,10 @@ class ReactionsDetailView(viewsets.ModelViewSet):
                 "Email",
                 "Contact No.",
                 "Reacted Date & Time",
-            ]
+            ],
+            rows,
         )
 
-        for q in queryset:
-            writer.writerow(
-                [
-                    q.user.name,
-                    q.user.address,
-                    q.reacts,
-                    q.user.email,
-                    q.user.mobile,
-                    q.created_at,
-                ]
-            )
-        return response
-
 
 class SharesView(viewsets.ModelViewSet):
     queryset = Shares.objects.all()
@@ -327,38 +328,78 @@ class SharesView(viewsets.ModelViewSet):
         id = self.kwargs.get("pk")
         queryset = self.get_queryset().filter(article=id)
 
-        paginator = DynamicPageSizePagination()
+        # keyset pages follow created_at, so they only apply without ?ordering=
+        paginator = get_paginator(request, keyset="ordering" not in request.GET)
         result_page = paginator.paginate_queryset(queryset, request)
         serializer = ShareDetailSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serialized(request, serializer))
 
     def get_csv(self, request, pk=None):
 
-        article_id = pk
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = 'attachment; filename="shares.csv"'
-        writer = csv.writer(response)
-        queryset = self.get_queryset().filter(article=article_id)
-        writer.writerow(
-            ["Name", "Address", "Media", "Email", "Contact No.", "Reacted Date & Time"]
+        queryset = (
+            self.get_queryset()
+            .filter(article=pk)
+            .select_related("user")
+            .only(*CSV_USER_FIELDS, "last_shared_on", "created_at")
+            .iterator(chunk_size=CSV_CHUNK_SIZE)
+        )
+        rows = (
+            [
+                q.user.name,
+                q.user.address,
+                SHARED_MEDIA.get(str(q.last_shared_on), "reddit"),
+                q.user.email,
+                q.user.mobile,
+                q.created_at,
+            ]
+            for q in queryset
+        )
+        return stream_csv(
+            "shares.csv",
+            ["Name", "Address", "Media", "Email", "Contact No.", "Reacted Date & Time"],
+            rows,
         )
 
-        for q in queryset:
-            if q.last_shared_on == 1:
-                media = "facebook"
-            elif q.last_shared_on == 2:
-                media = "twitter"
-            else:
-                media = "reddit"
-
-            writer.writerow(
-                [
-                    q.user.name,
-                    q.user.address,
-                    media,
-                    q.user.email,
-                    q.user.mobile,
-                    q.created_at,
-                ]
-            )
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """
+        per-route request metrics of this worker in the Prometheus text
+        format, recorded when ``ARTICLES_INSTRUMENTATION["ENABLED"]`` is set.
+        """
+        return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)
+
+
+class ProfilesView(viewsets.ReadOnlyModelViewSet):
+    queryset = RequestProfile.objects.defer("call_tree", "queries", "stats")
+    serializer_class = RequestProfileSerializer
+    permission_classes = [IsAdminUser]
+
+    def list(self, request, *args, **kwargs):
+        paginator = get_paginator(request)
+        result_page = paginator.paginate_queryset(self.get_queryset(), request)
+        serializer = RequestProfileSerializer(result_page, many=True)
+        return paginator.get_paginated_response(serialized(request, serializer))
+
+    def retrieve(self, request, pk=None):
+        """
+        the call tree and the captured SQL with the query plans.
+        """
+        profile = get_object_or_404(RequestProfile.objects.defer("stats"), pk=pk)
+        serializer = RequestProfileDetailSerializer(profile)
+        return Response(serialized(request, serializer), status=status.HTTP_200_OK)
+
+    def download(self, request, pk=None):
+        """
+        the raw cProfile data, for pstats, snakeviz and the like.
+        """
+        profile = get_object_or_404(RequestProfile.objects.only("id", "stats"), pk=pk)
+        response = HttpResponse(
+            bytes(profile.stats), content_type="application/octet-stream"
+        )
+        response["Content-Disposition"] = (
+            'attachment; filename="profile-{}.prof"'.format(profile.id)
+        )
         return response
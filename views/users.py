@@ -1,9 +1,8 @@
-import datetime
-
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import status
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAuthenticated
@@ -12,14 +11,46 @@ from rest_framework.views import APIView
 from taggit.models import Tag
 
 from super_krishak.articles.api.v1.serializers.admin import (
+    STATS_FIELDS,
+    ArticleListSerializer,
     ArticleSerializer,
-    ReactionSerializer,
     ShareSerializer,
     TagsSerializer,
+    article_rows,
+    narrow_queryset,
+    requested_fields,
+)
+from super_krishak.articles.coins import award_coins, coin_balance
+from super_krishak.articles.conditional import (
+    add_validators,
+    article_validators,
+    not_modified,
+    page_validators,
+)
+from super_krishak.articles.counters import view_counter
+from super_krishak.articles.engagement import (
+    insert_reaction,
+    record_shares_upsert,
+    share_field,
+    shared_on,
+)
+from super_krishak.articles.idempotency import remember_response, replayed_response
+from super_krishak.articles.insights import overall_insights, reaction_insights
+from super_krishak.articles.instrumentation import serialized
+from super_krishak.articles.models import REACTIONS, Articles
+from super_krishak.articles.pagination import get_paginator
+from super_krishak.articles.search import search_articles
+from super_krishak.articles.share_analytics import (
+    INTERVALS,
+    share_series,
+    share_totals,
 )
-from super_krishak.articles.models import Articles, Reactions, Shares
-from super_krishak.core.pagination import DynamicPageSizePagination
-from super_krishak.users.models import UserCoin
+from super_krishak.articles.stats import with_stats
+from super_krishak.articles.tag_stats import get_config as get_trending_config
+from super_krishak.articles.tag_stats import top_tags, trending_tags
+from super_krishak.articles.visitors import visitor_tracker
+
+REACTION_VALUES = {str(value) for value, _ in REACTIONS}
 
 
 class ArticlesView(ListAPIView):
@@ -37,44 +68,65 @@ class ArticlesView(ListAPIView):
         )
 
         if search is not None:
-            search_query = search.split(",")
-
-            q = Q()
-            for query in search_query:
-                q |= Q(tags__name__icontains=query) | Q(title__icontains=query)
-
-            qs = qs.filter(q).distinct()
+            qs = search_articles(qs, search.split(","))
 
         return qs
 
     def get(self, request, *args, **kwargs):
         id = self.kwargs.get("pk")
         tag = self.kwargs.get("slug")
-        qs = self.get_queryset()
+        fields = requested_fields(request)
+        qs = narrow_queryset(self.get_queryset(), fields)
+        if fields is not None and fields & set(STATS_FIELDS):
+            # only asked for explicitly, e.g. by ?fields=card; the full feed
+            # has never carried the stats
+            qs = with_stats(qs)
 
         if id is not None:
-            article = get_object_or_404(qs, id=id)
+            validators = article_validators(self.get_queryset(), id, request)
+            if validators is None:
+                raise Http404
 
             """""
-                increment of post views after a user views an article
+                buffered increment of post views after a user views an article,
+                counted before the conditional check so 304s are views too.
+                The response shows the persisted views plus the pending ones
             """
-            article.post_views = article.post_views + 1
-            article.save(update_fields=("post_views",))
+            view_counter.increment(id)
+            visitor_tracker.record(id, self.request.user.id)
 
-            Articles.unique_visitors.through.objects.get_or_create(
-                articles=article, user=self.request.user
-            )
+            response = not_modified(request, *validators)
+            if response is not None:
+                return response
+
+            article = get_object_or_404(qs, id=id)
+            article.post_views = view_counter.live_total(article)
 
-            serializer = ArticleSerializer(article)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            serializer = ArticleSerializer(article, fields=fields, user=request.user)
+            response = Response(
+                serialized(request, serializer), status=status.HTTP_200_OK
+            )
+            return add_validators(response, *validators)
 
         else:
             if tag is not None:
                 qs = qs.filter(tags__name=tag)
-            paginator = DynamicPageSizePagination()
-            result_page = paginator.paginate_queryset(qs, request)
-            serializer = ArticleSerializer(result_page, many=True)
-            return paginator.get_paginated_response(serializer.data)
+
+            # keyset pages would reorder ranked search results by created_at
+            paginator = get_paginator(
+                request, keyset="search" not in request.query_params
+            )
+            result_page = paginator.paginate_queryset(article_rows(qs, fields), request)
+            validators = page_validators(result_page, request, paginator)
+            response = not_modified(request, *validators)
+            if response is not None:
+                return response
+
+            serializer = ArticleListSerializer(
+                result_page, fields=fields, user=request.user
+            )
+            response = paginator.get_paginated_response(serialized(request, serializer))
+            return add_validators(response, *validators)
 
 
 class TagsView(ListAPIView):
@@ -84,83 +136,108 @@ class TagsView(ListAPIView):
     pagination_class = None
 
     def get(self, request, *args, **kwargs):
+        """
+        most used tags, or with ?sort=trending the tags with the most
+        engagement over the last ?days= days. ?limit= defaults to 3.
+        """
+
+        params = request.query_params
+        try:
+            limit = max(1, min(int(params.get("limit", 3)), 50))
+            days = int(params.get("days", get_trending_config()["DEFAULT_WINDOW"]))
+        except ValueError:
+            return Response(
+                {"message": "limit and days must be integers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if params.get("sort") == "trending":
+            windows = get_trending_config()["WINDOWS"]
+            if days not in windows:
+                return Response(
+                    {"message": "days must be one of {}.".format(windows)},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            common_tags = trending_tags(limit, days)
+        else:
+            common_tags = top_tags(limit)
 
-        common_tags = Articles.tags.most_common()[:3]
         serializer = TagsSerializer(common_tags, many=True)
-        return Response(serializer.data, status=200)
+        return Response(serialized(request, serializer), status=200)
 
 
 class ReactionsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
+        """
+        reacts to an article once, a repeated reaction returns 204. Retries sent
+        with the same Idempotency-Key header get the first response back.
+        """
+        replay = replayed_response(request)
+        if replay is not None:
+            return replay
+
         user = self.request.user
-        article_id = self.kwargs.get("pk")
-        reaction = request.data.get("reacts")
+        article_id = self.kwargs.get("pk", request.data.get("article"))
+        reaction = str(request.data.get("reacts", ""))
 
-        try:
-            previous_reaction = Reactions.objects.get(user=user, article=article_id)
-        except ObjectDoesNotExist:
-            previous_reaction = None
+        if reaction not in REACTION_VALUES or not str(article_id).isdigit():
+            return Response(
+                {"reacts": ['"{}" is not a valid choice.'.format(reaction)]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        if previous_reaction is not None:
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            with transaction.atomic():
+                created = insert_reaction(user.id, int(article_id), reaction)
+                if created:
+                    award_coins(user=user, coins_for="article")
+        except IntegrityError:
+            return Response(
+                {"message": "Article does not exist."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        else:
-            data = {"user": user, "article": article_id, "reacts": reaction}
-            serializer = ReactionSerializer(data=data)
+        if not created:
+            return remember_response(
+                request, Response(status=status.HTTP_204_NO_CONTENT)
+            )
 
-            if serializer.is_valid():
-                serializer.save(user=user)
-                UserCoin.add_coins(user=user, coins_for="article")
-                return Response(
-                    {
-                        "message": "You have reacted to the article.",
-                    },
-                    status=status.HTTP_201_CREATED,
-                )
-            return Response(serializer.errors)
+        return remember_response(
+            request,
+            Response(
+                {
+                    "message": "You have reacted to the article.",
+                    "coins": coin_balance(user),
+                },
+                status=status.HTTP_201_CREATED,
+            ),
+        )
 
     def get(self, request, pk=None):
         """
-        endpoint for insights on admin side and counts on detail page on user side
+        endpoint for insights on admin side and counts on detail page on user side,
+        ?ids=1,2,3 returns the insights of several articles at once
         """
 
-        id = pk
-        if id is not None:
-            queryset = Reactions.objects.filter(article=id)
-        else:
-            queryset = Reactions.objects.all()
-
-        queryset_count = queryset.count()
-
-        if queryset_count == 0:
+        ids = request.query_params.get("ids", None)
+        if ids is not None:
+            try:
+                article_ids = [int(id) for id in ids.split(",") if id.strip()]
+            except ValueError:
+                return Response(
+                    {"message": "ids must be a comma separated list of integers."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            insights = reaction_insights(article_ids)
+            data = [{"article": id, **insights[id]} for id in article_ids]
 
-            data = {
-                "total_reactions": 0,
-                "total_bad_reactions": 0,
-                "total_good_reactions": 0,
-                "total_informative_reactions": 0,
-            }
+        elif pk is not None:
+            data = reaction_insights([pk])[pk]
 
         else:
-
-            informative_reactions = queryset.filter(reacts=3).count()
-            good_reactions = queryset.filter(reacts=2).count()
-            bad_reactions = queryset.filter(reacts=1).count()
-
-            data = {
-                "total_reactions": queryset_count,
-                "total_bad_reactions": float(
-                    "{:.2f}".format(100 * bad_reactions / queryset_count)
-                ),
-                "total_good_reactions": float(
-                    "{:.2f}".format(100 * good_reactions / queryset_count)
-                ),
-                "total_informative_reactions": float(
-                    "{:.2f}".format(100 * informative_reactions / queryset_count)
-                ),
-            }
+            data = overall_insights()
 
         return Response(data, status=status.HTTP_200_OK)
 
@@ -170,127 +247,77 @@ class SharesView(APIView):
 
     def post(self, request, *args, **kwargs):
         user = self.request.user
-        article_id = self.kwargs.get("pk")
-        fb_counts = request.data.get("fb_counts", None)
-        twitter_counts = request.data.get("twitter_counts", None)
-        reddit_counts = request.data.get("reddit_counts", None)
-        last_shared_on = request.data.get("last_shared_on")
-
-        try:
-            previous_share = Shares.objects.get(user=user, article=article_id)
-        except ObjectDoesNotExist:
-            previous_share = None
-
-        if previous_share is not None:
-            if fb_counts is not None:
-
-                queryset = get_object_or_404(Shares, id=previous_share.id)
-
-                """""
-                    increment of facebook shares after a user shares an article on facebook
-                """
-                queryset.last_shared_on = last_shared_on
-                queryset.updated_at = datetime.datetime.now()
-                queryset.fb_counts = queryset.fb_counts + 1
-                queryset.save(
-                    update_fields=(
-                        "fb_counts",
-                        "last_shared_on",
-                    )
-                )
+        article_id = self.kwargs.get("pk", request.data.get("article"))
+        field = share_field(request.data)
 
-                serializer = ShareSerializer(queryset)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-
-            elif twitter_counts is not None:
-
-                queryset = get_object_or_404(Shares, id=previous_share.id)
-
-                """""
-                    increment of shares after a user shares an article on twitter
-                """
-                queryset.last_shared_on = last_shared_on
-                queryset.updated_at = datetime.datetime.now()
-                queryset.twitter_counts = queryset.twitter_counts + 1
-                queryset.save(
-                    update_fields=(
-                        "twitter_counts",
-                        "last_shared_on",
-                    )
-                )
-
-                serializer = ShareSerializer(queryset)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-
-            elif reddit_counts is not None:
-
-                queryset = get_object_or_404(Shares, id=previous_share.id)
+        if field is None or not str(article_id).isdigit():
+            return Response(
+                {"message": "Specify the article and the platform it was shared on."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-                """""
-                    increment of shares after a user shares an article on reddit
-                """
-                queryset.last_shared_on = last_shared_on
-                queryset.updated_at = datetime.datetime.now()
-                queryset.reddit_counts = queryset.reddit_counts + 1
-                queryset.save(
-                    update_fields=(
-                        "reddit_counts",
-                        "last_shared_on",
-                    )
-                )
+        last_shared_on = shared_on(request.data, field)
+        if last_shared_on is None:
+            return Response(
+                {
+                    "last_shared_on": [
+                        '"{}" is not a valid choice.'.format(
+                            request.data.get("last_shared_on")
+                        )
+                    ]
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-                serializer = ShareSerializer(queryset)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+        """""
+            increment of the platform's shares in a single upsert, creating the
+            user's share record on their first share of the article
+        """
+        try:
+            (share,) = record_shares_upsert(
+                user.id, {int(article_id): ({field: 1}, last_shared_on)}
+            )
+        except IntegrityError:
+            return Response(
+                {"message": "Article does not exist."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        else:
-            if fb_counts is not None:
-                data = {
-                    "user": user,
-                    "article": article_id,
-                    "fb_counts": fb_counts,
-                    "last_shared_on": last_shared_on,
-                }
-
-            elif twitter_counts is not None:
-                data = {
-                    "user": user,
-                    "article": article_id,
-                    "twitter_counts": twitter_counts,
-                    "last_shared_on": last_shared_on,
-                }
-
-            elif reddit_counts is not None:
-                data = {
-                    "user": user,
-                    "article": article_id,
-                    "reddit_counts": reddit_counts,
-                    "last_shared_on": last_shared_on,
-                }
-
-            else:
-                data = request.data
-
-            serializer = ShareSerializer(data=data)
-
-            if serializer.is_valid():
-                serializer.save(user=user)
-                return Response(serializer.data, status=200)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ShareSerializer(share)
+        return Response(serialized(request, serializer), status=status.HTTP_200_OK)
 
     def get(self, request, pk=None):
         """
-        endpoint for insights on admin side and counts on detail page on user side
+        endpoint for insights on admin side and counts on detail page on user side,
+        limited to ?from=YYYY-MM-DD and ?to=YYYY-MM-DD when given. ?interval=day or
+        ?interval=week adds the time series of the range.
         """
 
-        id = pk
-        if id is not None:
-            queryset = Shares.objects.filter(article=id)
-        else:
-            queryset = Shares.objects.all()
+        params = request.query_params
+        interval = params.get("interval", None)
+        dates = {}
+        for key in ("from", "to"):
+            try:
+                dates[key] = parse_date(params.get(key, ""))
+            except ValueError:
+                dates[key] = None
+        start, end = dates["from"], dates["to"]
+
+        if any(
+            key in params and dates[key] is None for key in dates
+        ) or interval not in (None, *INTERVALS):
+            return Response(
+                {"message": "Invalid date range or interval."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        queryset_counts = queryset.count()
+        totals = share_totals(pk, start, end)
+        f_counts = totals["facebook"]
+        t_counts = totals["twitter"]
+        r_counts = totals["reddit"]
+        total_shares = f_counts + t_counts + r_counts
 
-        if queryset_counts == 0:
+        if total_shares == 0:
 
             data = {
                 "total_shares": 0,
@@ -300,20 +327,6 @@ class SharesView(APIView):
             }
 
         else:
-            dummy1 = 0
-            dummy2 = 0
-            dummy3 = 0
-
-            for q in queryset:
-                dummy1 = q.fb_counts + dummy1
-                f_counts = dummy1
-                dummy2 = q.twitter_counts + dummy2
-                t_counts = dummy2
-                dummy3 = q.reddit_counts + dummy3
-                r_counts = dummy3
-
-            total_shares = f_counts + t_counts + r_counts
-
             data = {
                 "total_shares": total_shares,
                 "total_facebook_shares": float(
@@ -323,7 +336,95 @@ class SharesView(APIView):
                     "{:.2f}".format(t_counts * 100 / total_shares)
                 ),
                 "total_reddit_shares": float(
-                    "{:.f}".format(r_counts * 100 / total_shares)
+                    "{:.2f}".format(r_counts * 100 / total_shares)
                 ),
             }
+
+        if interval is not None:
+            data["series"] = share_series(pk, start, end, interval)
         return Response(data, status=status.HTTP_200_OK)
+
+
+class SharesBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 100
+
+    def post(self, request, *args, **kwargs):
+        """
+        records shares queued offline by the app in one request, the body is
+        {"shares": [{"article": 1, "fb_counts": 1, "last_shared_on": 1}, ...]}
+        """
+
+        replay = replayed_response(request)
+        if replay is not None:
+            return replay
+
+        user = self.request.user
+        shares = request.data.get("shares", None)
+
+        if not isinstance(shares, list) or not 0 < len(shares) <= self.max_batch_size:
+            return Response(
+                {
+                    "message": "shares must be a list of 1 to {} entries.".format(
+                        self.max_batch_size
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        entries = {}
+        for share in shares:
+            field = share_field(share) if isinstance(share, dict) else None
+            try:
+                article_id = int(share.get("article")) if field else None
+            except (TypeError, ValueError):
+                article_id = None
+            if article_id is None:
+                return Response(
+                    {"message": "Every share needs an article and a platform."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            last_shared_on = shared_on(share, field)
+            if last_shared_on is None:
+                return Response(
+                    {
+                        "last_shared_on": [
+                            '"{}" is not a valid choice.'.format(
+                                share.get("last_shared_on")
+                            )
+                        ]
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            counts, _ = entries.get(article_id, ({}, None))
+            counts[field] = counts.get(field, 0) + 1
+            entries[article_id] = (counts, last_shared_on)
+
+        known = set(
+            Articles.objects.filter(id__in=entries).values_list("id", flat=True)
+        )
+        if known != set(entries):
+            return Response(
+                {
+                    "message": "Article does not exist.",
+                    "articles": sorted(set(entries) - known),
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = ShareSerializer(record_shares_upsert(user.id, entries), many=True)
+        return remember_response(
+            request,
+            Response(serialized(request, serializer), status=status.HTTP_200_OK),
+        )
+
+
+class CoinsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """
+        the user's coins, including the awards still waiting to be applied.
+        """
+        return Response({"coins": coin_balance(request.user)}, status=200)
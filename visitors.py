@@ -0,0 +1,189 @@
+"""
+Unique visitor tracking backed by ``VisitorSketch`` rows.
+
+Visits are buffered as ``"<article id>:<user id>"`` keys in a counter
+backend (see ``super_krishak.articles.counters``) and merged into the
+article and global sketches on flush, so a detail read costs no query at
+all. The request that crosses ``FLUSH_THRESHOLD`` flushes, and so does the
+``flush_visitors`` huey task every minute, which is why the default backend
+is the shared ``CacheCounterBackend``. Sketches merge, so it doesn't matter
+which process drains which visits.
+
+Configured through ``settings.ARTICLES_VISITOR_SKETCH``::
+
+    ARTICLES_VISITOR_SKETCH = {
+        "BACKEND": "super_krishak.articles.counters.CacheCounterBackend",
+        "OPTIONS": {"alias": "default"},
+        "PRECISION": 12,
+        "EXACT_LIMIT": 256,
+        "FLUSH_THRESHOLD": 500,
+    }
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from super_krishak.articles.counters import BufferedFlusher
+from super_krishak.articles.models import Articles, VisitorSketch
+from super_krishak.articles.sketches import (
+    DEFAULT_EXACT_LIMIT,
+    DEFAULT_PRECISION,
+    VisitorSet,
+)
+
+
+def _visitor_id(value):
+    # keys are strings, the sketches were built from integer user ids
+    return int(value) if value.isdigit() else value
+
+
+class VisitorTracker(BufferedFlusher):
+
+    settings_name = "ARTICLES_VISITOR_SKETCH"
+    backend_prefix = "articles:visitors"
+    defaults = {
+        **BufferedFlusher.defaults,
+        "PRECISION": DEFAULT_PRECISION,
+        "EXACT_LIMIT": DEFAULT_EXACT_LIMIT,
+        "FLUSH_THRESHOLD": 500,
+    }
+
+    def visitor_set(self, sketch):
+        config = self.config
+        return VisitorSet(
+            registers=bytes(sketch.registers or b""),
+            members=sketch.members,
+            precision=config["PRECISION"],
+            exact_limit=config["EXACT_LIMIT"],
+        )
+
+    def record(self, article_id, user_id):
+        if user_id is None:
+            return
+        self._maybe_flush(self.backend.incr("{}:{}".format(article_id, user_id)))
+
+    def flush(self):
+        """
+        merges buffered visits into the sketches, returns the number of
+        sketches that changed.
+        """
+        counts = self.backend.drain()
+        if not counts:
+            return 0
+
+        pending = defaultdict(set)
+        for key in counts:
+            article_id, user_id = key.split(":", 1)
+            pending[int(article_id)].add(_visitor_id(user_id))
+        try:
+            with transaction.atomic():
+                changed = merge_visitors(pending, self.visitor_set)
+        except Exception:
+            self.backend.restore(counts)
+            raise
+        return changed
+
+    def unique_visitors(self, article_id):
+        """
+        unique visitor count of an article as of the last flush.
+        """
+        return (
+            VisitorSketch.objects.filter(scope=VisitorSketch.scope_for(article_id))
+            .values_list("unique_count", flat=True)
+            .first()
+            or 0
+        )
+
+    def unique_visits(self):
+        """
+        sum of the articles' unique visitor counts as of the last flush, a
+        visitor of two articles counting twice.
+        """
+        return (
+            VisitorSketch.objects.exclude(scope=VisitorSketch.GLOBAL).aggregate(
+                visits=Sum("unique_count")
+            )["visits"]
+            or 0
+        )
+
+    def global_unique_visitors(self):
+        """
+        unique visitor count across every article as of the last flush.
+        """
+        return (
+            VisitorSketch.objects.filter(scope=VisitorSketch.GLOBAL)
+            .values_list("unique_count", flat=True)
+            .first()
+            or 0
+        )
+
+
+def merge_visitors(pending, visitor_set):
+    """
+    merges ``{article_id: user ids}`` into the article and global sketches,
+    locking the rows in scope order. Visits of articles deleted since they
+    were buffered are dropped. Must run inside a transaction.
+    """
+    live = set(Articles.objects.filter(id__in=pending).values_list("id", flat=True))
+    pending = {
+        article_id: visitors
+        for article_id, visitors in pending.items()
+        if article_id in live
+    }
+    scopes = {VisitorSketch.scope_for(article_id): article_id for article_id in pending}
+    scopes[VisitorSketch.GLOBAL] = None
+
+    existing = {
+        sketch.scope: sketch
+        for sketch in VisitorSketch.objects.select_for_update()
+        .filter(scope__in=scopes)
+        .order_by("scope")
+    }
+    missing = [
+        VisitorSketch(scope=scope, article_id=article_id)
+        for scope, article_id in scopes.items()
+        if scope not in existing
+    ]
+    if missing:
+        VisitorSketch.objects.bulk_create(missing, ignore_conflicts=True)
+        for sketch in (
+            VisitorSketch.objects.select_for_update()
+            .filter(scope__in=[sketch.scope for sketch in missing])
+            .order_by("scope")
+        ):
+            existing[sketch.scope] = sketch
+
+    everyone = set()
+    changed = []
+    for scope, article_id in scopes.items():
+        if article_id is None:
+            continue
+        visitors = pending[article_id]
+        everyone.update(visitors)
+        sketch = existing[scope]
+        state = visitor_set(sketch)
+        if state.update(visitors):
+            changed.append((sketch, state))
+
+    sketch = existing[VisitorSketch.GLOBAL]
+    state = visitor_set(sketch)
+    if state.update(everyone):
+        changed.append((sketch, state))
+
+    now = timezone.now()
+    for sketch, state in changed:
+        sketch.updated_at = now
+        sketch.registers = state.registers
+        sketch.members = state.member_list
+        sketch.unique_count = state.count()
+    VisitorSketch.objects.bulk_update(
+        [sketch for sketch, _ in changed],
+        ["registers", "members", "unique_count", "updated_at"],
+    )
+    return len(changed)
+
+
+visitor_tracker = VisitorTracker()